@@ -0,0 +1,180 @@
+"""Нагрузочный тест конвейера датчиков без BLE и Kivy
+
+Несколько SensorChannel получают синтетические кадры прошивки на одном
+asyncio-цикле (как в потоке BLE), а поток-потребитель раз в кадр интерфейса
+забирает отсчеты в WorkoutSession (как WorkoutScreen.collect_sensor_data).
+
+С --transport simulated/replay кадры идут через имитацию датчика (simulator.py)
+со всем путем приложения: подключение, команды, сшивка по seq, догон после
+потерь в эфире (--dropout) и обрывов связи (--link-loss).
+
+    python benchmark.py --sensors 4 --rate 2000 --duration 10
+    python benchmark.py --transport simulated --rate 10000 --dropout 0.01 --link-loss 5
+    python benchmark.py --transport replay --replay workout_database.json
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import numpy as np
+
+import sensor
+from sensor import BLESensorManager, WorkoutSession, FRAME_HEADER, FRAME_VERSION
+
+FRAME_SAMPLES = 116  # Полный кадр при MTU 247
+UI_FRAME_TIME = 1.0 / 60
+UI_BUDGET_MS = 16.0
+CONNECT_WAIT = 10.0  # Подключение к имитации, сек
+SETTLE_TIME = 1.0  # Хвост кадров после CMD_STOP, сек
+
+
+def make_frame(seq, timestamp_us, period_us, samples):
+    header = FRAME_HEADER.pack(FRAME_VERSION, 0, seq, timestamp_us & 0xFFFFFFFF, period_us)
+    return header + samples.astype('<u2').tobytes()
+
+
+async def produce(channels, rate, duration):
+    """Отдает каналам кадры в темпе прошивки: FRAME_SAMPLES отсчетов на кадр"""
+    period_us = int(1e6 / rate)
+    rng = np.random.default_rng(0)
+    seq = 0
+    start = time.monotonic()
+    while time.monotonic() - start < duration:
+        timestamp_us = int((time.monotonic() - start) * 1e6)
+        for channel in channels:
+            samples = rng.integers(1, 1024, FRAME_SAMPLES, dtype=np.uint16)
+            channel._process_sensor_data(make_frame(seq, timestamp_us, period_us, samples))
+        seq += FRAME_SAMPLES
+        await asyncio.sleep(max(0.0, start + seq / rate - time.monotonic()))
+    return seq
+
+
+def run_simulated(manager, duration):
+    """Замер через имитацию датчиков, возвращает число оцифрованных отсчетов"""
+    manager.start_ble_loop()
+    deadline = time.monotonic() + CONNECT_WAIT
+    while not all(channel.is_streaming for channel in manager.channels) and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # Обрыв до первого кадра потеряет начало замера: seq прошивки непрерывен,
+    # и хосту, еще не видевшему кадров, нечего запросить в CMD_RESUME
+    link_loss = [channel.connector.sensor.link_loss for channel in manager.channels]
+    for channel in manager.channels:
+        channel.connector.sensor.link_loss = 0.0
+    manager.start_reading()
+    deadline = time.monotonic() + CONNECT_WAIT
+    while any(channel.raw.expected_seq is None for channel in manager.channels) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    for channel, interval in zip(manager.channels, link_loss):
+        channel.connector.sensor.link_loss = interval
+    time.sleep(duration)
+    # Обрывы - только во время замера: переподключение после CMD_STOP снова
+    # запустило бы оцифровку (is_reading еще True) и сбило счет отсчетов
+    for channel in manager.channels:
+        channel.connector.sensor.link_loss = 0.0
+    deadline = time.monotonic() + CONNECT_WAIT
+    while not all(channel.is_streaming for channel in manager.channels) and time.monotonic() < deadline:
+        time.sleep(0.05)  # CMD_STOP не дойдет до платы, которая еще переподключается
+    # CMD_STOP без сброса is_reading: кадры в пути еще попадают в буфер
+    for channel in manager.channels:
+        asyncio.run_coroutine_threadsafe(channel._set_acquisition(False), manager.loop).result()
+    time.sleep(SETTLE_TIME)
+    manager.is_reading = False
+    return sum(channel.connector.sensor.generated for channel in manager.channels)
+
+
+def consume(manager, session, stop_event, drain_times):
+    """Забирает отсчеты всех каналов раз в кадр интерфейса"""
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        for channel in manager.channels:
+            values, timestamps = channel.samples.drain()
+            if len(values):
+                session.extend(channel.index, timestamps, values, channel.calibrate_values(values))
+        drain_times.append((time.perf_counter() - started) * 1000)
+        time.sleep(UI_FRAME_TIME)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест приема данных датчиков')
+    parser.add_argument('--sensors', type=int, default=4, help='число датчиков')
+    parser.add_argument('--rate', type=float, default=2000.0, help='частота отсчетов датчика, Гц')
+    parser.add_argument('--duration', type=float, default=10.0, help='длительность, сек')
+    parser.add_argument('--transport', choices=['frames', 'simulated', 'replay'], default='frames',
+                        help='frames - кадры прямо в каналы, simulated/replay - через имитацию датчика')
+    parser.add_argument('--replay', default=sensor.REPLAY_FILE, help='запись для --transport replay')
+    parser.add_argument('--dropout', type=float, default=0.0, help='доля уведомлений, потерянных в эфире')
+    parser.add_argument('--link-loss', type=float, default=0.0, help='средний интервал обрывов связи, сек')
+    args = parser.parse_args()
+
+    simulated = args.transport != 'frames'
+    if simulated:
+        sensor.TRANSPORT = args.transport
+        sensor.REPLAY_FILE = args.replay
+        sensor.SAMPLE_RATE = int(args.rate)
+        sensor.STREAM_MODE = 'raw'
+        sensor.SIMULATED_DROPOUT = args.dropout
+        sensor.SIMULATED_LINK_LOSS = args.link_loss
+
+    manager = BLESensorManager([f'SIM:{index:02d}' for index in range(args.sensors)])
+    manager.is_reading = not simulated
+    session = WorkoutSession(len(manager.channels))
+
+    stop_event = threading.Event()
+    drain_times = []
+    consumer = threading.Thread(target=consume, args=(manager, session, stop_event, drain_times), daemon=True)
+
+    print(f"🚀 {args.sensors} датчик(ов) x {args.rate:.0f} Гц, {args.duration:.0f} с ({args.transport})")
+    consumer.start()
+    started = time.monotonic()
+    if simulated:
+        expected = run_simulated(manager, args.duration)
+    else:
+        expected = asyncio.run(produce(manager.channels, args.rate, args.duration)) * args.sensors
+    elapsed = time.monotonic() - started
+    stop_event.set()
+    consumer.join()
+
+    # Остаток после остановки потребителя
+    for channel in manager.channels:
+        values, timestamps = channel.samples.drain()
+        session.extend(channel.index, timestamps, values, channel.calibrate_values(values))
+
+    received = len(session)
+    lost = sum(channel.lost_samples for channel in manager.channels)  # Не догнаны после обрыва
+    overruns = sum(channel.samples.overruns for channel in manager.channels)
+    drain = np.array(drain_times) if drain_times else np.zeros(1)
+
+    # Сохранение тренировки: столбцы каналов в JSON, как WorkoutScreen.channel_entry
+    started = time.perf_counter()
+    channels = []
+    for channel in manager.channels:
+        timestamps, tension, _ = session.channel_data(channel.index)
+        channels.append({'timestamps': np.round(timestamps, 6).tolist(), 'tension': tension.tolist()})
+    json.dumps(channels)
+    save_time = (time.perf_counter() - started) * 1000
+
+    print(f"📊 Отсчетов: {received}/{expected} ({received / elapsed:.0f} в сек)")
+    print(f"📊 Переполнения буфера: {overruns}")
+    if simulated:
+        sensors = [channel.connector.sensor for channel in manager.channels]
+        print(f"📡 Потеряно в эфире уведомлений: {sum(s.dropped for s in sensors)}, "
+              f"обрывов связи: {sum(s.link_losses for s in sensors)}, не догнано отсчетов: {lost}")
+    print(f"⏱️ Разбор за кадр интерфейса: p50 {np.percentile(drain, 50):.3f} мс, "
+          f"p99 {np.percentile(drain, 99):.3f} мс, макс {drain.max():.3f} мс (бюджет {UI_BUDGET_MS:.0f} мс)")
+    print(f"💾 JSON тренировки: {save_time:.0f} мс")
+
+    if received + lost != expected or overruns:
+        print("❌ Потеряны отсчеты")
+    elif lost:
+        print("⚠️ Часть отсчетов не догнана после обрывов - буфер платы переполнился")
+    elif np.percentile(drain, 99) > UI_BUDGET_MS:
+        print("⚠️ Разбор не укладывается в кадр интерфейса")
+    else:
+        print("✅ Без потерь, в пределах бюджета кадра")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""Сквозной замер BLE: задержка, уведомления и отсчеты в секунду, потери
+
+Замер идет через BLESensorManager, как в приложении: подключение, сшивка
+кадров по seq, буфер отсчетов, который раз в кадр интерфейса забирает поток
+экрана. Задержка радио - время эха через ECHO_CHARACTERISTIC_UUID, задержка
+до экрана - возраст отсчетов в момент, когда экран их забрал.
+
+Без --address датчик имитируется (simulator.py) и перебираются частота, MTU
+и интервал соединения. С настоящим датчиком MTU и интервал выбирает стек BLE
+(из bleak и aioble их не задать) - они выводятся как есть, интервал оценивается
+по пачкам уведомлений. --bek - поток прошивки Bek (Bek/bek.py).
+
+    python ble_benchmark.py --rates 1000 2000 --mtus 23 247 --intervals 7.5 30
+    python ble_benchmark.py --address B0:B2:1C:A7:E2:9A --frame-sizes 16 0
+    python ble_benchmark.py --check      # код выхода 1 при потерях в симуляции
+    python ble_benchmark.py --bek B0:B2:1C:A7:E2:9A
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import sensor
+from sensor import BLESensorManager, ECHO_CHARACTERISTIC_UUID
+from simulator import SimulatedConnector, SimulatedSensor, FRAME_TIMEOUT
+
+UI_FRAME_TIME = 1.0 / 60
+CONNECT_WAIT = 30.0  # Подключение и подписка, сек
+SETTLE_TIME = FRAME_TIMEOUT + 0.5  # Хвост кадров после CMD_STOP, сек
+ECHO_INTERVAL = 0.05  # Эхо 20 раз в секунду
+ECHO_TOKEN = struct.Struct('<Q')
+BURST_GAP = 0.003  # Уведомления ближе этого - одно событие соединения, сек
+CHECK_HEADROOM = 1.25  # --check: пропускная способность с запасом к частоте
+CHECK_DELIVERED = 0.99
+CHECK_ECHO_INTERVALS = 3  # --check: эхо p99 не дольше стольких интервалов (+ планировщик)
+CHECK_ECHO_SLACK = 0.02
+
+
+def percentiles(values, points=(50, 90, 99)):
+    if not len(values):
+        return [float('nan')] * len(points)
+    return [float(np.percentile(values, point)) * 1000 for point in points]
+
+
+def estimate_interval(arrivals):
+    """Интервал соединения по паузам между пачками уведомлений
+
+    Паузы кратны интервалу: берем короткую (5-й процентиль, без дрожания) и уточняем медианой пауз, деленных
+    на свою кратность. Если уведомления приходят не в каждом событии (редкие
+    полные кадры), оценка кратна интервалу - точна при непрерывном потоке.
+    """
+    gaps = np.diff(np.sort(arrivals))
+    gaps = gaps[gaps > BURST_GAP]
+    if not len(gaps):
+        return float('nan')
+    multiples = np.maximum(1, np.round(gaps / np.percentile(gaps, 5)))
+    return float(np.median(gaps / multiples))
+
+
+class EchoProbe:
+    """Время от записи в характеристику эха до ее уведомления"""
+
+    def __init__(self, client):
+        self.client = client
+        self.sent = {}
+        self.rtts = []
+        self.arrivals = []
+        self.tokens = itertools.count()
+
+    def on_echo(self, sender, data):
+        self.arrivals.append(time.perf_counter())
+        if len(data) < ECHO_TOKEN.size:
+            return
+        started = self.sent.pop(ECHO_TOKEN.unpack_from(data)[0], None)
+        if started is not None:
+            self.rtts.append(time.perf_counter() - started)
+
+    async def run(self, duration):
+        if self.client.services.get_characteristic(ECHO_CHARACTERISTIC_UUID) is None:
+            print("⚠️ Прошивка без характеристики эха - задержка радио не измеряется")
+            return
+        await self.client.start_notify(ECHO_CHARACTERISTIC_UUID, self.on_echo)
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            token = next(self.tokens)
+            self.sent[token] = time.perf_counter()
+            await self.client.write_gatt_char(ECHO_CHARACTERISTIC_UUID, ECHO_TOKEN.pack(token), response=False)
+            await asyncio.sleep(ECHO_INTERVAL)
+        await asyncio.sleep(SETTLE_TIME)
+        await self.client.stop_notify(ECHO_CHARACTERISTIC_UUID)
+
+
+def run_config(address, rate, frame_size, duration, simulated=None):
+    """Один прогон: подключение, замер duration секунд, отключение"""
+    sensor.STREAM_MODE = 'raw'
+    sensor.SAMPLE_RATE = rate
+    sensor.FRAME_SIZE = frame_size
+
+    manager = BLESensorManager([address])
+    channel = manager.primary
+    if simulated is not None:
+        channel.connector = SimulatedConnector(address, simulated)
+
+    arrivals = []
+    on_notification = channel._on_notification
+
+    def counting(sender, data):
+        arrivals.append(time.perf_counter())
+        on_notification(sender, data)
+
+    channel._on_notification = counting
+    manager.start_ble_loop()
+
+    def call(coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, manager.loop).result()
+
+    deadline = time.monotonic() + CONNECT_WAIT
+    while not channel.is_streaming and time.monotonic() < deadline:
+        time.sleep(0.1)
+    if not channel.is_streaming:
+        print(f"❌ {address}: нет потока уведомлений за {CONNECT_WAIT:.0f} с")
+        manager.disconnect_sensor()
+        return None
+
+    probe = EchoProbe(channel.client)
+    manager.is_reading = True
+    call(channel._set_acquisition(True))
+    started = time.monotonic()
+    first = len(arrivals)
+    echo = asyncio.run_coroutine_threadsafe(probe.run(duration), manager.loop)
+
+    received = 0
+    ages = []
+
+    def drain():
+        values, timestamps = channel.samples.drain()
+        if len(values):
+            ages.append(time.monotonic() - timestamps)
+        return len(values)
+
+    while time.monotonic() - started < duration:
+        received += drain()
+        time.sleep(UI_FRAME_TIME)
+    call(channel._set_acquisition(False))
+    elapsed = time.monotonic() - started
+    window = arrivals[first:]
+
+    # Кадры, отправленные до CMD_STOP, еще в пути - забираем их
+    settle_end = time.monotonic() + SETTLE_TIME
+    while time.monotonic() < settle_end:
+        received += drain()
+        time.sleep(UI_FRAME_TIME)
+    echo.result()
+    manager.is_reading = False
+
+    expected = simulated.generated if simulated is not None else int(rate * elapsed)
+    result = {
+        'rate': rate,
+        'frame': frame_size,
+        'mtu': getattr(channel.client, 'mtu_size', 0),
+        'interval': estimate_interval(np.array(window + probe.arrivals)),
+        'notifications': len(window) / elapsed,
+        'samples': received / elapsed,
+        'delivered': received / expected if expected else 0.0,
+        'lost': channel.lost_samples,
+        'echo': percentiles(probe.rtts),
+        'echo_lost': len(probe.sent),
+        'screen': percentiles(np.concatenate(ages) if ages else []),
+    }
+
+    manager.disconnect_sensor()
+    time.sleep(0.2)
+    manager.loop.call_soon_threadsafe(manager.loop.stop)
+    return result
+
+
+def print_table(results):
+    print("  Гц кадр  MTU  интервал, мс  уведомл/с  отсч/с  доставлено  потеряно  "
+          "эхо p50/p90/p99, мс   экран p50/p99, мс")
+    for result in results:
+        echo = '/'.join(f"{value:.0f}" for value in result['echo'])
+        screen = '/'.join(f"{value:.0f}" for value in result['screen'][::2])
+        print(f"{result['rate']:>5} {result['frame'] or 'MTU':>4} {result['mtu']:>4} "
+              f"{result['interval'] * 1000:>13.1f} {result['notifications']:>10.0f} {result['samples']:>7.0f} "
+              f"{result['delivered']:>10.1%} {result['lost']:>9} {echo:>18} {screen:>18}")
+
+
+def check(result, simulated):
+    """Потери или долгое эхо там, где радио хватает пропускной способности"""
+    throughput = simulated.notifications_per_event * simulated.capacity / simulated.conn_interval
+    if throughput < CHECK_HEADROOM * result['rate']:
+        return True
+    echo_limit = (CHECK_ECHO_INTERVALS * simulated.conn_interval + CHECK_ECHO_SLACK) * 1000
+    return (result['lost'] == 0 and result['delivered'] >= CHECK_DELIVERED
+            and not result['echo_lost'] and result['echo'][2] <= echo_limit)
+
+
+def run_bek(address, duration):
+    """Уведомления в секунду прошивки Bek (текстовые значения, без кадров и эха)"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Bek'))
+    from bek import EMGReceiver
+
+    class NotificationCounter(EMGReceiver):
+        def __init__(self):
+            super().__init__()
+            self.arrivals = []
+            self.bytes = 0
+
+        def notification_handler(self, sender, data):
+            self.arrivals.append(time.perf_counter())
+            self.bytes += len(data)
+
+    receiver = NotificationCounter()
+
+    async def measure():
+        task = asyncio.ensure_future(receiver.connect_with_retry(address, max_attempts=1))
+        while not receiver.arrivals and not task.done():
+            await asyncio.sleep(0.1)
+        await asyncio.sleep(duration)
+        task.cancel()
+        if receiver.client and receiver.client.is_connected:
+            await receiver.client.disconnect()
+
+    asyncio.run(measure())
+    if len(receiver.arrivals) < 2:
+        print("❌ Bek: уведомлений нет")
+        return
+    elapsed = receiver.arrivals[-1] - receiver.arrivals[0]
+    print(f"📊 Bek: {len(receiver.arrivals) / elapsed:.0f} уведомл/с, {receiver.bytes / elapsed:.0f} байт/с, "
+          f"интервал ~{estimate_interval(np.array(receiver.arrivals)) * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сквозной замер задержки и пропускной способности BLE')
+    parser.add_argument('--address', help='MAC настоящего датчика (без него - имитация)')
+    parser.add_argument('--rates', type=int, nargs='+', default=[500, 1000, 2000], help='частоты оцифровки, Гц')
+    parser.add_argument('--frame-sizes', type=int, nargs='+', default=[0], help='отсчетов в кадре, 0 - по MTU')
+    parser.add_argument('--mtus', type=int, nargs='+', default=[23, 185, 247], help='MTU имитации')
+    parser.add_argument('--intervals', type=float, nargs='+', default=[7.5, 15.0, 30.0],
+                        help='интервалы соединения имитации, мс')
+    parser.add_argument('--per-event', type=int, default=6, help='уведомлений за событие соединения в имитации')
+    parser.add_argument('--duration', type=float, default=3.0, help='длительность прогона, сек')
+    parser.add_argument('--check', action='store_true', help='код выхода 1 при потерях в имитации')
+    parser.add_argument('--bek', metavar='ADDRESS', help='замер прошивки Bek вместо датчика')
+    args = parser.parse_args()
+
+    if args.bek:
+        run_bek(args.bek, args.duration)
+        return
+
+    results = []
+    failed = []
+    if args.address:
+        print(f"🎯 Датчик {args.address}: {len(args.rates) * len(args.frame_sizes)} прогон(ов) по {args.duration:.0f} с")
+        for rate, frame_size in itertools.product(args.rates, args.frame_sizes):
+            result = run_config(args.address, rate, frame_size, args.duration)
+            if result:
+                results.append(result)
+    else:
+        configs = list(itertools.product(args.intervals, args.mtus, args.rates, args.frame_sizes))
+        print(f"🧪 Имитация: {len(configs)} прогон(ов) по {args.duration:.0f} с")
+        for interval, mtu, rate, frame_size in configs:
+            simulated = SimulatedSensor(mtu=mtu, conn_interval=interval / 1000,
+                                        notifications_per_event=args.per_event)
+            result = run_config(f'SIM:{mtu}:{interval}', rate, frame_size, args.duration, simulated)
+            if result is None:
+                failed.append((interval, mtu, rate, frame_size))
+                continue
+            results.append(result)
+            if not check(result, simulated):
+                failed.append((interval, mtu, rate, frame_size))
+
+    print_table(results)
+    if args.address:
+        return
+    if failed:
+        print("❌ Потери или долгое эхо при достаточной пропускной способности:")
+        for interval, mtu, rate, frame_size in failed:
+            print(f"   интервал {interval} мс, MTU {mtu}, {rate} Гц, кадр {frame_size or 'MTU'}")
+        if args.check:
+            sys.exit(1)
+    else:
+        print("✅ Где радио хватает пропускной способности - без потерь")
+
+
+if __name__ == '__main__':
+    main()
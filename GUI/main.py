@@ -14,9 +14,10 @@ from kivy.utils import get_color_from_hex
 import json
 import os
 from datetime import datetime
-import asyncio
-import threading
-from bleak import BleakScanner, BleakClient
+import time
+import math
+import numpy as np
+from sensor import BLESensorManager, WorkoutSession, SENSOR_ADDRESSES, CHARACTERISTIC_UUID, CALIBRATION_PHASE_TIME
 
 # Improved color scheme with better contrast
 COLORS = {
@@ -35,252 +36,8 @@ COLORS = {
     'button_start': get_color_from_hex('#F18F01'),
 }
 
-# BLE Configuration
-TARGET_MAC_ADDRESS = "B0:B2:1C:A7:E2:9A"
-CHARACTERISTIC_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
-
-class BLESensorManager:
-    def __init__(self):
-        self.client = None
-        self.is_connected = False
-        self.is_connecting = False
-        self.current_value = 0
-        self.loop = None
-        self.thread = None
-        self.is_reading = False
-        
-        # Добавлено для калибровки
-        self.baseline = 0
-        self.max_value = 0
-        self.is_calibrated = False
-        self.is_calibrating = False
-        self.calibration_phase = None  # 'relax' или 'tension'
-        self.calibration_data_relax = []
-        self.calibration_data_tension = []
-        self.calibration_callback = None
-        self.calibration_phase_callback = None
-        
-    def start_ble_loop(self):
-        """НОВЫЙ МЕТОД: Start BLE in a separate thread"""
-        if self.loop is None:
-            self.loop = asyncio.new_event_loop()
-            self.thread = threading.Thread(target=self._run_ble_loop, daemon=True)
-            self.thread.start()
-            
-            # Start automatic connection
-            asyncio.run_coroutine_threadsafe(self._auto_connect(), self.loop)
-    
-    def _run_ble_loop(self):
-        """Run the asyncio event loop"""
-        asyncio.set_event_loop(self.loop)
-        try:
-            self.loop.run_forever()
-        except Exception as e:
-            print(f"❌ Ошибка в BLE loop: {e}")
-    
-    async def _auto_connect(self):
-        """ПЕРЕПИСАН: прямое подключение по MAC без сканирования"""
-        print(f"🔍 Запуск автоматического подключения к датчику по MAC: {TARGET_MAC_ADDRESS}")
-        self.is_connecting = True
-        
-        connection_attempts = 0
-        max_attempts = 20
-        
-        while not self.is_connected and connection_attempts < max_attempts:
-            connection_attempts += 1
-            print(f"🔌 Попытка подключения {connection_attempts}/{max_attempts}")
-            
-            try:
-                # Прямое подключение по MAC-адресу без сканирования
-                print(f"📡 Прямое подключение к {TARGET_MAC_ADDRESS}...")
-                
-                # Пробуем разные варианты MAC-адреса
-                mac_variants = [
-                    TARGET_MAC_ADDRESS,
-                    TARGET_MAC_ADDRESS.upper(),
-                    TARGET_MAC_ADDRESS.lower(),
-                    TARGET_MAC_ADDRESS.replace(':', '-'),
-                    TARGET_MAC_ADDRESS.replace('-', ':')
-                ]
-                
-                for mac in mac_variants:
-                    try:
-                        print(f"🔧 Пробуем MAC: {mac}")
-                        self.client = BleakClient(mac)
-                        
-                        # Пробуем подключиться с таймаутом
-                        await self.client.connect(timeout=30.0)
-                        
-                        # Проверяем, что подключение действительно установлено
-                        if self.client.is_connected:
-                            self.is_connected = True
-                            self.is_connecting = False
-                            print(f"🎉 УСПЕШНО подключено к датчику! MAC: {mac}")
-                            
-                            # Плата всегда в ожидании, но не начинает замер до команды
-                            self.is_reading = False
-                            print("📴 Плата в режиме ожидания - замер не активен")
-                            
-                            return
-                        else:
-                            print(f"❌ Подключение не установлено для MAC: {mac}")
-                            await self.client.disconnect()
-                            
-                    except Exception as e:
-                        print(f"❌ Ошибка подключения к {mac}: {e}")
-                        continue
-                
-                print("🔄 Все варианты MAC-адреса не сработали, повтор через 3 секунды...")
-                await asyncio.sleep(3)
-                    
-            except Exception as e:
-                print(f"❌ Общая ошибка подключения: {e}")
-                print("🔄 Повтор через 5 секунд...")
-                await asyncio.sleep(5)
-        
-        if not self.is_connected:
-            self.is_connecting = False
-            print(f"❌ НЕ УДАЛОСЬ подключиться после {max_attempts} попыток")
-    
-    async def _read_sensor_data(self):
-        """Read data from BLE sensor with zero value filtering"""
-        if not self.client or not self.is_connected or not self.is_reading:
-            return
-        
-        try:
-            data = await self.client.read_gatt_char(CHARACTERISTIC_UUID)
-            sensor_value = data.decode('utf-8').strip()
-            
-            # Convert to integer and filter zero values
-            try:
-                value = float(sensor_value)
-                if value != 0:  # Accept only non-zero values
-                    self.current_value = value
-                    
-                    # Если идет калибровка, собираем данные в соответствующий массив
-                    if self.is_calibrating:
-                        if self.calibration_phase == 'relax':
-                            self.calibration_data_relax.append(value)
-                        elif self.calibration_phase == 'tension':
-                            self.calibration_data_tension.append(value)
-                        
-            except ValueError:
-                print(f"❌ Неверный формат данных: {sensor_value}")
-                
-        except Exception as e:
-            print(f"❌ Ошибка чтения датчика: {e}")
-            self.is_connected = False
-    
-    def read_sensor_data(self):
-        """Read sensor data from main thread"""
-        if self.loop and self.is_connected and self.is_reading:
-            asyncio.run_coroutine_threadsafe(self._read_sensor_data(), self.loop)
-    
-    def start_reading(self):
-        """Start reading data from sensor - ТОЛЬКО ПО КОМАНДЕ С КНОПКИ СТАРТ"""
-        self.is_reading = True
-        print("📊 НАЧАТ ЗАМЕР ДАННЫХ С ДАТЧИКА (кнопка СТАРТ)")
-    
-    def stop_reading(self):
-        """Stop reading data from sensor"""
-        self.is_reading = False
-        print("⏸️ Остановлено чтение данных с датчика")
-    
-    def start_calibration(self):
-        """Начать процесс калибровки на 30 секунд"""
-        if self.is_connected and not self.is_calibrating:
-            self.is_calibrating = True
-            self.calibration_data_relax = []
-            self.calibration_data_tension = []
-            self.is_reading = True  # Включаем чтение данных для калибровки
-            print("🔧 Начало процесса калибровки на 30 секунд...")
-            
-            # Запускаем сбор данных для калибровки
-            async def calibration_process():
-                # Фаза расслабления - 15 секунд
-                self.calibration_phase = 'relax'
-                print("🎯 Фаза расслабления: 15 секунд")
-                if self.calibration_phase_callback:
-                    self.calibration_phase_callback('relax', 15)
-                
-                # Собираем данные в течение 15 секунд для расслабления
-                relax_start = asyncio.get_event_loop().time()
-                while (asyncio.get_event_loop().time() - relax_start) < 15:
-                    await asyncio.sleep(0.1)
-                
-                # Фаза напряжения - 15 секунд
-                self.calibration_phase = 'tension'
-                print("💪 Фаза напряжения: 15 секунд")
-                if self.calibration_phase_callback:
-                    self.calibration_phase_callback('tension', 15)
-                
-                # Собираем данные в течение 15 секунд для напряжения
-                tension_start = asyncio.get_event_loop().time()
-                while (asyncio.get_event_loop().time() - tension_start) < 15:
-                    await asyncio.sleep(0.1)
-                
-                # Останавливаем сбор данных
-                self.is_reading = False
-                self.is_calibrating = False
-                self.calibration_phase = None
-                
-                # Анализируем собранные данные
-                if self.calibration_data_relax and self.calibration_data_tension:
-                    # Для расслабления берем минимальное значение
-                    self.baseline = min(self.calibration_data_relax)
-                    # Для напряжения берем максимальное значение
-                    self.max_value = max(self.calibration_data_tension)
-                    self.is_calibrated = True
-                    
-                    print(f"✅ Калибровка завершена!")
-                    print(f"   Базовый уровень (расслабление): {self.baseline:.2f}")
-                    print(f"   Максимальное напряжение: {self.max_value:.2f}")
-                    print(f"   Диапазон: {self.max_value - self.baseline:.2f}")
-                    print(f"   Данных в фазе расслабления: {len(self.calibration_data_relax)}")
-                    print(f"   Данных в фазе напряжения: {len(self.calibration_data_tension)}")
-                    
-                    # Вызываем callback для обновления интерфейса
-                    if self.calibration_callback:
-                        self.calibration_callback(self.baseline, self.max_value)
-                else:
-                    print("❌ Не удалось собрать данные для калибровки")
-            
-            # Запускаем процесс калибровки в отдельной задаче
-            asyncio.run_coroutine_threadsafe(calibration_process(), self.loop)
-    
-    def get_calibrated_value(self):
-        """Возвращает калиброванное значение (0-100%)"""
-        if not self.is_calibrated or self.max_value == self.baseline:
-            return self.current_value
-        
-        # Нормализуем значение от 0 до 100%
-        normalized = (self.current_value - self.baseline) / (self.max_value - self.baseline) * 100
-        return max(0, min(100, normalized))  # Ограничиваем диапазон 0-100%
-    
-    def set_calibration_callback(self, callback):
-        """Устанавливает callback для уведомления о завершении калибровки"""
-        self.calibration_callback = callback
-    
-    def set_calibration_phase_callback(self, callback):
-        """Устанавливает callback для уведомления о смене фазы калибровки"""
-        self.calibration_phase_callback = callback
-    
-    def disconnect_sensor(self):
-        """Disconnect from sensor (only when app closes)"""
-        if self.loop and self.client and self.is_connected:
-            async def disconnect():
-                try:
-                    await self.client.disconnect()
-                    self.is_connected = False
-                    self.is_reading = False
-                    print("🔌 Отключено от датчика")
-                except Exception as e:
-                    print(f"❌ Ошибка отключения: {e}")
-            
-            asyncio.run_coroutine_threadsafe(disconnect(), self.loop)
-
 # Global sensor manager
-sensor_manager = BLESensorManager()
+sensor_manager = BLESensorManager(SENSOR_ADDRESSES)
 
 class RoundedButton(Button):
     def __init__(self, **kwargs):
@@ -604,6 +361,15 @@ class HistoryScreen(Screen):
         back_btn.bg_color.rgba = COLORS['secondary']
         back_btn.bind(on_press=self.switch_to_workout_menu)
         
+        sync_btn = RoundedButton(
+            text='ЗАПИСИ С ДАТЧИКА',
+            font_size='16sp',
+            color=COLORS['white']
+        )
+        sync_btn.bg_color.rgba = COLORS['primary']
+        sync_btn.bind(on_press=self.sync_recordings)
+        
+        buttons_layout.add_widget(sync_btn)
         buttons_layout.add_widget(clear_btn)
         buttons_layout.add_widget(back_btn)
         main_layout.add_widget(buttons_layout)
@@ -757,6 +523,17 @@ class HistoryScreen(Screen):
             self.manager.transition = SlideTransition(direction='left')
             self.manager.current = 'workout_detail'
 
+    def sync_recordings(self, instance):
+        """Выгружает записи, сделанные платой без подключения, в историю"""
+        if not sensor_manager.is_connected:
+            print("❌ Датчик не подключен - записи выгрузить нельзя")
+            return
+        workouts = self.manager.get_screen('workouts')
+        # Callback вызывается из потока BLE - сохраняем в потоке Kivy
+        sensor_manager.sync_recordings(
+            lambda *recording: Clock.schedule_once(lambda dt: workouts.import_recording(*recording))
+        )
+
     def clear_history(self, instance):
         try:
             db_file = 'workout_database.json'
@@ -792,14 +569,14 @@ class WorkoutScreen(Screen):
         Window.clearcolor = COLORS['light']
         self.time_elapsed = 0
         self.timer_running = False
-        self.timer_event = None
         self.timer_label = None
-        self.sensor_data = []
-        self.sensor_update_event = None
-        self.calibration_progress = 0
-        self.calibration_event = None
-        self.calibration_phase_time_left = 0
-        self.calibration_phase_event = None
+        self.session = WorkoutSession(len(sensor_manager.channels))
+        self.run_start_time = 0  # time.monotonic() при нажатии СТАРТ
+        self.run_start_elapsed = 0  # time_elapsed при нажатии СТАРТ
+        # Экран перерисовывается одним callback не чаще раза в кадр: по событию
+        # датчиков (новые данные, смена состояния) или по смене секунды таймера
+        self.refresh_trigger = Clock.create_trigger(self.refresh)
+        self.tick_event = None
 
         main_layout = BoxLayout(orientation='vertical', padding=25, spacing=25)
         
@@ -914,36 +691,65 @@ class WorkoutScreen(Screen):
         self.add_widget(main_layout)
         
         # Устанавливаем callback для калибровки
-        sensor_manager.set_calibration_callback(self.on_calibration_complete)
-        sensor_manager.set_calibration_phase_callback(self.on_calibration_phase_change)
+        # Callback вызывается из потока BLE - виджеты обновляем в потоке Kivy
+        sensor_manager.set_calibration_callback(
+            lambda channels: Clock.schedule_once(lambda dt: self.on_calibration_complete(channels))
+        )
 
     def on_enter(self):
         """При входе на экран тренировки - плата остается в ожидании"""
         # НЕ начинаем чтение автоматически - только по нажатию кнопки СТАРТ
-        self.sensor_update_event = Clock.schedule_interval(self.update_sensor_display, 0.5)
+        sensor_manager.set_update_callback(self.refresh_trigger)
         self.update_calibration_display()
+        self.refresh_trigger()
 
     def on_leave(self):
         """При выходе с экрана тренировки останавливаем чтение данных"""
         sensor_manager.stop_reading()
-        if self.sensor_update_event:
-            self.sensor_update_event.cancel()
-            self.sensor_update_event = None
-        
-        if self.calibration_event:
-            self.calibration_event.cancel()
-            self.calibration_event = None
+        sensor_manager.set_update_callback(None)
+        self.refresh_trigger.cancel()
+        if self.tick_event:
+            self.tick_event.cancel()
+            self.tick_event = None
+
+    def refresh(self, dt=None):
+        """Единое обновление экрана: отсчеты, таймер и строка состояния"""
+        now = time.monotonic()
+        if self.timer_running:
+            self.collect_sensor_data()
+            self.time_elapsed = self.run_start_elapsed + int(now - self.run_start_time)
         
-        if self.calibration_phase_event:
-            self.calibration_phase_event.cancel()
-            self.calibration_phase_event = None
+        minutes = self.time_elapsed // 60
+        seconds = self.time_elapsed % 60
+        self.set_text(self.timer_label, f'{minutes:02d}:{seconds:02d}')
+        self.set_text(self.sensor_label, self.sensor_status_text(now))
+        self.schedule_tick(now)
 
-    def update_sensor_display(self, dt):
-        """Update sensor data display"""
+    def schedule_tick(self, now):
+        """Планирует обновление к следующей смене секунды таймера или калибровки"""
+        deadlines = []
+        if self.timer_running:
+            deadlines.append(self.run_start_time + int(now - self.run_start_time) + 1)
+        if sensor_manager.is_calibrating and sensor_manager.calibration_phase_ends:
+            time_left = sensor_manager.calibration_phase_ends - now
+            deadlines.append(now + (time_left % 1 or 1))
+        
+        if self.tick_event:
+            self.tick_event.cancel()
+            self.tick_event = None
+        if deadlines:
+            self.tick_event = Clock.schedule_once(self.refresh, max(0, min(deadlines) - now))
+
+    @staticmethod
+    def set_text(label, text):
+        """Меняет текст виджета только если он изменился"""
+        if label.text != text:
+            label.text = text
+
+    def sensor_status_text(self, now):
+        """Текст строки состояния датчиков"""
         if sensor_manager.is_connected:
             if sensor_manager.is_reading:
-                sensor_manager.read_sensor_data()
-                
                 if sensor_manager.is_calibrating:
                     # Показываем прогресс калибровки
                     if sensor_manager.calibration_phase == 'relax':
@@ -951,28 +757,39 @@ class WorkoutScreen(Screen):
                     else:
                         status = "🔧 Калибровка: НАПРЯГИТЕ мышцу"
                     
-                    value_text = f"Прогресс: {self.calibration_progress}% | Осталось: {self.calibration_phase_time_left}с"
+                    total = 2 * CALIBRATION_PHASE_TIME
+                    progress = min(100, int(100 * (now - sensor_manager.calibration_started) / total))
+                    time_left = max(0, math.ceil((sensor_manager.calibration_phase_ends or now) - now))
+                    value_text = f"Прогресс: {progress}% | Осталось: {time_left}с"
                 else:
                     status = "✅ Идет замер"
-                    if sensor_manager.is_calibrated:
-                        # Показываем калиброванное значение в %
-                        calibrated_value = sensor_manager.get_calibrated_value()
-                        value_text = f"Напряжение: {calibrated_value:.1f}%"
-                    else:
-                        value_text = f"Напряжение: {sensor_manager.current_value}"
+                    value_text = " | ".join(self.channel_value_text(channel) for channel in sensor_manager.channels)
             else:
                 status = "✅ Подключен (ожидание)"
                 value_text = "Нажмите СТАРТ для начала замера"
         else:
             status = "❌ Не подключен"
-            value_text = f"Поиск датчика {TARGET_MAC_ADDRESS}..."
+            value_text = f"Поиск датчика {', '.join(channel.address for channel in sensor_manager.channels)}..."
         
-        self.sensor_label.text = f"{status}\n{value_text}"
+        return f"{status}\n{value_text}"
+
+    def channel_value_text(self, channel):
+        """Текущее напряжение датчика для строки состояния"""
+        prefix = f"{channel.name}: " if len(sensor_manager.channels) > 1 else "Напряжение: "
+        if not channel.is_connected:
+            return f"{prefix}нет связи"
+        if channel.is_calibrated:
+            # Показываем калиброванное значение в %
+            return f"{prefix}{channel.get_calibrated_value():.1f}%"
+        return f"{prefix}{channel.current_value}"
 
     def update_calibration_display(self):
         """Обновляет отображение информации о калибровке"""
         if sensor_manager.is_calibrated:
-            self.calibration_label.text = f"Калибровка: ✅\nБазовый: {sensor_manager.baseline:.1f} | Макс: {sensor_manager.max_value:.1f}"
+            self.calibration_label.text = "Калибровка: ✅\n" + " | ".join(
+                f"Базовый: {channel.baseline:.1f} | Макс: {channel.max_value:.1f}"
+                for channel in sensor_manager.connected_channels
+            )
             self.calibration_label.color = COLORS['success']
         else:
             self.calibration_label.text = "Калибровка: ❌ не выполнена"
@@ -981,68 +798,39 @@ class WorkoutScreen(Screen):
     def start_calibration(self, instance):
         """Начать процесс калибровки на 30 секунд"""
         if sensor_manager.is_connected and not sensor_manager.is_calibrating:
-            self.calibration_progress = 0
             self.calibrate_button.disabled = True
             self.sensor_label.text = "🔧 Начата калибровка на 30 секунд..."
             
-            # Запускаем прогресс калибровки
-            self.calibration_event = Clock.schedule_interval(self.update_calibration_progress, 0.5)
-            
-            # Запускаем калибровку в менеджере
+            # Запускаем калибровку в менеджере (прогресс - в refresh)
             sensor_manager.start_calibration()
 
-    def update_calibration_progress(self, dt):
-        """Обновляет прогресс калибровки"""
-        if sensor_manager.is_calibrating:
-            self.calibration_progress = min(100, self.calibration_progress + 100/60)  # 30 секунд * 2 обновления в секунду
-        else:
-            if self.calibration_event:
-                self.calibration_event.cancel()
-                self.calibration_event = None
-
-    def on_calibration_phase_change(self, phase, duration):
-        """Callback при смене фазы калибровки"""
-        self.calibration_phase_time_left = duration
-        
-        # Запускаем отсчет времени для текущей фазы
-        if self.calibration_phase_event:
-            self.calibration_phase_event.cancel()
-        
-        self.calibration_phase_event = Clock.schedule_interval(self.update_phase_timer, 1)
-        
-        if phase == 'relax':
-            print("🔧 Переход в фазу расслабления")
-        else:
-            print("🔧 Переход в фазу напряжения")
-
-    def update_phase_timer(self, dt):
-        """Обновляет таймер фазы калибровки"""
-        if sensor_manager.is_calibrating:
-            self.calibration_phase_time_left -= 1
-            if self.calibration_phase_time_left <= 0:
-                self.calibration_phase_time_left = 0
-                if self.calibration_phase_event:
-                    self.calibration_phase_event.cancel()
-
-    def on_calibration_complete(self, baseline, max_value):
+    def on_calibration_complete(self, channels):
         """Callback при завершении калибровки"""
         self.calibrate_button.disabled = False
         self.update_calibration_display()
         
-        if self.calibration_phase_event:
-            self.calibration_phase_event.cancel()
-        
-        self.sensor_label.text = f"✅ Калибровка завершена!\nБазовый: {baseline:.1f} | Макс: {max_value:.1f}"
+        self.sensor_label.text = "✅ Калибровка завершена!\n" + " | ".join(
+            f"Базовый: {channel.baseline:.1f} | Макс: {channel.max_value:.1f}" for channel in channels
+        )
         
         # Сохраняем калибровочные данные
-        self.save_calibration_data(baseline, max_value)
+        self.save_calibration_data()
 
-    def save_calibration_data(self, baseline, max_value):
-        """Сохраняет данные калибровки в файл"""
+    def save_calibration_data(self):
+        """Сохраняет данные калибровки в файл (по датчикам, ключ - MAC-адрес)"""
         try:
+            primary = sensor_manager.primary
             calibration_data = {
-                'baseline': baseline,
-                'max_value': max_value,
+                'baseline': primary.baseline,
+                'max_value': primary.max_value,
+                'sensors': {
+                    channel.address: {
+                        'baseline': channel.baseline,
+                        'max_value': channel.max_value,
+                        'stream_mode': channel.stream_mode
+                    }
+                    for channel in sensor_manager.channels if channel.is_calibrated
+                },
                 'calibration_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
@@ -1060,9 +848,16 @@ class WorkoutScreen(Screen):
                 with open('calibration_data.json', 'r', encoding='utf-8') as f:
                     calibration_data = json.load(f)
                 
-                sensor_manager.baseline = calibration_data.get('baseline', 0)
-                sensor_manager.max_value = calibration_data.get('max_value', 0)
-                sensor_manager.is_calibrated = True
+                # Старый формат файла - одна калибровка для основного датчика
+                sensors = calibration_data.get('sensors') or {
+                    sensor_manager.primary.address: calibration_data
+                }
+                for channel in sensor_manager.channels:
+                    # Калибровка по сырому сигналу не подходит для огибающей и наоборот
+                    if channel.address in sensors and sensors[channel.address].get('stream_mode', 'raw') == channel.stream_mode:
+                        channel.baseline = sensors[channel.address].get('baseline', 0)
+                        channel.max_value = sensors[channel.address].get('max_value', 0)
+                        channel.is_calibrated = True
                 
                 print("✅ Данные калибровки загружены")
                 return True
@@ -1079,9 +874,14 @@ class WorkoutScreen(Screen):
                 self.load_calibration_data()
             
             # ВКЛЮЧАЕМ ЗАМЕР ДАННЫХ ТОЛЬКО ЗДЕСЬ
+            for channel in sensor_manager.channels:
+                channel.samples.discard()
+                channel.raw_samples.discard()
+            self.run_start_time = time.monotonic()
+            self.run_start_elapsed = self.time_elapsed
             sensor_manager.start_reading()
             self.timer_running = True
-            self.timer_event = Clock.schedule_interval(self.update_timer, 1.0)
+            self.refresh_trigger()
             print("Тренировка начата! Замер данных АКТИВИРОВАН")
 
     def stop_workout(self, instance):
@@ -1089,119 +889,192 @@ class WorkoutScreen(Screen):
             self.timer_running = False
             # ОСТАНАВЛИВАЕМ ЗАМЕР ДАННЫХ
             sensor_manager.stop_reading()
-            if self.timer_event:
-                self.timer_event.cancel()
+            self.stop_collecting()
+            self.refresh()
             print(f"Тренировка остановлена. Время: {self.timer_label.text}")
 
     def collect_sensor_data(self):
-        """Collect sensor data from BLE manager"""
-        if self.timer_running and sensor_manager.is_connected and sensor_manager.current_value != 0:
-            sensor_reading = {
-                'timestamp': self.time_elapsed,
-                'tension': sensor_manager.current_value,
-                'calibrated_tension': sensor_manager.get_calibrated_value() if sensor_manager.is_calibrated else sensor_manager.current_value
-            }
+        """Забирает из кольцевых буферов все новые отсчеты датчиков"""
+        for channel in sensor_manager.channels:
+            values, timestamps = channel.samples.drain()
+            if len(values) == 0:
+                continue
             
-            self.sensor_data.append(sensor_reading)
+            # Время отсчета от начала тренировки с учетом пауз
+            elapsed = self.run_start_elapsed + (timestamps - self.run_start_time)
+            self.session.extend(channel.index, elapsed, values, channel.calibrate_values(values))
+        
+        for channel in sensor_manager.channels:
+            values, timestamps = channel.raw_samples.drain()
+            if len(values):
+                elapsed = self.run_start_elapsed + (timestamps - self.run_start_time)
+                self.session.extend_raw(channel.index, elapsed, values)
 
-    def update_timer(self, dt):
-        if self.timer_running:
-            self.time_elapsed += 1
-            self.collect_sensor_data()
-            minutes = self.time_elapsed // 60
-            seconds = self.time_elapsed % 60
-            self.timer_label.text = f'{minutes:02d}:{seconds:02d}'
+    def stop_collecting(self):
+        """Останавливает сбор отсчетов, забрав все оставшиеся в буфере"""
+        self.collect_sensor_data()
+        
+        for channel in sensor_manager.channels:
+            buffer = channel.samples
+            if buffer.overruns:
+                print(f"⚠️ {channel.name}: буфер отсчетов переполнялся {buffer.overrun_events} раз, потеряно отсчетов: {buffer.overruns}")
 
     def save_workout(self, instance):
-        if self.time_elapsed > 0 and self.sensor_data:
-            minutes = self.time_elapsed // 60
-            seconds = self.time_elapsed % 60
-            workout_time = f'{minutes:02d}:{seconds:02d}'
+        if self.timer_running:
+            self.collect_sensor_data()
+        
+        if self.time_elapsed > 0 and len(self.session):
             current_date = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             
-            tension_values = [data['tension'] for data in self.sensor_data]
-            calibrated_values = [data['calibrated_tension'] for data in self.sensor_data] if sensor_manager.is_calibrated else tension_values
-            
-            max_tension = max(tension_values)
-            avg_tension = sum(tension_values) / len(tension_values)
-            min_tension = min(tension_values)
-            
-            max_calibrated = max(calibrated_values) if sensor_manager.is_calibrated else 0
-            avg_calibrated = sum(calibrated_values) / len(calibrated_values) if sensor_manager.is_calibrated else 0
-            
+            channels = [self.channel_entry(channel, self.session) for channel in sensor_manager.channels]
             workout_id = datetime.now().strftime('%Y%m%d_%H%M%S')
-            workout_folder = f'workouts/workout_{workout_id}'
-            os.makedirs(workout_folder, exist_ok=True)
-            
-            graph_path = f'{workout_folder}/graph.png'
-            self.create_tension_graph(self.sensor_data, graph_path, max_tension, avg_tension, min_tension)
-            
-            workout_entry = {
-                'id': workout_id,
-                'time': workout_time,
-                'date': current_date,
-                'duration_seconds': self.time_elapsed,
-                'sensor_data': self.sensor_data,
-                'workout_folder': workout_folder,
-                'graph_path': graph_path,
-                'calibration_used': sensor_manager.is_calibrated,
-                'calibration_baseline': sensor_manager.baseline if sensor_manager.is_calibrated else 0,
-                'calibration_max': sensor_manager.max_value if sensor_manager.is_calibrated else 0,
-                'metrics': {
-                    'max_tension': max_tension,
-                    'avg_tension': round(avg_tension, 2),
-                    'min_tension': min_tension,
-                    'max_calibrated': round(max_calibrated, 2) if sensor_manager.is_calibrated else 0,
-                    'avg_calibrated': round(avg_calibrated, 2) if sensor_manager.is_calibrated else 0
-                }
-            }
+            workout_entry = self.workout_entry(workout_id, current_date, self.time_elapsed, channels)
             
             success = self.save_to_database(workout_entry)
             if success:
                 if self.timer_running:
-                    if self.timer_event:
-                        self.timer_event.cancel()
+                    self.stop_collecting()
                     self.timer_running = False
                 # Останавливаем замер при сохранении
                 sensor_manager.stop_reading()
                 self.time_elapsed = 0
-                self.sensor_data = []
+                self.session = WorkoutSession(len(sensor_manager.channels))
                 self.timer_label.text = '00:00'
                 
                 if 'history' in self.manager.screen_names:
                     self.manager.get_screen('history').update_history()
                 
-                self.sensor_label.text = f'✅ Тренировка сохранена!\nВремя: {workout_time}'
+                self.sensor_label.text = f'✅ Тренировка сохранена!\nВремя: {workout_entry["time"]}'
             else:
                 self.sensor_label.text = '❌ Ошибка сохранения тренировки'
         else:
             self.sensor_label.text = '❌ Нет данных для сохранения\nЗапустите тренировку и соберите данные'
 
-    def create_tension_graph(self, sensor_data, save_path, max_tension, avg_tension, min_tension):
-        if not sensor_data:
+    def workout_entry(self, workout_id, date, duration_seconds, channels):
+        """Запись тренировки для базы: папка, график и метрики основного датчика"""
+        minutes = duration_seconds // 60
+        seconds = duration_seconds % 60
+        workout_folder = f'workouts/workout_{workout_id}'
+        os.makedirs(workout_folder, exist_ok=True)
+        
+        graph_path = f'{workout_folder}/graph.png'
+        self.create_tension_graph(channels, graph_path)
+        
+        primary = channels[0]
+        return {
+            'id': workout_id,
+            'time': f'{minutes:02d}:{seconds:02d}',
+            'date': date,
+            'duration_seconds': duration_seconds,
+            'workout_folder': workout_folder,
+            'graph_path': graph_path,
+            # Калибровка и метрики основного датчика (для истории тренировок)
+            'calibration_used': primary['calibration_used'],
+            'calibration_baseline': primary['calibration_baseline'],
+            'calibration_max': primary['calibration_max'],
+            'metrics': primary['metrics'],
+            'channels': channels
+        }
+
+    def channel_entry(self, channel, session, stream_mode=None):
+        """Данные и метрики одного датчика для записи тренировки (по столбцам)"""
+        timestamps, tension, calibrated = session.channel_data(channel.index)
+        stream_mode = stream_mode or channel.stream_mode
+        # Калибровка снята в режиме передачи датчика - к другому сигналу не подходит
+        calibration_used = channel.is_calibrated and stream_mode == channel.stream_mode
+        
+        metrics = {'max_tension': 0, 'avg_tension': 0, 'min_tension': 0, 'max_calibrated': 0, 'avg_calibrated': 0}
+        if len(tension):
+            metrics['max_tension'] = float(tension.max())
+            metrics['avg_tension'] = round(float(tension.mean()), 2)
+            metrics['min_tension'] = float(tension.min())
+            if calibration_used:
+                metrics['max_calibrated'] = round(float(calibrated.max()), 2)
+                metrics['avg_calibrated'] = round(float(calibrated.mean()), 2)
+        
+        entry = {
+            'address': channel.address,
+            'name': channel.name,
+            'stream_mode': stream_mode,
+            'calibration_used': calibration_used,
+            'calibration_baseline': channel.baseline if calibration_used else 0,
+            'calibration_max': channel.max_value if calibration_used else 0,
+            'lost_samples': channel.lost_samples,
+            'clock_drift_ppm': round(channel.clock.drift * 1e6, 1),
+            # Время отсчетов по часам платы - микросекундное разрешение
+            'timestamps': np.round(timestamps, 6).tolist(),
+            'tension': tension.tolist(),
+            'calibrated_tension': np.round(calibrated, 2).tolist() if calibration_used else [],
+            'metrics': metrics
+        }
+        
+        # Сырой сигнал для анализа (режим передачи 'both')
+        raw_timestamps, raw = session.raw_data(channel.index)
+        if len(raw):
+            entry['raw_timestamps'] = np.round(raw_timestamps, 6).tolist()
+            entry['raw'] = raw.tolist()
+        return entry
+
+    def import_recording(self, channel, record_id, rate, timestamps, values):
+        """Запись из флеша платы (сделанная без подключения) - обычная тренировка"""
+        if len(values):
+            session = WorkoutSession(len(sensor_manager.channels))
+            session.extend(channel.index, timestamps, values, channel.calibrate_values(values))
+            
+            # Часов реального времени на плате нет - дата тренировки по времени выгрузки
+            now = datetime.now()
+            workout_id = f"{now.strftime('%Y%m%d_%H%M%S')}_rec{record_id}"
+            channels = [self.channel_entry(channel, session, stream_mode='raw')]
+            workout_entry = self.workout_entry(
+                workout_id, now.strftime('%Y-%m-%d %H:%M:%S'), int(round(timestamps[-1])), channels
+            )
+            workout_entry['source'] = 'device_recording'
+            workout_entry['sample_rate'] = rate
+            if not self.save_to_database(workout_entry):
+                return
+            
+            if 'history' in self.manager.screen_names:
+                self.manager.get_screen('history').update_history()
+        
+        # Сохранено на хосте - место во флеше платы освобождаем
+        sensor_manager.delete_recording(channel, record_id)
+
+    def create_tension_graph(self, channels, save_path):
+        channels = [channel for channel in channels if channel['tension']]
+        if not channels:
             return
             
         import matplotlib.pyplot as plt
         
-        times = [data['timestamp'] for data in sensor_data]
-        tension = [data['tension'] for data in sensor_data]
-        
         plt.figure(figsize=(12, 8))
         
-        # Основной график напряжения мышцы
-        plt.plot(times, tension, color='#2E86AB', linewidth=2.5, label='Напряжение мышцы', alpha=0.7)
-        
-        # Линии для максимального, среднего и минимального значений
-        plt.axhline(y=max_tension, color='#FF6B6B', linestyle='--', linewidth=2, label=f'Макс: {max_tension}')
-        plt.axhline(y=avg_tension, color='#4ECDC4', linestyle='--', linewidth=2, label=f'Ср: {avg_tension:.1f}')
-        plt.axhline(y=min_tension, color='#45B7D1', linestyle='--', linewidth=2, label=f'Мин: {min_tension}')
-        
-        # Точки для максимального и минимального значений
-        max_index = tension.index(max_tension)
-        min_index = tension.index(min_tension)
-        
-        plt.scatter(times[max_index], max_tension, color='#FF6B6B', s=100, zorder=5)
-        plt.scatter(times[min_index], min_tension, color='#45B7D1', s=100, zorder=5)
+        if len(channels) == 1:
+            times = channels[0]['timestamps']
+            tension = channels[0]['tension']
+            metrics = channels[0]['metrics']
+            max_tension = metrics['max_tension']
+            avg_tension = metrics['avg_tension']
+            min_tension = metrics['min_tension']
+            
+            # Основной график напряжения мышцы
+            plt.plot(times, tension, color='#2E86AB', linewidth=2.5, label='Напряжение мышцы', alpha=0.7)
+            
+            # Линии для максимального, среднего и минимального значений
+            plt.axhline(y=max_tension, color='#FF6B6B', linestyle='--', linewidth=2, label=f'Макс: {max_tension}')
+            plt.axhline(y=avg_tension, color='#4ECDC4', linestyle='--', linewidth=2, label=f'Ср: {avg_tension:.1f}')
+            plt.axhline(y=min_tension, color='#45B7D1', linestyle='--', linewidth=2, label=f'Мин: {min_tension}')
+            
+            # Точки для максимального и минимального значений
+            max_index = tension.index(max_tension)
+            min_index = tension.index(min_tension)
+            
+            plt.scatter(times[max_index], max_tension, color='#FF6B6B', s=100, zorder=5)
+            plt.scatter(times[min_index], min_tension, color='#45B7D1', s=100, zorder=5)
+        else:
+            # Несколько мышц - по линии на датчик
+            for channel in channels:
+                plt.plot(channel['timestamps'], channel['tension'], linewidth=1.5, alpha=0.8,
+                         label=f"{channel['name']} (ср: {channel['metrics']['avg_tension']:.1f})")
         
         # Заголовок и подписи
         plt.title('Динамика напряжения мышцы во времени', fontsize=16, fontweight='bold', pad=20)
@@ -1254,8 +1127,7 @@ class WorkoutScreen(Screen):
 
     def switch_to_workout_menu(self, instance):
         if self.timer_running:
-            if self.timer_event:
-                self.timer_event.cancel()
+            self.stop_collecting()
             self.timer_running = False
         
         # Останавливаем замер при переходе на другой экран
@@ -1349,11 +1221,19 @@ class WorkoutDetailScreen(Screen):
         metrics_grid = GridLayout(cols=2, size_hint_y=0.8, spacing=15)
         
         # Calculate min tension if not present
+        channels = workout.get('channels', [])
         min_tension = metrics.get('min_tension', 0)
-        if min_tension == 0 and workout.get('sensor_data'):
+        if min_tension == 0 and channels:
+            tension_values = channels[0].get('tension', [])
+            min_tension = min(tension_values) if tension_values else 0
+        elif min_tension == 0 and workout.get('sensor_data'):
             tension_values = [data['tension'] for data in workout['sensor_data']]
             min_tension = min(tension_values) if tension_values else 0
         
+        # Несколько датчиков - средние значения каждого
+        if len(channels) > 1:
+            metrics_card.height += 30 * len(channels)
+        
         metrics_data = [
             ('Макс. напряжение:', f"{metrics.get('max_tension', 0):.0f}"),
             ('Ср. напряжение:', f"{metrics.get('avg_tension', 0):.1f}"),
@@ -1366,6 +1246,12 @@ class WorkoutDetailScreen(Screen):
                 ('Ср. калибр.:', f"{metrics.get('avg_calibrated', 0):.1f}%")
             ])
         
+        if len(channels) > 1:
+            metrics_data.extend(
+                (f"{channel.get('name', 'Датчик')} (ср.):", f"{channel.get('metrics', {}).get('avg_tension', 0):.1f}")
+                for channel in channels
+            )
+        
         for label, value in metrics_data:
             label_widget = Label(
                 text=label, 
@@ -1460,7 +1346,7 @@ if __name__ == '__main__':
     # Create necessary directories
     os.makedirs('workouts', exist_ok=True)
     
-    print("🎯 Целевой MAC-адрес:", TARGET_MAC_ADDRESS)
+    print("🎯 Целевые MAC-адреса:", ", ".join(SENSOR_ADDRESSES))
     print("🔧 UUID характеристики:", CHARACTERISTIC_UUID)
     
     # Run the app
@@ -0,0 +1,1076 @@
+import asyncio
+import os
+import threading
+import struct
+import time
+import random
+import socket
+from collections import deque
+import numpy as np
+from bleak import BleakScanner, BleakClient
+
+# BLE Configuration
+TARGET_MAC_ADDRESS = "B0:B2:1C:A7:E2:9A"
+# Датчики сессии (по одному на мышцу). Первый - основной: по нему считаются
+# метрики в истории тренировок.
+SENSOR_ADDRESSES = [TARGET_MAC_ADDRESS]
+SCAN_TIMEOUT = 5.0  # Поиск устройства по адресу, сек
+CONNECT_TIMEOUT = 10.0  # Подключение к найденному устройству, сек
+CONNECT_MAX_ATTEMPTS = 20
+BACKOFF_BASE = 0.5  # Первая пауза между попытками, сек (удваивается)
+BACKOFF_MAX = 30.0
+CLOCK_WINDOW = 2.0  # Окно минимума задержки доставки, сек времени прошивки
+CLOCK_WINDOWS = 30  # Окон в оценке дрейфа часов (~1 мин)
+CLOCK_MAX_DRIFT = 500e-6  # Допустимый дрейф кварца прошивки (500 ppm)
+POLL_INTERVAL = 0.5  # Опрос датчика без уведомлений, сек
+CALIBRATION_PHASE_TIME = 15  # Фазы расслабления и напряжения калибровки, сек
+CHARACTERISTIC_UUID = "beb5483e-36e1-4688-b7f5-ea07361b26a8"
+CONTROL_CHARACTERISTIC_UUID = "beb5483f-36e1-4688-b7f5-ea07361b26a8"
+RECORDS_CHARACTERISTIC_UUID = "beb54840-36e1-4688-b7f5-ea07361b26a8"
+ECHO_CHARACTERISTIC_UUID = "beb54841-36e1-4688-b7f5-ea07361b26a8"  # Эхо для замера задержки
+# Подписка на уведомления (start_notify). Если прошивка старая и характеристика
+# не поддерживает notify, менеджер автоматически переходит на опрос read_gatt_char
+USE_NOTIFICATIONS = True
+# Что передает прошивка с характеристикой управления: 'envelope' - огибающая RMS
+# (50 Гц, для обычной тренировки), 'raw' - сырой сигнал АЦП, 'both' - огибающая
+# как напряжение мышцы плюс сырой сигнал для анализа
+STREAM_MODE = 'envelope'
+# Частота оцифровки, Гц: на плате 100-2000, в имитации до 10000
+SAMPLE_RATE = int(os.environ.get('EMG_SAMPLE_RATE', 1000))
+FRAME_SIZE = 0  # Максимум отсчетов в уведомлении, 0 - сколько помещается в MTU
+SYNC_TIMEOUT = 10.0  # Выгрузка записи из флеша платы: запас на старт, сек
+SYNC_MIN_RATE = 5000  # и не медленнее этого, байт/с
+# Откуда берутся данные: 'ble' - датчики, 'simulated' - синтетическая ЭМГ,
+# 'replay' - запись REPLAY_FILE по кругу (simulator.py, нагрузочные тесты без железа)
+TRANSPORT = os.environ.get('EMG_TRANSPORT', 'ble')
+REPLAY_FILE = os.environ.get('EMG_REPLAY_FILE', 'workout_database.json')
+SIMULATED_DROPOUT = float(os.environ.get('EMG_DROPOUT', 0))  # Доля уведомлений, потерянных в эфире
+SIMULATED_LINK_LOSS = float(os.environ.get('EMG_LINK_LOSS', 0))  # Средний интервал обрывов связи, сек
+
+# Бинарный кадр прошивки (см. Esp32.ino), little-endian:
+# version, flags, seq первого отсчета, micros() первого отсчета, интервал отсчетов в мкс,
+# затем N отсчетов АЦП uint16. Старая прошивка присылает одно значение ASCII-строкой.
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<BBIIH')
+FRAME_FLAG_LEAD_OFF = 0x01
+FRAME_FLAG_BACKLOG = 0x02  # Кадр из буфера прошивки (догон после обрыва связи)
+FRAME_FLAG_RESUMED = 0x04  # Первый кадр потока после команды CMD_RESUME
+FRAME_FLAG_ENVELOPE = 0x08  # Отсчеты огибающей RMS (своя нумерация seq)
+
+# Команды характеристики управления: opcode + аргументы
+CMD_RESUME = 0x01  # Продолжить передачу с отсчетов seq сигнала и огибающей (~10 с в буфере)
+CMD_MODE = 0x02  # Какие потоки передавать (STREAM_MODES)
+CMD_START = 0x03  # Начать оцифровку - плата и радио работают только во время замера
+CMD_STOP = 0x04  # Остановить оцифровку
+CMD_RATE = 0x05  # Частота оцифровки, Гц
+CMD_FRAME_SIZE = 0x06  # Максимум отсчетов в кадре
+CONTROL_RESUME = struct.Struct('<BII')
+CONTROL_MODE = struct.Struct('<BB')
+CONTROL_RATE = struct.Struct('<BH')
+CONTROL_FRAME_SIZE = struct.Struct('<BB')
+RESUME_LIVE = 0xFFFFFFFF  # seq для CMD_RESUME: только новые отсчеты
+STREAM_MODES = {'raw': 0, 'envelope': 1, 'both': 2}
+
+# Записи во флеше платы (esp32/main.py): плата пишет сырой сигнал, пока нет клиента
+CMD_RECORD = 0x07  # Запись во флеш (uint8 1/0), продолжается без клиента
+CMD_SYNC = 0x08  # Выгрузить запись: uint16 id + uint8 способ (SYNC_*)
+CMD_DELETE = 0x09  # Удалить запись с платы - она сохранена на хосте
+CONTROL_SYNC = struct.Struct('<BHB')
+CONTROL_RECORD_ID = struct.Struct('<BH')
+SYNC_L2CAP = 0  # Одним потоком по L2CAP-каналу (Linux, Python 3.14+)
+SYNC_GATT = 1  # Уведомлениями характеристики записей: uint32 смещение + данные
+L2CAP_PSM = 0x0081
+L2CAP_AVAILABLE = hasattr(socket, 'AF_BLUETOOTH') and hasattr(socket, 'BDADDR_LE_PUBLIC')
+RECORD_CATALOG_ENTRY = struct.Struct('<HI')  # Характеристика записей: id, размер
+SYNC_HEADER = struct.Struct('<HI')  # Начало выгрузки по L2CAP: id, размер
+SYNC_CHUNK = struct.Struct('<I')
+# Файл записи: заголовок и блоки - заголовок кадра, число отсчетов и
+# отсчеты по 10 бит (4 отсчета в 5 байтах)
+RECORDING_MAGIC = b'EMGR'
+RECORDING_VERSION = 1
+RECORDING_HEADER = struct.Struct('<4sBBH')  # magic, версия, бит на отсчет, частота
+RECORDING_BLOCK = struct.Struct('<BBIIHH')
+
+
+def decode_sensor_frame(data):
+    """Разбирает бинарный кадр: (flags, seq, timestamp_us, period_us, samples)
+
+    samples - массив NumPy uint16 поверх буфера уведомления, без копирования.
+    """
+    version, flags, seq, timestamp_us, period_us = FRAME_HEADER.unpack_from(data)
+    if version != FRAME_VERSION:
+        raise ValueError(f"неизвестная версия кадра: {version}")
+    count = (len(data) - FRAME_HEADER.size) // 2
+    samples = np.frombuffer(data, dtype='<u2', count=count, offset=FRAME_HEADER.size)
+    return flags, seq, timestamp_us, period_us, samples
+
+
+def decode_recording(data):
+    """Файл записи платы -> (частота, время отсчетов в сек от начала записи, отсчеты)"""
+    magic, version, bits, rate = RECORDING_HEADER.unpack_from(data)
+    if magic != RECORDING_MAGIC or version != RECORDING_VERSION or bits != 10:
+        raise ValueError('неизвестный формат записи')
+
+    clock = DeviceClock()
+    timestamps = []
+    values = []
+    offset = RECORDING_HEADER.size
+    while offset + RECORDING_BLOCK.size <= len(data):
+        _, _, _, timestamp_us, period_us, count = RECORDING_BLOCK.unpack_from(data, offset)
+        offset += RECORDING_BLOCK.size
+        packed = (count + 3) // 4 * 5
+        if offset + packed > len(data):
+            break  # Последний блок не дописан (плата выключилась во время записи)
+
+        groups = np.frombuffer(data, np.uint8, packed, offset).reshape(-1, 5).astype(np.uint16)
+        offset += packed
+        block = np.empty((len(groups), 4), np.uint16)
+        block[:, 0] = groups[:, 0] | (groups[:, 1] & 0x03) << 8
+        block[:, 1] = groups[:, 1] >> 2 | (groups[:, 2] & 0x0F) << 6
+        block[:, 2] = groups[:, 2] >> 4 | (groups[:, 3] & 0x3F) << 4
+        block[:, 3] = groups[:, 3] >> 6 | groups[:, 4] << 2
+        values.append(block.ravel()[:count])
+        timestamps.append(clock.unwrap(timestamp_us) + np.arange(count) * period_us)
+
+    if not values:
+        return rate, np.zeros(0), np.zeros(0, np.uint16)
+    timestamps = np.concatenate(timestamps)
+    return rate, (timestamps - timestamps[0]) / 1e6, np.concatenate(values)
+
+
+def read_l2cap(address, length):
+    """Читает length байт из L2CAP-канала платы (блокирующий, для run_in_executor)"""
+    with socket.socket(socket.AF_BLUETOOTH, socket.SOCK_SEQPACKET, socket.BTPROTO_L2CAP) as sock:
+        sock.settimeout(SYNC_TIMEOUT)
+        sock.connect((address, L2CAP_PSM, 0, socket.BDADDR_LE_PUBLIC))
+        data = bytearray()
+        while len(data) < length:
+            chunk = sock.recv(65536)
+            if not chunk:
+                raise ConnectionError(f'канал закрыт: получено {len(data)} из {length} байт')
+            data += chunk
+        return bytes(data)
+
+
+class SampleRingBuffer:
+    """Кольцевой буфер отсчетов без потерь между потоком BLE и потоком Kivy
+
+    Один писатель (asyncio-поток BLE) вызывает push(), один читатель (Kivy) - drain().
+    Писатель меняет только _head, читатель только _tail, поэтому блокировки не нужны:
+    данные записываются в массив до того, как _head делает их видимыми читателю.
+    Если читатель не успевает, новые отсчеты отбрасываются и считаются в overruns.
+    """
+
+    def __init__(self, capacity=65536):
+        self.capacity = capacity
+        self.values = np.zeros(capacity, dtype=np.float64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self._head = 0  # Всего записано отсчетов (меняет только писатель)
+        self._tail = 0  # Всего прочитано отсчетов (меняет только читатель)
+        self.overruns = 0  # Отброшено отсчетов из-за переполнения
+        self.overrun_events = 0  # Сколько раз буфер переполнялся
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, values, timestamps):
+        """Добавляет отсчеты с метками времени, возвращает число записанных"""
+        count = len(values)
+        free = self.capacity - (self._head - self._tail)
+        if count > free:
+            self.overruns += count - free
+            self.overrun_events += 1
+            count = free
+        if count == 0:
+            return 0
+
+        start = self._head % self.capacity
+        first = min(count, self.capacity - start)
+        self.values[start:start + first] = values[:first]
+        self.timestamps[start:start + first] = timestamps[:first]
+        if first < count:
+            self.values[:count - first] = values[first:count]
+            self.timestamps[:count - first] = timestamps[first:count]
+
+        self._head += count
+        return count
+
+    def drain(self):
+        """Забирает все новые отсчеты: (values, timestamps) - копии массивов"""
+        head = self._head
+        count = head - self._tail
+        start = self._tail % self.capacity
+        if start + count <= self.capacity:
+            values = self.values[start:start + count].copy()
+            timestamps = self.timestamps[start:start + count].copy()
+        else:
+            first = self.capacity - start
+            values = np.concatenate((self.values[start:], self.values[:count - first]))
+            timestamps = np.concatenate((self.timestamps[start:], self.timestamps[:count - first]))
+
+        self._tail = head
+        return values, timestamps
+
+    def discard(self):
+        """Пропускает все непрочитанные отсчеты (вызывается читателем)"""
+        self._tail = self._head
+
+
+def create_connector(address, index=0):
+    """Подключение к датчику через выбранный TRANSPORT"""
+    if TRANSPORT == 'ble':
+        return SensorConnector(address)
+    if TRANSPORT in ('simulated', 'replay'):
+        import simulator  # simulator импортирует этот модуль
+        return simulator.create_connector(address, index)
+    raise ValueError(f"неизвестный TRANSPORT: {TRANSPORT}")
+
+
+class SensorConnector:
+    """Быстрое подключение к датчику
+
+    Устройство ищется одним BleakScanner.find_device_by_address, найденный BLEDevice
+    кэшируется и используется для прямого подключения без повторного сканирования.
+    Между неудачными попытками - экспоненциальная пауза со случайным разбросом.
+    """
+
+    def __init__(self, address):
+        self.address = address.upper().replace('-', ':')
+        self.device = None  # Кэш найденного BLEDevice
+        self.failures = 0  # Неудачных попыток подряд
+
+        # Метрики подключения
+        self.attempts = 0
+        self.connect_times = []  # Время до подключения (сек), включая паузы
+        self.last_attempt_time = None  # Длительность последней удачной попытки (сек)
+
+    def next_delay(self):
+        """Пауза перед следующей попыткой (full jitter)"""
+        delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** self.failures)
+        return random.uniform(0, delay)
+
+    async def find_device(self):
+        """Возвращает BLEDevice из кэша или ищет его сканированием"""
+        if self.device is None:
+            self.device = await BleakScanner.find_device_by_address(self.address, timeout=SCAN_TIMEOUT)
+        return self.device
+
+    async def connect_once(self, **client_kwargs):
+        """Одна попытка подключения, возвращает подключенный BleakClient"""
+        self.attempts += 1
+        started = time.monotonic()
+
+        cached = self.device is not None
+        device = await self.find_device()
+        if device is None:
+            raise ConnectionError(f"устройство {self.address} не найдено за {SCAN_TIMEOUT:.0f} с")
+
+        client = BleakClient(device, timeout=CONNECT_TIMEOUT, **client_kwargs)
+        try:
+            await client.connect()
+        except Exception:
+            # Кэш мог устареть (сменился адрес, устройство пропало) - в следующий раз ищем заново
+            if cached:
+                self.device = None
+            raise
+
+        self.last_attempt_time = time.monotonic() - started
+        return client
+
+    async def connect(self, max_attempts=CONNECT_MAX_ATTEMPTS, **client_kwargs):
+        """Подключается с повторами, возвращает BleakClient или None"""
+        started = time.monotonic()
+
+        for attempt in range(1, max_attempts + 1):
+            print(f"🔌 Попытка подключения {attempt}/{max_attempts} к {self.address}"
+                  f"{' (кэш)' if self.device is not None else ''}")
+            try:
+                client = await self.connect_once(**client_kwargs)
+                if client.is_connected:
+                    elapsed = time.monotonic() - started
+                    self.connect_times.append(elapsed)
+                    self.failures = 0
+                    print(f"⏱️ Подключено за {elapsed:.2f} с (попытка {self.last_attempt_time:.2f} с)")
+                    return client
+                await client.disconnect()
+            except Exception as e:
+                print(f"❌ Ошибка подключения к {self.address}: {e}")
+
+            self.failures += 1
+            if attempt < max_attempts:
+                delay = self.next_delay()
+                print(f"🔄 Повтор через {delay:.1f} с...")
+                await asyncio.sleep(delay)
+
+        return None
+
+
+class DeviceClock:
+    """Перевод времени прошивки (micros) во время хоста (time.monotonic)
+
+    Время прихода кадра = время прошивки + смещение часов + задержка BLE (>= 0).
+    В каждом окне CLOCK_WINDOW берется кадр с наименьшей задержкой, по минимумам
+    последних CLOCK_WINDOWS окон прямой подбираются смещение и дрейф часов.
+    """
+
+    def __init__(self):
+        self._base_us = 0
+        self._last_us = None
+        self._minima = deque(maxlen=CLOCK_WINDOWS)  # [окно, время прошивки, смещение]
+        self.offset = None  # Смещение в момент _reference, сек
+        self.drift = 0.0  # Уход часов хоста относительно прошивки, сек/сек
+        self._reference = 0.0
+
+    def unwrap(self, timestamp_us):
+        """micros() прошивки без переполнения (каждые ~71 минуту), мкс"""
+        if self._last_us is not None and timestamp_us < self._last_us - 0x80000000:
+            self._base_us += 0x100000000
+        self._last_us = timestamp_us
+        return self._base_us + timestamp_us
+
+    def observe(self, device_time, host_time):
+        """Учитывает кадр: время последнего отсчета по часам прошивки и хоста, сек"""
+        offset = host_time - device_time
+        window = int(device_time // CLOCK_WINDOW)
+
+        if self._minima and window < self._minima[-1][0]:
+            self._minima.clear()  # Время прошивки пошло назад - плата перезапущена
+
+        if self._minima and self._minima[-1][0] == window:
+            if offset >= self._minima[-1][2]:
+                return
+            self._minima[-1][1:] = [device_time, offset]
+        else:
+            self._minima.append([window, device_time, offset])
+        self._fit()
+
+    def _fit(self):
+        """Смещение и дрейф по минимумам окон (МНК)"""
+        times = np.array([m[1] for m in self._minima])
+        offsets = np.array([m[2] for m in self._minima])
+        self._reference = times[-1]
+
+        if len(times) < 3:
+            # Мало данных для дрейфа - только смещение по лучшему кадру
+            self.drift = 0.0
+            self.offset = offsets.min()
+            return
+
+        drift, offset = np.polyfit(times - self._reference, offsets, 1)
+        self.drift = float(np.clip(drift, -CLOCK_MAX_DRIFT, CLOCK_MAX_DRIFT))
+        self.offset = float(offset)
+
+    def to_host(self, device_times):
+        """Время прошивки (сек) -> time.monotonic() хоста"""
+        if self.offset is None:
+            return device_times
+        return device_times + self.offset + self.drift * (device_times - self._reference)
+
+
+class FrameStream:
+    """Нумерация кадров одного потока прошивки (сырой сигнал или огибающая)"""
+
+    def __init__(self, name):
+        self.name = name
+        self.expected_seq = None  # seq следующего ожидаемого отсчета
+        self.awaiting_resume = False  # Ждем первый кадр после CMD_RESUME
+        self.lost_samples = 0  # Отсчеты, которых уже нет в буфере прошивки
+        self.backlog_samples = 0  # Отсчеты, полученные догоном
+        self.restarts = 0  # Перезагрузки прошивки: seq начался заново
+
+    @property
+    def resume_seq(self):
+        return RESUME_LIVE if self.expected_seq is None else self.expected_seq
+
+
+class SensorChannel:
+    """Один датчик сессии: подключение, поток кадров, буфер отсчетов и калибровка
+
+    Все каналы работают на общем asyncio-цикле BLESensorManager. Режим замера
+    (is_reading, калибровка) общий для сессии и берется у менеджера.
+    """
+
+    def __init__(self, manager, index, address):
+        self.manager = manager
+        self.index = index
+        self.name = f"Датчик {index + 1}"
+        self.client = None
+        self.connector = create_connector(address, index)
+        self.is_connected = False
+        self.is_connecting = False
+        self.current_value = 0
+        self.is_streaming = False  # True - данные приходят уведомлениями, False - опрос
+        self.lead_off = False  # Электроды отключены (флаг кадра)
+        self.samples = SampleRingBuffer()  # Все отсчеты замера для экрана тренировки
+        self.raw_samples = SampleRingBuffer()  # Сырой сигнал в режиме 'both'
+
+        # Нумерация отсчетов для догона после обрыва связи
+        self.has_control = False  # Прошивка поддерживает CMD_RESUME и CMD_MODE
+        self.stream_mode = 'raw'  # Без характеристики управления - только сырой сигнал
+        self.raw = FrameStream('сигнал')
+        self.envelope = FrameStream('огибающая')
+
+        self.clock = DeviceClock()  # Время отсчетов прошивки -> время хоста
+
+        # Калибровка своя для каждого датчика
+        self.baseline = 0
+        self.max_value = 0
+        self.is_calibrated = False
+        self.calibration_data_relax = []
+        self.calibration_data_tension = []
+
+    @property
+    def address(self):
+        return self.connector.address
+
+    @property
+    def tension_stream(self):
+        """Поток, который показывается и сохраняется как напряжение мышцы"""
+        return self.raw if self.stream_mode == 'raw' else self.envelope
+
+    @property
+    def active_streams(self):
+        if self.stream_mode == 'both':
+            return [self.raw, self.envelope]
+        return [self.tension_stream]
+
+    @property
+    def lost_samples(self):
+        return sum(stream.lost_samples for stream in (self.raw, self.envelope))
+
+    @property
+    def backlog_samples(self):
+        return sum(stream.backlog_samples for stream in (self.raw, self.envelope))
+
+    async def _auto_connect(self, reconnect=False):
+        """Подключение к датчику через SensorConnector (кэш устройства, backoff)"""
+        if reconnect:
+            print(f"🔁 {self.name}: переподключение...")
+        else:
+            print(f"🔍 Запуск автоматического подключения к датчику по MAC: {self.address}")
+        self.is_connecting = True
+        self.manager.notify_update()
+
+        client = await self.connector.connect(disconnected_callback=self._on_disconnected)
+
+        if client is None:
+            self.is_connecting = False
+            self.manager.notify_update()
+            print(f"❌ НЕ УДАЛОСЬ подключиться к {self.address} после {CONNECT_MAX_ATTEMPTS} попыток")
+            return
+
+        self.client = client
+        self.is_connected = True
+        self.is_connecting = False
+        self.manager.notify_update()
+        print(f"🎉 УСПЕШНО подключено к датчику! MAC: {self.address}")
+
+        await self._start_streaming()
+
+    def _on_disconnected(self, client):
+        """Callback bleak: связь с датчиком потеряна - переподключаемся"""
+        if client is not self.client:
+            return
+
+        self.is_connected = False
+        self.is_streaming = False
+        self.manager.notify_update()
+        if self.manager.is_closing or self.is_connecting:
+            return
+
+        print(f"⚠️ {self.name}: связь потеряна, отсчеты копятся в буфере платы")
+        asyncio.run_coroutine_threadsafe(self._auto_connect(reconnect=True), self.manager.loop)
+
+    async def _start_streaming(self):
+        """Подписка на уведомления характеристики, если прошивка их поддерживает"""
+        self.is_streaming = False
+        if not USE_NOTIFICATIONS:
+            print("📖 Уведомления отключены - используется опрос датчика")
+            return
+
+        try:
+            characteristic = self.client.services.get_characteristic(CHARACTERISTIC_UUID)
+            if characteristic is None or 'notify' not in characteristic.properties:
+                print("📖 Характеристика не поддерживает notify - используется опрос датчика")
+                return
+
+            # До подписки: прошивка начнет передачу с отсчета, которого мы ждем
+            self.has_control = self.client.services.get_characteristic(CONTROL_CHARACTERISTIC_UUID) is not None
+            if self.has_control:
+                await self._set_stream_mode(STREAM_MODE)
+                await self._configure_acquisition()
+                await self._request_resume()
+
+            await self.client.start_notify(CHARACTERISTIC_UUID, self._on_notification)
+            self.is_streaming = True
+            print(f"📡 {self.name}: подписка на уведомления активна - потоковый режим")
+
+            # Переподключение во время замера - плата могла перезагрузиться
+            if self.manager.is_reading:
+                await self._set_acquisition(True)
+        except Exception as e:
+            print(f"❌ Ошибка подписки на уведомления: {e}, используется опрос датчика")
+
+    async def _set_stream_mode(self, mode):
+        """Выбирает потоки прошивки: сырой сигнал, огибающая или оба"""
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, CONTROL_MODE.pack(CMD_MODE, STREAM_MODES[mode]), response=True
+            )
+            self.stream_mode = mode
+            print(f"🎚️ {self.name}: режим передачи '{mode}'")
+        except Exception as e:
+            print(f"❌ Ошибка выбора режима передачи: {e}")
+
+    async def _configure_acquisition(self):
+        """Частота оцифровки и размер кадра (до CMD_START)"""
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, CONTROL_RATE.pack(CMD_RATE, SAMPLE_RATE), response=True
+            )
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, CONTROL_FRAME_SIZE.pack(CMD_FRAME_SIZE, FRAME_SIZE), response=True
+            )
+        except Exception as e:
+            print(f"❌ Ошибка настройки оцифровки: {e}")
+
+    async def _set_acquisition(self, running):
+        """Запускает или останавливает оцифровку на плате"""
+        if not self.has_control or not self.is_connected:
+            return
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, bytes([CMD_START if running else CMD_STOP]), response=True
+            )
+        except Exception as e:
+            print(f"❌ Ошибка {'запуска' if running else 'остановки'} оцифровки: {e}")
+
+    async def _request_resume(self):
+        """Просит прошивку передавать отсчеты начиная с expected_seq каждого потока"""
+        for stream in self.active_streams:
+            stream.awaiting_resume = True
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID,
+                CONTROL_RESUME.pack(CMD_RESUME, self.raw.resume_seq, self.envelope.resume_seq),
+                response=True
+            )
+            for stream in self.active_streams:
+                if stream.resume_seq != RESUME_LIVE:
+                    print(f"📥 {self.name}: запрошены отсчеты ({stream.name}) начиная с #{stream.resume_seq}")
+        except Exception as e:
+            for stream in self.active_streams:
+                stream.awaiting_resume = False
+            print(f"❌ Ошибка запроса пропущенных отсчетов: {e}")
+
+    def _on_notification(self, sender, data):
+        """Callback bleak: вызывается в потоке asyncio на каждое уведомление"""
+        self._process_sensor_data(data)
+
+    def _process_sensor_data(self, data):
+        """Разбор данных датчика: бинарный кадр или ASCII-значение старой прошивки"""
+        if not data:
+            return
+
+        if data[0] == FRAME_VERSION:
+            try:
+                frame = decode_sensor_frame(data)
+            except (ValueError, struct.error) as e:
+                print(f"❌ Неверный кадр датчика ({len(data)} байт): {e}")
+                return
+
+            self._process_frame(*frame)
+            return
+
+        sensor_value = data.decode('utf-8', errors='ignore').strip()
+
+        # Convert to integer and filter zero values
+        try:
+            value = float(sensor_value)
+            if value != 0:  # Accept only non-zero values
+                self._handle_samples((value,), (time.monotonic(),))
+        except ValueError:
+            print(f"❌ Неверный формат данных: {sensor_value}")
+
+    def _process_frame(self, flags, seq, timestamp_us, period_us, samples):
+        """Сшивает кадры потока по seq: отбрасывает повторы, запрашивает пропуски"""
+        stream = self.envelope if flags & FRAME_FLAG_ENVELOPE else self.raw
+        if stream not in self.active_streams:
+            return  # Кадр прошлого режима передачи
+
+        if stream.awaiting_resume:
+            if not flags & FRAME_FLAG_RESUMED:
+                return  # Отправлен до CMD_RESUME - прошивка передаст его заново
+            stream.awaiting_resume = False
+
+        if stream.expected_seq is not None:
+            gap = seq - stream.expected_seq
+            if gap > 0:
+                if self.has_control and not flags & FRAME_FLAG_RESUMED:
+                    # Кадры потерялись в эфире - просим передать их заново
+                    stream.awaiting_resume = True
+                    asyncio.ensure_future(self._request_resume())
+                    return
+                stream.lost_samples += gap
+                print(f"⚠️ {self.name}: потеряно отсчетов ({stream.name}): {gap} (всего {stream.lost_samples})")
+            elif gap < 0 and flags & FRAME_FLAG_RESUMED:
+                # Ответ на CMD_RESUME не может начаться раньше запрошенного seq -
+                # плата перезагрузилась, нумерация пошла с нуля
+                stream.restarts += 1
+                print(f"🔄 {self.name}: поток ({stream.name}) начат заново с #{seq} вместо #{stream.expected_seq}")
+            elif gap < 0:
+                # Повтор уже полученных отсчетов
+                if -gap >= len(samples):
+                    return
+                samples = samples[-gap:]
+                timestamp_us = (timestamp_us - gap * period_us) & 0xFFFFFFFF
+                seq = stream.expected_seq
+
+        stream.expected_seq = seq + len(samples)
+        lead_off = bool(flags & FRAME_FLAG_LEAD_OFF)
+        if lead_off != self.lead_off:
+            self.lead_off = lead_off
+            self.manager.notify_update()
+        if len(samples) == 0:
+            return
+        if flags & FRAME_FLAG_BACKLOG:
+            stream.backlog_samples += len(samples)
+
+        timestamps = self._host_timestamps(timestamp_us, period_us, len(samples), not flags & FRAME_FLAG_BACKLOG)
+        if stream is self.envelope:
+            # Нулевая огибающая - расслабленная мышца, а не пропуск
+            self._handle_samples(samples, timestamps)
+        elif stream is self.tension_stream:
+            nonzero = samples != 0  # Accept only non-zero values
+            self._handle_samples(samples[nonzero], timestamps[nonzero])
+        elif self.manager.is_reading and not self.manager.is_calibrating:
+            self.raw_samples.push(samples, timestamps)
+
+    def _host_timestamps(self, timestamp_us, period_us, count, live):
+        """Переводит время отсчетов прошивки во время хоста (time.monotonic)"""
+        first_us = self.clock.unwrap(timestamp_us)
+        device_times = (first_us + np.arange(count) * period_us) / 1e6
+
+        # Кадры догона приходят с опозданием и в оценке часов не участвуют
+        if live or self.clock.offset is None:
+            self.clock.observe(device_times[-1], time.monotonic())
+
+        return self.clock.to_host(device_times)
+
+    def _handle_samples(self, values, timestamps):
+        """Обновляет текущее значение, копит данные калибровки или замера"""
+        manager = self.manager
+        if len(values) == 0 or not manager.is_reading:
+            return
+
+        self.current_value = float(values[-1])
+
+        # Если идет калибровка, собираем данные в соответствующий массив
+        if manager.is_calibrating:
+            if manager.calibration_phase == 'relax':
+                self.calibration_data_relax.extend(float(v) for v in values)
+            elif manager.calibration_phase == 'tension':
+                self.calibration_data_tension.extend(float(v) for v in values)
+        else:
+            self.samples.push(values, timestamps)
+        self.manager.notify_update()
+
+    async def _read_sensor_data(self):
+        """Read data from BLE sensor (polling fallback for old firmware)"""
+        if not self.client or not self.is_connected or not self.manager.is_reading:
+            return
+
+        try:
+            data = await self.client.read_gatt_char(CHARACTERISTIC_UUID)
+            self._process_sensor_data(data)
+        except Exception as e:
+            print(f"❌ Ошибка чтения датчика: {e}")
+            self.is_connected = False
+            self.manager.notify_update()
+
+    def finish_calibration(self):
+        """Считает калибровку по собранным данным, возвращает True при успехе"""
+        if not (self.calibration_data_relax and self.calibration_data_tension):
+            print(f"❌ {self.name}: не удалось собрать данные для калибровки")
+            return False
+
+        # Для расслабления берем минимальное значение
+        self.baseline = min(self.calibration_data_relax)
+        # Для напряжения берем максимальное значение
+        self.max_value = max(self.calibration_data_tension)
+        self.is_calibrated = True
+
+        print(f"✅ {self.name}: калибровка завершена!")
+        print(f"   Базовый уровень (расслабление): {self.baseline:.2f}")
+        print(f"   Максимальное напряжение: {self.max_value:.2f}")
+        print(f"   Диапазон: {self.max_value - self.baseline:.2f}")
+        print(f"   Данных в фазе расслабления: {len(self.calibration_data_relax)}")
+        print(f"   Данных в фазе напряжения: {len(self.calibration_data_tension)}")
+        return True
+
+    def get_calibrated_value(self):
+        """Возвращает калиброванное значение (0-100%)"""
+        if not self.is_calibrated or self.max_value == self.baseline:
+            return self.current_value
+
+        # Нормализуем значение от 0 до 100%
+        normalized = (self.current_value - self.baseline) / (self.max_value - self.baseline) * 100
+        return max(0, min(100, normalized))  # Ограничиваем диапазон 0-100%
+
+    def calibrate_values(self, values):
+        """Калибрует массив отсчетов (0-100%), как get_calibrated_value"""
+        if not self.is_calibrated or self.max_value == self.baseline:
+            return values
+
+        normalized = (values - self.baseline) / (self.max_value - self.baseline) * 100
+        return np.clip(normalized, 0, 100)
+
+    async def sync_recordings(self, on_recording):
+        """Выгружает записи из флеша платы, on_recording(channel, id, rate, timestamps, values)"""
+        if not self.is_connected or self.client.services.get_characteristic(RECORDS_CHARACTERISTIC_UUID) is None:
+            return
+        try:
+            catalog = await self.client.read_gatt_char(RECORDS_CHARACTERISTIC_UUID)
+        except Exception as e:
+            print(f"❌ {self.name}: ошибка чтения списка записей: {e}")
+            return
+        if not catalog:
+            print(f"📭 {self.name}: записей на плате нет")
+
+        for record_id, size in RECORD_CATALOG_ENTRY.iter_unpack(catalog):
+            try:
+                data = await self._fetch_recording(record_id, size)
+                on_recording(self, record_id, *decode_recording(data))
+            except Exception as e:
+                print(f"❌ {self.name}: запись {record_id} не выгружена: {e}")
+
+    async def _fetch_recording(self, record_id, size):
+        started = time.monotonic()
+        data = None
+        transport = 'GATT'
+        if L2CAP_AVAILABLE:
+            try:
+                data = await self._fetch_recording_l2cap(record_id, size)
+                transport = 'L2CAP'
+            except Exception as e:
+                print(f"⚠️ {self.name}: L2CAP недоступен ({e}), выгрузка уведомлениями")
+        if data is None:
+            data = await self._fetch_recording_gatt(record_id, size)
+
+        elapsed = max(time.monotonic() - started, 1e-3)
+        print(f"📥 {self.name}: запись {record_id}, {size} байт за {elapsed:.1f} с "
+              f"({size / elapsed / 1024:.0f} КБ/с, {transport})")
+        return data
+
+    async def _fetch_recording_l2cap(self, record_id, size):
+        await self.client.write_gatt_char(
+            CONTROL_CHARACTERISTIC_UUID, CONTROL_SYNC.pack(CMD_SYNC, record_id, SYNC_L2CAP), response=True
+        )
+        data = await asyncio.get_running_loop().run_in_executor(
+            None, read_l2cap, self.address, SYNC_HEADER.size + size
+        )
+        if SYNC_HEADER.unpack_from(data) != (record_id, size):
+            raise ValueError('плата прислала другую запись')
+        return data[SYNC_HEADER.size:]
+
+    async def _fetch_recording_gatt(self, record_id, size):
+        data = bytearray(size)
+        received = 0
+        done = asyncio.Event()
+
+        def on_chunk(sender, chunk):
+            nonlocal received
+            offset, = SYNC_CHUNK.unpack_from(chunk)
+            payload = chunk[SYNC_CHUNK.size:]
+            if not payload:
+                done.set()  # Пустой кусок - конец файла
+                return
+            data[offset:offset + len(payload)] = payload
+            received += len(payload)
+
+        await self.client.start_notify(RECORDS_CHARACTERISTIC_UUID, on_chunk)
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, CONTROL_SYNC.pack(CMD_SYNC, record_id, SYNC_GATT), response=True
+            )
+            await asyncio.wait_for(done.wait(), SYNC_TIMEOUT + size / SYNC_MIN_RATE)
+        finally:
+            await self.client.stop_notify(RECORDS_CHARACTERISTIC_UUID)
+        if received != size:
+            raise ConnectionError(f'получено {received} из {size} байт')
+        return bytes(data)
+
+    async def _delete_recording(self, record_id):
+        try:
+            await self.client.write_gatt_char(
+                CONTROL_CHARACTERISTIC_UUID, CONTROL_RECORD_ID.pack(CMD_DELETE, record_id), response=True
+            )
+        except Exception as e:
+            print(f"❌ {self.name}: ошибка удаления записи {record_id}: {e}")
+
+    async def disconnect(self):
+        await self._set_acquisition(False)  # Плата не оцифровывает без клиента
+        try:
+            await self.client.disconnect()
+            self.is_connected = False
+            self.is_streaming = False
+            print(f"🔌 {self.name}: отключено от датчика")
+        except Exception as e:
+            print(f"❌ Ошибка отключения: {e}")
+
+
+class BLESensorManager:
+    """Сессия из одного или нескольких датчиков на общем asyncio-цикле"""
+
+    def __init__(self, addresses=SENSOR_ADDRESSES):
+        self.loop = None
+        self.thread = None
+        self.channels = [SensorChannel(self, index, address) for index, address in enumerate(addresses)]
+        self.is_reading = False
+        self.is_closing = False  # Отключение по команде - не переподключаемся
+        self.update_callback = None  # Новые данные или смена состояния (из потока BLE)
+        self._poll_future = None
+
+        # Добавлено для калибровки
+        self.is_calibrating = False
+        self.calibration_phase = None  # 'relax' или 'tension'
+        self.calibration_started = None  # time.monotonic() начала калибровки
+        self.calibration_phase_ends = None  # time.monotonic() конца текущей фазы
+        self.calibration_callback = None
+        self.calibration_phase_callback = None
+
+    @property
+    def primary(self):
+        """Основной датчик (первый в SENSOR_ADDRESSES)"""
+        return self.channels[0]
+
+    @property
+    def is_connected(self):
+        return any(channel.is_connected for channel in self.channels)
+
+    @property
+    def is_connecting(self):
+        return any(channel.is_connecting for channel in self.channels)
+
+    @property
+    def connected_channels(self):
+        return [channel for channel in self.channels if channel.is_connected]
+
+    @property
+    def is_calibrated(self):
+        """Все подключенные датчики откалиброваны"""
+        connected = self.connected_channels
+        return bool(connected) and all(channel.is_calibrated for channel in connected)
+
+    def start_ble_loop(self):
+        """НОВЫЙ МЕТОД: Start BLE in a separate thread"""
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self._run_ble_loop, daemon=True)
+            self.thread.start()
+
+            # Start automatic connection (все датчики подключаются параллельно)
+            for channel in self.channels:
+                asyncio.run_coroutine_threadsafe(channel._auto_connect(), self.loop)
+
+    def _run_ble_loop(self):
+        """Run the asyncio event loop"""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        except Exception as e:
+            print(f"❌ Ошибка в BLE loop: {e}")
+
+    def notify_update(self):
+        """Сообщает интерфейсу об изменениях; callback должен быть потокобезопасным"""
+        if self.update_callback:
+            self.update_callback()
+
+    def _start_polling(self):
+        """Запускает опрос датчиков без уведомлений на время замера"""
+        if self.loop and (self._poll_future is None or self._poll_future.done()):
+            self._poll_future = asyncio.run_coroutine_threadsafe(self._poll_sensors(), self.loop)
+
+    async def _poll_sensors(self):
+        """Read sensor data (only in polling mode)"""
+        while self.is_reading:
+            for channel in self.channels:
+                if channel.is_connected and not channel.is_streaming:
+                    await channel._read_sensor_data()
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def _set_acquisition(self, running):
+        """CMD_START/CMD_STOP всем датчикам с характеристикой управления"""
+        if self.loop:
+            for channel in self.channels:
+                asyncio.run_coroutine_threadsafe(channel._set_acquisition(running), self.loop)
+
+    def start_reading(self):
+        """Start reading data from sensor - ТОЛЬКО ПО КОМАНДЕ С КНОПКИ СТАРТ"""
+        self.is_reading = True
+        self._set_acquisition(True)
+        self._start_polling()
+        print("📊 НАЧАТ ЗАМЕР ДАННЫХ С ДАТЧИКА (кнопка СТАРТ)")
+
+    def stop_reading(self):
+        """Stop reading data from sensor"""
+        self.is_reading = False
+        self._set_acquisition(False)
+        print("⏸️ Остановлено чтение данных с датчика")
+
+    def start_calibration(self):
+        """Начать процесс калибровки на 30 секунд (все подключенные датчики сразу)"""
+        if self.is_connected and not self.is_calibrating:
+            self.is_calibrating = True
+            for channel in self.channels:
+                channel.calibration_data_relax = []
+                channel.calibration_data_tension = []
+            self.is_reading = True  # Включаем чтение данных для калибровки
+            self.calibration_started = time.monotonic()
+            self._set_acquisition(True)
+            self._start_polling()
+            print("🔧 Начало процесса калибровки на 30 секунд...")
+
+            # Запускаем сбор данных для калибровки
+            async def calibration_process():
+                # Фаза расслабления, затем фаза напряжения - по 15 секунд
+                for phase, message in (('relax', "🎯 Фаза расслабления"), ('tension', "💪 Фаза напряжения")):
+                    self.calibration_phase = phase
+                    self.calibration_phase_ends = time.monotonic() + CALIBRATION_PHASE_TIME
+                    print(f"{message}: {CALIBRATION_PHASE_TIME} секунд")
+                    if self.calibration_phase_callback:
+                        self.calibration_phase_callback(phase, CALIBRATION_PHASE_TIME)
+                    self.notify_update()
+
+                    # Собираем данные фазы
+                    await asyncio.sleep(CALIBRATION_PHASE_TIME)
+
+                # Останавливаем сбор данных
+                self.is_reading = False
+                self._set_acquisition(False)
+                self.is_calibrating = False
+                self.calibration_phase = None
+                self.calibration_phase_ends = None
+
+                # Анализируем собранные данные каждого датчика
+                calibrated = [channel for channel in self.connected_channels if channel.finish_calibration()]
+
+                # Вызываем callback для обновления интерфейса
+                if calibrated and self.calibration_callback:
+                    self.calibration_callback(calibrated)
+                self.notify_update()
+
+            # Запускаем процесс калибровки в отдельной задаче
+            asyncio.run_coroutine_threadsafe(calibration_process(), self.loop)
+
+    def sync_recordings(self, callback):
+        """Выгружает записи из флеша всех подключенных датчиков
+
+        callback(channel, record_id, rate, timestamps, values) вызывается в потоке
+        BLE на каждую запись; сохраненную запись удаляет delete_recording.
+        """
+        if self.loop:
+            for channel in self.connected_channels:
+                asyncio.run_coroutine_threadsafe(channel.sync_recordings(callback), self.loop)
+
+    def delete_recording(self, channel, record_id):
+        if self.loop:
+            asyncio.run_coroutine_threadsafe(channel._delete_recording(record_id), self.loop)
+
+    def set_calibration_callback(self, callback):
+        """Устанавливает callback для уведомления о завершении калибровки"""
+        self.calibration_callback = callback
+
+    def set_update_callback(self, callback):
+        """Устанавливает callback для уведомления о новых данных (None - отписка)"""
+        self.update_callback = callback
+
+    def set_calibration_phase_callback(self, callback):
+        """Устанавливает callback для уведомления о смене фазы калибровки"""
+        self.calibration_phase_callback = callback
+
+    def disconnect_sensor(self):
+        """Disconnect from sensor (only when app closes)"""
+        self.is_closing = True
+        self.is_reading = False
+        if self.loop:
+            for channel in self.connected_channels:
+                asyncio.run_coroutine_threadsafe(channel.disconnect(), self.loop)
+
+
+class WorkoutSession:
+    """Отсчеты тренировки по каналам с общей шкалой времени
+
+    Экран тренировки каждый кадр добавляет сюда все новые отсчеты каждого датчика.
+    Данные хранятся блоками NumPy (без словаря на отсчет), поэтому несколько
+    датчиков на полной частоте не нагружают поток интерфейса.
+    """
+
+    def __init__(self, channel_count):
+        self.channel_count = channel_count
+        self._timestamps = [[] for _ in range(channel_count)]
+        self._values = [[] for _ in range(channel_count)]
+        self._calibrated = [[] for _ in range(channel_count)]
+        self._raw_timestamps = [[] for _ in range(channel_count)]
+        self._raw = [[] for _ in range(channel_count)]
+        self.sample_counts = [0] * channel_count
+
+    def __len__(self):
+        return sum(self.sample_counts)
+
+    def extend(self, index, timestamps, values, calibrated):
+        """Добавляет блок отсчетов канала (время в секундах от начала тренировки)"""
+        if len(values) == 0:
+            return
+        self._timestamps[index].append(timestamps)
+        self._values[index].append(values)
+        self._calibrated[index].append(calibrated)
+        self.sample_counts[index] += len(values)
+
+    def extend_raw(self, index, timestamps, values):
+        """Добавляет блок сырого сигнала канала (режим передачи 'both')"""
+        if len(values) == 0:
+            return
+        self._raw_timestamps[index].append(timestamps)
+        self._raw[index].append(values)
+
+    def _joined(self, blocks, index):
+        chunks = blocks[index]
+        if not chunks:
+            return np.zeros(0)
+        if len(chunks) > 1:
+            # Склеиваем один раз, чтобы следующие вызовы не копировали заново
+            chunks[:] = [np.concatenate(chunks)]
+        return chunks[0]
+
+    def channel_data(self, index):
+        """(timestamps, tension, calibrated_tension) канала"""
+        return (
+            self._joined(self._timestamps, index),
+            self._joined(self._values, index),
+            self._joined(self._calibrated, index),
+        )
+
+    def raw_data(self, index):
+        """(timestamps, raw) канала - пустые массивы, если сырой сигнал не передавался"""
+        return self._joined(self._raw_timestamps, index), self._joined(self._raw, index)
+
+    def aligned(self, rate=100.0, calibrated=False):
+        """Каналы на общей сетке времени: (times, matrix[каналы x отсчеты])
+
+        Сетка покрывает интервал, где есть данные всех каналов с отсчетами;
+        значения линейно интерполируются на нее. Строка канала без отсчетов - NaN.
+        """
+        data = [self.channel_data(index) for index in range(self.channel_count)]
+        ranges = [(t[0], t[-1]) for t, _, _ in data if len(t)]
+        start = max((r[0] for r in ranges), default=0.0)
+        end = min((r[1] for r in ranges), default=-1.0)
+        if end < start:
+            return np.zeros(0), np.zeros((self.channel_count, 0))
+
+        times = np.arange(start, end + 0.5 / rate, 1.0 / rate)
+        matrix = np.full((self.channel_count, len(times)), np.nan)
+        for index, (t, v, c) in enumerate(data):
+            if len(t):
+                matrix[index] = np.interp(times, t, c if calibrated else v)
+        return times, matrix
@@ -0,0 +1,377 @@
+"""Имитация датчика для замеров и тестов без железа
+
+SimulatedSensor повторяет протокол прошивки (esp32/main.py): кадры потоков,
+команды характеристики управления и эхо. Радио моделируется событиями
+соединения BLE: раз в conn_interval уходит не больше notifications_per_event
+уведомлений, каждое не длиннее MTU; уведомления могут теряться в эфире, связь -
+обрываться. SimulatedClient - та часть BleakClient, которой пользуется
+SensorChannel, SimulatedConnector подменяет SensorConnector.
+
+Сигнал - синтетическая ЭМГ (SyntheticSignal) или запись по кругу (ReplaySignal):
+файл флеша платы или база тренировок приложения. Транспорт приложения выбирает
+sensor.TRANSPORT:
+
+    EMG_TRANSPORT=simulated EMG_SAMPLE_RATE=10000 EMG_DROPOUT=0.01 python main.py
+    EMG_TRANSPORT=replay EMG_REPLAY_FILE=workout_database.json python main.py
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+
+import numpy as np
+
+import sensor
+from sensor import (
+    CHARACTERISTIC_UUID, CONTROL_CHARACTERISTIC_UUID, ECHO_CHARACTERISTIC_UUID,
+    FRAME_HEADER, FRAME_VERSION, FRAME_FLAG_BACKLOG, FRAME_FLAG_RESUMED, FRAME_FLAG_ENVELOPE,
+    CMD_RESUME, CMD_MODE, CMD_START, CMD_STOP, CMD_RATE, CMD_FRAME_SIZE,
+    CONTROL_RESUME, CONTROL_RATE, RESUME_LIVE, STREAM_MODES, SAMPLE_RATE, RECORDING_MAGIC,
+    decode_recording,
+)
+
+ATT_OVERHEAD = 3
+FRAME_MAX_SAMPLES = 116  # Как в прошивке: (247 MTU - 3 ATT - 12 заголовок) / 2
+FRAME_TIMEOUT = 0.2  # Неполный кадр уходит через столько секунд
+ENVELOPE_DECIMATION = 20  # Отсчетов сигнала на отсчет огибающей
+RAW_BACKLOG = 10240  # Кольцевой буфер сигнала, ~10 с при 1 кГц (как _RAW_BACKLOG в esp32/main.py)
+ENVELOPE_BACKLOG = 512
+MAX_RATE = 10000  # Прошивка оцифровывает до 2000 Гц, имитация - для запаса конвейера
+CONNECT_DELAY = 0.2  # «Подключение» к имитации, сек
+
+
+class SyntheticSignal:
+    """Сигнал АЦП: покой и сокращения по 2 с, шум сокращения на постоянной составляющей"""
+
+    def __init__(self, seed=0):
+        self.rng = np.random.default_rng(seed)
+
+    def samples(self, start, count, rate):
+        t = (start + np.arange(count)) / rate
+        contraction = (t % 4.0) >= 2.0
+        noise = self.rng.normal(0.0, 1.0, count) * np.where(contraction, 150.0, 8.0)
+        return np.clip(512 + noise, 1, 1023).astype(np.uint16)
+
+
+class ReplaySignal:
+    """Запись по кругу с ее частотой, пересчитанной на частоту оцифровки"""
+
+    def __init__(self, rate, values):
+        if not len(values):
+            raise ValueError('пустая запись')
+        self.rate = rate
+        self.values = np.clip(np.asarray(values), 1, 1023).astype(np.uint16)
+
+    @classmethod
+    def load(cls, path):
+        """Файл записи флеша платы или база тренировок (последняя тренировка с данными)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data[:len(RECORDING_MAGIC)] == RECORDING_MAGIC:
+            rate, _, values = decode_recording(data)
+            return cls(rate, values)
+
+        database = json.loads(data.decode('utf-8'))
+        for workout in reversed(database.get('workouts', [])):
+            for channel in workout.get('channels') or [workout]:
+                # Сырой сигнал (режим 'both') ближе к тому, что оцифровывает плата
+                values, timestamps = channel.get('raw'), channel.get('raw_timestamps')
+                if not values:
+                    values, timestamps = channel.get('tension'), channel.get('timestamps')
+                if not values and channel.get('sensor_data'):
+                    # Старый формат базы: список {timestamp, tension}
+                    values = [data['tension'] for data in channel['sensor_data']]
+                    timestamps = [data['timestamp'] for data in channel['sensor_data']]
+                if values and timestamps and len(timestamps) > 1 and timestamps[-1] > timestamps[0]:
+                    return cls((len(timestamps) - 1) / (timestamps[-1] - timestamps[0]), values)
+        raise ValueError(f'в {path} нет тренировок с отсчетами')
+
+    def samples(self, start, count, rate):
+        index = ((start + np.arange(count)) * self.rate / rate).astype(np.int64)
+        return self.values[index % len(self.values)]
+
+
+class SimulatedStream:
+    """Кольцевой буфер одного потока прошивки: отсчеты, время micros(), seq"""
+
+    def __init__(self, size, flag):
+        self.values = np.zeros(size, np.uint16)
+        self.times = np.zeros(size, np.uint32)
+        self.size = size
+        self.flag = flag
+        self.head = 0  # seq следующего записываемого отсчета
+        self.send = 0  # seq следующего отсчета для передачи
+        self.pending_since = 0.0
+        self.pending_flags = 0
+
+    def push(self, values, times, now):
+        if len(values) == 0:
+            return
+        if self.head == self.send:
+            self.pending_since = now
+        index = (self.head + np.arange(len(values))) % self.size
+        self.values[index] = values
+        self.times[index] = times
+        self.head += len(values)
+
+    def resume(self, seq, now):
+        oldest = max(0, self.head - self.size)
+        if seq == RESUME_LIVE or seq > self.head:
+            seq = self.head
+        self.send = max(seq, oldest)
+        self.pending_since = now
+        self.pending_flags |= FRAME_FLAG_RESUMED
+
+    def frame(self, capacity, now):
+        """Следующий кадр потока или None, как transmit() прошивки"""
+        self.send = max(self.send, self.head - self.size)  # Старые отсчеты перезаписаны
+        pending = self.head - self.send
+        if pending >= capacity:
+            count = capacity
+        elif (pending or self.pending_flags) and now - self.pending_since >= FRAME_TIMEOUT:
+            count = pending
+        else:
+            return None
+
+        flags = self.pending_flags | self.flag
+        if pending - count >= capacity:
+            flags |= FRAME_FLAG_BACKLOG
+        index = (self.send + np.arange(count)) % self.size
+        times = self.times[index]
+        period = int(times[-1] - times[0]) // (count - 1) if count > 1 else 0
+        header = FRAME_HEADER.pack(
+            FRAME_VERSION, flags, self.send & 0xFFFFFFFF, int(times[0]) if count else 0, period
+        )
+        self.send += count
+        self.pending_flags = 0
+        self.pending_since = now
+        return header + self.values[index].astype('<u2').tobytes()
+
+
+class SimulatedSensor:
+    """Прошивка датчика с моделью радио: частота, MTU, интервал соединения"""
+
+    def __init__(self, rate=SAMPLE_RATE, mtu=247, conn_interval=0.015, notifications_per_event=6,
+                 signal=None, dropout=0.0, link_loss=0.0):
+        self.rate = rate
+        self.mtu = mtu
+        self.conn_interval = conn_interval
+        self.notifications_per_event = notifications_per_event
+        self.signal = signal or SyntheticSignal()
+        self.dropout = dropout  # Доля уведомлений, потерянных в эфире
+        self.link_loss = link_loss  # Средний интервал между обрывами связи, сек (0 - без обрывов)
+
+        self.raw = SimulatedStream(RAW_BACKLOG, 0)
+        self.envelope = SimulatedStream(ENVELOPE_BACKLOG, FRAME_FLAG_ENVELOPE)
+        self.mode = STREAM_MODES['raw']
+        self.frame_limit = FRAME_MAX_SAMPLES
+        self.acquiring = False
+        self.generated = 0  # Отсчетов сигнала с начала оцифровки
+        self.clock_started = 0.0  # Начало отсчета при текущей частоте
+        self.clock_samples = 0  # и отсчетов с него
+        self.device_us = 0  # micros() прошивки
+        self.envelope_pending = np.zeros(0, np.uint16)
+        self.events = 0  # Событий соединения
+        self.echoes = deque()  # (событие отправки, данные)
+        self.dropped = 0  # Уведомлений, потерянных в эфире
+        self.link_losses = 0
+
+    @property
+    def period_us(self):
+        return int(1e6 / self.rate)
+
+    @property
+    def capacity(self):
+        """Отсчетов в одном уведомлении при текущем MTU"""
+        return max(1, min((self.mtu - ATT_OVERHEAD - FRAME_HEADER.size) // 2, self.frame_limit))
+
+    @property
+    def streams(self):
+        if self.mode == STREAM_MODES['both']:
+            return [self.raw, self.envelope]
+        return [self.raw if self.mode == STREAM_MODES['raw'] else self.envelope]
+
+    def handle_control(self, data):
+        now = time.monotonic()
+        opcode = data[0] if data else None
+        if opcode == CMD_RESUME and len(data) >= 5:
+            _, raw_seq, envelope_seq = CONTROL_RESUME.unpack(data.ljust(CONTROL_RESUME.size, b'\xff'))
+            self.raw.resume(raw_seq, now)
+            self.envelope.resume(envelope_seq, now)
+        elif opcode == CMD_MODE and len(data) == 2 and data[1] in STREAM_MODES.values():
+            if data[1] != self.mode:
+                self.mode = data[1]
+                for stream in self.streams:
+                    stream.send = stream.head
+                    stream.pending_since = now
+        elif opcode == CMD_START:
+            if not self.acquiring:
+                self.acquiring = True
+                self.generated = 0
+                self.restart_clock(now)
+        elif opcode == CMD_STOP:
+            self.generate(now)
+            self.acquiring = False
+        elif opcode == CMD_RATE and len(data) == CONTROL_RATE.size:
+            self.generate(now)
+            self.rate = max(1, min(MAX_RATE, CONTROL_RATE.unpack(data)[1]))
+            self.restart_clock(now)
+        elif opcode == CMD_FRAME_SIZE and len(data) == 2:
+            self.frame_limit = data[1] if 0 < data[1] < FRAME_MAX_SAMPLES else FRAME_MAX_SAMPLES
+
+    def restart_clock(self, now):
+        self.clock_started = now
+        self.clock_samples = 0
+
+    def generate(self, now):
+        """Оцифровка: отсчеты сигнала и огибающей, которые прошивка сняла к моменту now"""
+        if not self.acquiring:
+            return
+        count = int((now - self.clock_started) * self.rate) - self.clock_samples
+        if count <= 0:
+            return
+        values = self.signal.samples(self.generated, count, self.rate)
+        times = (self.device_us + np.arange(count, dtype=np.int64) * self.period_us) & 0xFFFFFFFF
+        self.generated += count
+        self.clock_samples += count
+        self.device_us += count * self.period_us
+        self.raw.push(values, times, now)
+
+        # Огибающая: RMS без постоянной составляющей по ENVELOPE_DECIMATION отсчетам
+        pending = np.concatenate([self.envelope_pending, values])
+        blocks = len(pending) // ENVELOPE_DECIMATION
+        if blocks:
+            windows = pending[:blocks * ENVELOPE_DECIMATION].reshape(blocks, -1).astype(float)
+            rms = np.sqrt(((windows - 512.0) ** 2).mean(axis=1))
+            ends = times[-1] - (len(pending) - ENVELOPE_DECIMATION * np.arange(1, blocks + 1)) * self.period_us
+            self.envelope.push(rms.astype(np.uint16), ends & 0xFFFFFFFF, now)
+        self.envelope_pending = pending[blocks * ENVELOPE_DECIMATION:]
+
+    def queue_echo(self, data):
+        # Запись уходит в ближайшем событии соединения, ответ - в следующем
+        self.echoes.append((self.events + 2, bytes(data)))
+
+    async def run(self, client):
+        """События соединения, пока клиент подключен"""
+        next_event = time.monotonic()
+        while client.is_connected:
+            next_event += self.conn_interval
+            await asyncio.sleep(max(0.0, next_event - time.monotonic()))
+            now = time.monotonic()
+            self.events += 1
+            self.generate(now)
+            if self.link_loss and random.random() < self.conn_interval / self.link_loss:
+                # Обрыв связи: прошивка продолжает оцифровку в кольцевой буфер
+                self.link_losses += 1
+                client.drop()
+                return
+
+            budget = self.notifications_per_event
+            while budget and self.echoes and self.echoes[0][0] <= self.events:
+                client.notify(ECHO_CHARACTERISTIC_UUID, self.echoes.popleft()[1])
+                budget -= 1
+            if not client.is_subscribed(CHARACTERISTIC_UUID):
+                continue
+            for stream in self.streams:
+                while budget:
+                    frame = stream.frame(self.capacity, now)
+                    if frame is None:
+                        break
+                    if self.dropout and random.random() < self.dropout:
+                        self.dropped += 1  # Кадр ушел в эфир, но до хоста не дошел
+                    else:
+                        client.notify(CHARACTERISTIC_UUID, frame)
+                    budget -= 1
+
+
+class SimulatedCharacteristic:
+    def __init__(self, uuid, properties):
+        self.uuid = uuid
+        self.properties = properties
+
+
+class SimulatedServices:
+    def __init__(self, characteristics):
+        self._characteristics = {characteristic.uuid: characteristic for characteristic in characteristics}
+
+    def get_characteristic(self, uuid):
+        return self._characteristics.get(uuid)
+
+
+class SimulatedClient:
+    """Подключение к SimulatedSensor с интерфейсом BleakClient"""
+
+    def __init__(self, sensor, disconnected_callback=None):
+        self.sensor = sensor
+        self.is_connected = True
+        self.mtu_size = sensor.mtu
+        self.services = SimulatedServices([
+            SimulatedCharacteristic(CHARACTERISTIC_UUID, ['read', 'notify']),
+            SimulatedCharacteristic(CONTROL_CHARACTERISTIC_UUID, ['write']),
+            SimulatedCharacteristic(ECHO_CHARACTERISTIC_UUID, ['write', 'write-without-response', 'notify']),
+        ])
+        self._callbacks = {}
+        self._disconnected_callback = disconnected_callback
+        self._task = asyncio.ensure_future(sensor.run(self))
+
+    def is_subscribed(self, uuid):
+        return uuid in self._callbacks
+
+    def notify(self, uuid, data):
+        callback = self._callbacks.get(uuid)
+        if callback:
+            callback(self.services.get_characteristic(uuid), bytearray(data))
+
+    async def start_notify(self, uuid, callback):
+        self._callbacks[uuid] = callback
+
+    async def stop_notify(self, uuid):
+        self._callbacks.pop(uuid, None)
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        if response:
+            await asyncio.sleep(self.sensor.conn_interval)  # Подтверждение записи - следующее событие
+        if uuid == CONTROL_CHARACTERISTIC_UUID:
+            self.sensor.handle_control(bytes(data))
+        elif uuid == ECHO_CHARACTERISTIC_UUID:
+            self.sensor.queue_echo(data)
+
+    async def read_gatt_char(self, uuid):
+        return bytearray()
+
+    def drop(self):
+        """Связь потеряна: bleak вызывает disconnected_callback"""
+        self.is_connected = False
+        self._callbacks.clear()
+        if self._disconnected_callback:
+            self._disconnected_callback(self)
+
+    async def disconnect(self):
+        if not self.is_connected:
+            return
+        self._task.cancel()
+        self.drop()
+
+
+class SimulatedConnector:
+    """Вместо SensorConnector: подключение к SimulatedSensor без поиска и радио"""
+
+    def __init__(self, address, sensor):
+        self.address = address
+        self.sensor = sensor
+
+    async def connect(self, max_attempts=None, **client_kwargs):
+        await asyncio.sleep(CONNECT_DELAY)
+        return SimulatedClient(self.sensor, **client_kwargs)
+
+
+def create_connector(address, index):
+    """Подключение к имитации датчика по настройкам sensor.TRANSPORT"""
+    if sensor.TRANSPORT == 'replay':
+        signal = ReplaySignal.load(sensor.REPLAY_FILE)
+    else:
+        signal = SyntheticSignal(seed=index)
+    return SimulatedConnector(address, SimulatedSensor(
+        signal=signal, dropout=sensor.SIMULATED_DROPOUT, link_loss=sensor.SIMULATED_LINK_LOSS
+    ))
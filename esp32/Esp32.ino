@@ -1,16 +1,132 @@
 #include <BLEDevice.h>
 #include <BLEUtils.h>
 #include <BLEServer.h>
+#include <BLE2902.h>
 
 #define SERVICE_UUID        "4fafc201-1fb5-459e-8fcc-c5c9c331914b"
 #define CHARACTERISTIC_UUID "beb5483e-36e1-4688-b7f5-ea07361b26a8"
+#define CONTROL_UUID        "beb5483f-36e1-4688-b7f5-ea07361b26a8"
+#define ECHO_UUID           "beb54841-36e1-4688-b7f5-ea07361b26a8"
+
+// Бинарный кадр (little-endian), версия 1:
+//   uint8  version      FRAME_VERSION
+//   uint8  flags        FRAME_FLAG_*
+//   uint32 seq          порядковый номер первого отсчета в кадре (свой у каждого потока)
+//   uint32 timestamp_us micros() в момент первого отсчета
+//   uint16 period_us    средний интервал между отсчетами (0 - один отсчет)
+//   uint16 samples[N]   отсчеты, N = (длина - FRAME_HEADER_SIZE) / 2
+#define FRAME_VERSION        1
+#define FRAME_HEADER_SIZE    12
+#define FRAME_FLAG_LEAD_OFF  0x01
+#define FRAME_FLAG_BACKLOG   0x02  // кадр из буфера (догоняем после обрыва связи)
+#define FRAME_FLAG_RESUMED   0x04  // первый кадр потока после команды CMD_RESUME
+#define FRAME_FLAG_ENVELOPE  0x08  // отсчеты огибающей (RMS), а не сырой сигнал АЦП
+#define FRAME_MAX_SAMPLES    116   // (247 MTU - 3 ATT - 12 заголовок) / 2
+#define FRAME_TIMEOUT_MS     200   // не держим неполный кадр дольше этого времени
+#define FRAMES_PER_LOOP      8     // сколько кадров отправлять за итерацию при догоне
+
+// Команды характеристики управления: uint8 opcode + аргументы (little-endian)
+#define CMD_RESUME           0x01  // uint32 seq [+ uint32 seq огибающей] - продолжить передачу с этих отсчетов
+#define CMD_MODE             0x02  // uint8 mode - какие потоки передавать (MODE_*)
+#define CMD_START            0x03  // начать оцифровку (до этого Arduino и радио простаивают)
+#define CMD_STOP             0x04  // остановить оцифровку, буфер дослать
+#define CMD_RATE             0x05  // uint16 частота оцифровки, Гц
+#define CMD_FRAME_SIZE       0x06  // uint8 максимум отсчетов в кадре (0 - по MTU)
+#define RESUME_LIVE          0xFFFFFFFF  // seq для CMD_RESUME: только новые отсчеты
+
+// Режимы передачи: сырой сигнал для анализа, огибающая для обычной тренировки
+#define MODE_RAW             0
+#define MODE_ENVELOPE        1
+#define MODE_BOTH            2
+
+// Блоки отсчетов от arduino.ino по Serial2: заголовок как у кадра BLE + CRC-16,
+// COBS, разделитель 0x00 (формат описан в arduino.ino)
+#define UART_BAUD            500000
+#define UART_RX_BUFFER       1024
+#define UART_BLOCK_VERSION   1
+#define UART_HEADER_SIZE     12
+#define UART_MAX_SAMPLES     64
+#define UART_MAX_BLOCK       (UART_HEADER_SIZE + UART_MAX_SAMPLES * 2 + 2)
+#define UART_FLAG_LEAD_OFF   0x01
+#define UART_CMD_START       0x01  // команды для arduino.ino: opcode + аргументы + CRC-16
+#define UART_CMD_STOP        0x02
+#define UART_CMD_RATE        0x03
+#define STATS_INTERVAL_MS    5000
+
+// Огибающая: скользящее RMS сигнала без постоянной составляющей, целочисленно.
+// Одно значение на ENVELOPE_DECIMATION отсчетов (50 Гц при 1 кГц).
+#define ENVELOPE_WINDOW      64    // окно RMS, отсчетов
+#define ENVELOPE_DECIMATION  20
+#define ENVELOPE_DC_SHIFT    7     // постоянная времени фильтра DC: 2^7 отсчетов
+
+// Кольцевые буферы последних отсчетов: при обрыве связи отсчеты копятся здесь,
+// после переподключения клиент запрашивает недостающие через CMD_RESUME.
+#define BACKLOG_SIZE         10240  // ~10 с при 1 кГц
+#define ENVELOPE_BACKLOG     1024   // ~20 с при 50 Гц
+
+// Поток отсчетов для BLE: свой буфер, своя нумерация и свой флаг кадра
+struct SampleStream {
+    uint16_t* samples;
+    uint32_t* timesUs;
+    uint32_t size;
+    uint8_t frameFlag;
+    uint32_t headSeq;         // seq следующего записываемого отсчета
+    uint32_t sendSeq;         // seq следующего отсчета для передачи
+    uint32_t pendingSinceMs;  // когда в буфере появился первый неотправленный отсчет
+    uint8_t pendingFlags;
+};
 
 BLECharacteristic* pCharacteristic;
+BLE2902* pNotifyDescriptor;
 bool deviceConnected = false;
+uint16_t connId = 0;
+BLEServer* pServer = nullptr;
+
+uint16_t backlogSamples[BACKLOG_SIZE];
+uint32_t backlogTimesUs[BACKLOG_SIZE];
+uint16_t envelopeSamples[ENVELOPE_BACKLOG];
+uint32_t envelopeTimesUs[ENVELOPE_BACKLOG];
+
+SampleStream rawStream = {backlogSamples, backlogTimesUs, BACKLOG_SIZE, 0};
+SampleStream envelopeStream = {envelopeSamples, envelopeTimesUs, ENVELOPE_BACKLOG, FRAME_FLAG_ENVELOPE};
+uint8_t streamMode = MODE_RAW;  // старые клиенты ждут сырой сигнал
+
+volatile bool resumeRequested = false;
+volatile uint32_t resumeSeq = 0;
+volatile uint32_t resumeEnvelopeSeq = RESUME_LIVE;
+volatile int16_t requestedMode = -1;
+volatile int8_t requestedAcquisition = -1;  // 1 - CMD_START, 0 - CMD_STOP
+volatile uint16_t requestedRate = 0;
+volatile int16_t requestedFrameSize = -1;
+uint16_t frameLimit = FRAME_MAX_SAMPLES;
+bool acquiring = false;
+
+uint8_t frameBuffer[FRAME_HEADER_SIZE + FRAME_MAX_SAMPLES * 2];
+
+// Состояние огибающей
+int32_t dcLevel = 0;  // постоянная составляющая, << ENVELOPE_DC_SHIFT
+bool dcReady = false;
+uint32_t squares[ENVELOPE_WINDOW];
+uint32_t squaresSum = 0;
+uint32_t envelopeCount = 0;
+
+// Прием блоков с Serial2: байты копятся до разделителя, без String и malloc
+uint8_t rxBuffer[UART_MAX_BLOCK + UART_MAX_BLOCK / 254 + 1];
+size_t rxLength = 0;
+bool rxOverflow = false;     // блок длиннее буфера - пропускаем до разделителя
+bool uartSynced = false;     // seq следующего блока известен
+uint32_t uartExpectedSeq = 0;
+
+// Статистика линии Arduino -> ESP32
+uint32_t uartBlocks = 0;
+uint32_t uartErrors = 0;     // ошибки COBS, CRC, длины
+uint32_t uartLostSamples = 0;
+uint32_t statsSinceMs = 0;
 
 class MyServerCallbacks: public BLEServerCallbacks {
-    void onConnect(BLEServer* pServer) {
+    void onConnect(BLEServer* pServer, esp_ble_gatts_cb_param_t* param) {
         deviceConnected = true;
+        connId = param->connect.conn_id;
         Serial.println("Устройство подключено");
     }
 
@@ -21,23 +137,426 @@ class MyServerCallbacks: public BLEServerCallbacks {
     }
 };
 
+static uint32_t getU32(const uint8_t* p) {
+    return p[0] | (p[1] << 8) | (p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+// Эхо для замера задержки (GUI/ble_benchmark.py): записанное значение сразу
+// возвращается уведомлением той же характеристики
+class EchoCallbacks: public BLECharacteristicCallbacks {
+    void onWrite(BLECharacteristic* pCharacteristic) {
+        pCharacteristic->notify();
+    }
+};
+
+class ControlCallbacks: public BLECharacteristicCallbacks {
+    void onWrite(BLECharacteristic* pCharacteristic) {
+        const uint8_t* data = pCharacteristic->getData();
+        size_t length = pCharacteristic->getLength();
+        // Команды применяются в loop(), чтобы не трогать буферы из задачи BLE
+        if (length >= 5 && data[0] == CMD_RESUME) {
+            resumeSeq = getU32(data + 1);
+            resumeEnvelopeSeq = length >= 9 ? getU32(data + 5) : RESUME_LIVE;
+            resumeRequested = true;
+        } else if (length == 2 && data[0] == CMD_MODE && data[1] <= MODE_BOTH) {
+            requestedMode = data[1];
+        } else if (length == 1 && data[0] == CMD_START) {
+            requestedAcquisition = 1;
+        } else if (length == 1 && data[0] == CMD_STOP) {
+            requestedAcquisition = 0;
+        } else if (length == 3 && data[0] == CMD_RATE) {
+            requestedRate = data[1] | (data[2] << 8);
+        } else if (length == 2 && data[0] == CMD_FRAME_SIZE) {
+            requestedFrameSize = data[1];
+        }
+    }
+};
+
+static uint16_t getU16(const uint8_t* p) {
+    return p[0] | (p[1] << 8);
+}
+
+static void putU16(uint8_t* p, uint16_t v) {
+    p[0] = v & 0xFF;
+    p[1] = v >> 8;
+}
+
+static void putU32(uint8_t* p, uint32_t v) {
+    p[0] = v & 0xFF;
+    p[1] = (v >> 8) & 0xFF;
+    p[2] = (v >> 16) & 0xFF;
+    p[3] = v >> 24;
+}
+
+// Сколько отсчетов помещается в одно уведомление при текущем MTU
+uint16_t frameCapacity() {
+    if (!deviceConnected) {
+        return frameLimit;
+    }
+    uint16_t mtu = pServer->getPeerMTU(connId);
+    if (mtu < FRAME_HEADER_SIZE + 3 + 2) {
+        return 1;
+    }
+    uint16_t capacity = (mtu - 3 - FRAME_HEADER_SIZE) / 2;
+    return capacity < frameLimit ? capacity : frameLimit;
+}
+
+bool streamEnabled(const SampleStream& stream) {
+    if (&stream == &envelopeStream) {
+        return streamMode != MODE_RAW;
+    }
+    return streamMode != MODE_ENVELOPE;
+}
+
+void resumeStream(SampleStream& stream, uint32_t seq) {
+    uint32_t oldest = stream.headSeq > stream.size ? stream.headSeq - stream.size : 0;
+
+    if (seq == RESUME_LIVE || (int32_t)(seq - stream.headSeq) > 0) {
+        seq = stream.headSeq;
+    } else if ((int32_t)(seq - oldest) < 0) {
+        seq = oldest;  // часть отсчетов уже перезаписана
+    }
+    stream.sendSeq = seq;
+    stream.pendingSinceMs = millis();
+    stream.pendingFlags |= FRAME_FLAG_RESUMED;
+}
+
+void applyResume() {
+    resumeRequested = false;
+    resumeStream(rawStream, resumeSeq);
+    resumeStream(envelopeStream, resumeEnvelopeSeq);
+}
+
+void applyMode() {
+    uint8_t mode = requestedMode;
+    requestedMode = -1;
+    if (mode == streamMode) {
+        return;
+    }
+    streamMode = mode;
+
+    // Включенный поток начинаем с новых отсчетов, без накопленного буфера
+    SampleStream* streams[] = {&rawStream, &envelopeStream};
+    for (SampleStream* stream : streams) {
+        if (streamEnabled(*stream)) {
+            stream->sendSeq = stream->headSeq;
+            stream->pendingSinceMs = millis();
+        }
+    }
+    Serial.printf("Режим передачи: %u\n", streamMode);
+}
+
+// Отправляет кадр из буфера потока начиная с sendSeq
+void sendFrame(SampleStream& stream, uint16_t count) {
+    uint32_t firstUs = stream.timesUs[stream.sendSeq % stream.size];
+    uint16_t periodUs = 0;
+    if (count > 1) {
+        uint32_t lastUs = stream.timesUs[(stream.sendSeq + count - 1) % stream.size];
+        periodUs = (lastUs - firstUs) / (count - 1);
+    }
+
+    uint8_t flags = stream.pendingFlags | stream.frameFlag;
+    if (stream.headSeq - (stream.sendSeq + count) >= frameCapacity()) {
+        flags |= FRAME_FLAG_BACKLOG;
+    }
+
+    frameBuffer[0] = FRAME_VERSION;
+    frameBuffer[1] = flags;
+    putU32(frameBuffer + 2, stream.sendSeq);
+    putU32(frameBuffer + 6, firstUs);
+    putU16(frameBuffer + 10, periodUs);
+    for (uint16_t i = 0; i < count; i++) {
+        putU16(frameBuffer + FRAME_HEADER_SIZE + i * 2, stream.samples[(stream.sendSeq + i) % stream.size]);
+    }
+
+    // Обновляем значение характеристики
+    pCharacteristic->setValue(frameBuffer, FRAME_HEADER_SIZE + count * 2);
+    pCharacteristic->notify();
+
+    stream.sendSeq += count;
+    stream.pendingFlags = 0;
+    stream.pendingSinceMs = millis();
+}
+
+// Передает накопленные отсчеты потока полными кадрами, неполный - по таймауту
+void transmitStream(SampleStream& stream) {
+    if (stream.headSeq - stream.sendSeq > stream.size) {
+        stream.sendSeq = stream.headSeq - stream.size;  // самые старые отсчеты уже перезаписаны
+    }
+
+    uint16_t capacity = frameCapacity();
+    for (int i = 0; i < FRAMES_PER_LOOP; i++) {
+        uint32_t pending = stream.headSeq - stream.sendSeq;
+        if (pending >= capacity) {
+            sendFrame(stream, capacity);
+        } else if ((pending > 0 || stream.pendingFlags) && millis() - stream.pendingSinceMs >= FRAME_TIMEOUT_MS) {
+            sendFrame(stream, pending);
+            break;
+        } else {
+            break;
+        }
+    }
+}
+
+void transmitPending() {
+    if (!deviceConnected || !pNotifyDescriptor->getNotifications()) {
+        return;  // отсчеты копятся в буфере до подписки клиента
+    }
+    if (streamEnabled(rawStream)) {
+        transmitStream(rawStream);
+    }
+    if (streamEnabled(envelopeStream)) {
+        transmitStream(envelopeStream);
+    }
+}
+
+void addStreamSample(SampleStream& stream, uint16_t value, uint32_t timeUs) {
+    if (stream.headSeq == stream.sendSeq) {
+        stream.pendingSinceMs = millis();
+    }
+    stream.samples[stream.headSeq % stream.size] = value;
+    stream.timesUs[stream.headSeq % stream.size] = timeUs;
+    stream.headSeq++;
+}
+
+uint16_t isqrt(uint32_t value) {
+    uint32_t root = 0;
+    uint32_t bit = 1UL << 30;
+    while (bit > value) {
+        bit >>= 2;
+    }
+    while (bit != 0) {
+        if (value >= root + bit) {
+            value -= root + bit;
+            root = (root >> 1) + bit;
+        } else {
+            root >>= 1;
+        }
+        bit >>= 2;
+    }
+    return root;
+}
+
+// Обновляет скользящее RMS, каждые ENVELOPE_DECIMATION отсчетов - значение огибающей
+void updateEnvelope(uint16_t value, uint32_t timeUs) {
+    if (!dcReady) {
+        dcLevel = (int32_t)value << ENVELOPE_DC_SHIFT;
+        dcReady = true;
+    }
+    dcLevel += value - (dcLevel >> ENVELOPE_DC_SHIFT);
+    int32_t ac = value - (dcLevel >> ENVELOPE_DC_SHIFT);
+
+    uint32_t square = ac * ac;
+    uint32_t slot = envelopeCount % ENVELOPE_WINDOW;
+    squaresSum += square - squares[slot];
+    squares[slot] = square;
+    envelopeCount++;
+
+    if (envelopeCount % ENVELOPE_DECIMATION == 0) {
+        uint32_t filled = envelopeCount < ENVELOPE_WINDOW ? envelopeCount : ENVELOPE_WINDOW;
+        addStreamSample(envelopeStream, isqrt(squaresSum / filled), timeUs);
+    }
+}
+
+void addSample(uint16_t value, uint32_t timeUs) {
+    addStreamSample(rawStream, value, timeUs);
+    updateEnvelope(value, timeUs);
+}
+
+uint16_t crc16(const uint8_t* data, size_t length);
+size_t cobsEncode(const uint8_t* data, size_t length, uint8_t* out);
+
+// Команда для arduino.ino по Serial2 (кадр COBS с CRC-16, как блоки отсчетов)
+void sendUartCommand(uint8_t opcode, uint16_t arg, uint8_t argLength) {
+    uint8_t command[5];
+    uint8_t encoded[8];
+    size_t length = 0;
+    command[length++] = opcode;
+    if (argLength) {
+        putU16(command + length, arg);
+        length += 2;
+    }
+    putU16(command + length, crc16(command, length));
+    size_t size = cobsEncode(command, length + 2, encoded);
+    encoded[size++] = 0;
+    Serial2.write(encoded, size);
+}
+
+void setAcquisition(bool start) {
+    acquiring = start;
+    sendUartCommand(start ? UART_CMD_START : UART_CMD_STOP, 0, 0);
+    Serial.println(start ? "Оцифровка запущена" : "Оцифровка остановлена");
+}
+
+void applyControl() {
+    if (requestedRate) {
+        sendUartCommand(UART_CMD_RATE, requestedRate, 2);
+        Serial.printf("Частота оцифровки: %u Гц\n", requestedRate);
+        requestedRate = 0;
+    }
+    if (requestedFrameSize >= 0) {
+        uint16_t size = requestedFrameSize;
+        frameLimit = size > 0 && size < FRAME_MAX_SAMPLES ? size : FRAME_MAX_SAMPLES;
+        requestedFrameSize = -1;
+    }
+    if (requestedAcquisition >= 0) {
+        setAcquisition(requestedAcquisition == 1);
+        requestedAcquisition = -1;
+    }
+}
+
+uint16_t crc16(const uint8_t* data, size_t length) {
+    uint16_t crc = 0xFFFF;
+    for (size_t i = 0; i < length; i++) {
+        crc ^= (uint16_t)data[i] << 8;
+        for (uint8_t bit = 0; bit < 8; bit++) {
+            crc = crc & 0x8000 ? (crc << 1) ^ 0x1021 : crc << 1;
+        }
+    }
+    return crc;
+}
+
+// COBS: убирает нули из данных, 0x00 остается только разделителем
+size_t cobsEncode(const uint8_t* data, size_t length, uint8_t* out) {
+    size_t codeIndex = 0;
+    size_t outIndex = 1;
+    uint8_t code = 1;
+    for (size_t i = 0; i < length; i++) {
+        if (data[i] != 0) {
+            out[outIndex++] = data[i];
+            code++;
+        }
+        if (data[i] == 0 || code == 0xFF) {
+            out[codeIndex] = code;
+            codeIndex = outIndex++;
+            code = 1;
+        }
+    }
+    out[codeIndex] = code;
+    return outIndex;
+}
+
+// Декодирует COBS на месте, возвращает длину блока (0 - ошибка)
+size_t cobsDecode(uint8_t* data, size_t length) {
+    size_t in = 0;
+    size_t out = 0;
+    while (in < length) {
+        uint8_t code = data[in++];
+        if (code == 0 || in + code - 1 > length) {
+            return 0;
+        }
+        for (uint8_t i = 1; i < code; i++) {
+            data[out++] = data[in++];
+        }
+        if (code != 0xFF && in < length) {
+            data[out++] = 0;
+        }
+    }
+    return out;
+}
+
+// Проверяет блок от Arduino и кладет отсчеты в буфер передачи BLE
+void handleUartBlock(uint8_t* data, size_t encodedLength) {
+    size_t length = cobsDecode(data, encodedLength);
+    if (length < UART_HEADER_SIZE + 2 || (length - UART_HEADER_SIZE) % 2 != 0 ||
+        data[0] != UART_BLOCK_VERSION || crc16(data, length - 2) != getU16(data + length - 2)) {
+        uartErrors++;
+        return;
+    }
+    uartBlocks++;
+
+    uint8_t flags = data[1];
+    uint32_t seq = getU32(data + 2);
+    uint32_t firstUs = getU32(data + 6);
+    uint16_t periodUs = getU16(data + 10);
+    uint16_t count = (length - UART_HEADER_SIZE - 2) / 2;
+
+    if (uartSynced && seq != uartExpectedSeq) {
+        uartLostSamples += seq - uartExpectedSeq;  // блок потерян на линии
+    }
+    uartSynced = true;
+    uartExpectedSeq = seq + count;
+
+    if (flags & UART_FLAG_LEAD_OFF) {
+        // Электроды отключены (L0+/L0-) - передаем флагом следующего кадра
+        rawStream.pendingFlags |= FRAME_FLAG_LEAD_OFF;
+        envelopeStream.pendingFlags |= FRAME_FLAG_LEAD_OFF;
+        return;
+    }
+    for (uint16_t i = 0; i < count; i++) {
+        addSample(getU16(data + UART_HEADER_SIZE + i * 2), firstUs + i * periodUs);
+    }
+}
+
+// Разбирает все принятые байты, не дожидаясь конца блока
+void readUart() {
+    int available = Serial2.available();
+    while (available-- > 0) {
+        uint8_t b = Serial2.read();
+        if (b == 0) {
+            if (!rxOverflow && rxLength > 0) {
+                handleUartBlock(rxBuffer, rxLength);
+            } else if (rxOverflow) {
+                uartErrors++;
+            }
+            rxLength = 0;
+            rxOverflow = false;
+        } else if (rxLength < sizeof(rxBuffer)) {
+            rxBuffer[rxLength++] = b;
+        } else {
+            rxOverflow = true;
+        }
+    }
+}
+
+void printStats() {
+    if (!acquiring || millis() - statsSinceMs < STATS_INTERVAL_MS) {
+        return;
+    }
+    statsSinceMs = millis();
+    Serial.printf("UART: блоков %u, ошибок %u, потеряно отсчетов %u, отсчетов %u\n",
+                  uartBlocks, uartErrors, uartLostSamples, rawStream.headSeq);
+}
+
 void setup() {
     Serial.begin(115200);
-    Serial2.begin(115200, SERIAL_8N1, 16, 17);
-    
+    Serial2.setRxBufferSize(UART_RX_BUFFER);
+    Serial2.begin(UART_BAUD, SERIAL_8N1, 16, 17);
+    setAcquisition(false);  // Arduino могла остаться запущенной после перезагрузки ESP32
+
     BLEDevice::init("");
-    BLEServer* pServer = BLEDevice::createServer();
+    BLEDevice::setMTU(247);
+    pServer = BLEDevice::createServer();
     pServer->setCallbacks(new MyServerCallbacks());
-    
+
     BLEService* pService = pServer->createService(SERVICE_UUID);
-    
+
     pCharacteristic = pService->createCharacteristic(
         CHARACTERISTIC_UUID,
-        BLECharacteristic::PROPERTY_READ
+        BLECharacteristic::PROPERTY_READ |
+        BLECharacteristic::PROPERTY_NOTIFY
+    );
+    // CCCD дескриптор нужен клиенту для подписки на уведомления
+    pNotifyDescriptor = new BLE2902();
+    pCharacteristic->addDescriptor(pNotifyDescriptor);
+
+    BLECharacteristic* pControl = pService->createCharacteristic(
+        CONTROL_UUID,
+        BLECharacteristic::PROPERTY_WRITE
     );
-    
+    pControl->setCallbacks(new ControlCallbacks());
+
+    BLECharacteristic* pEcho = pService->createCharacteristic(
+        ECHO_UUID,
+        BLECharacteristic::PROPERTY_WRITE |
+        BLECharacteristic::PROPERTY_WRITE_NR |
+        BLECharacteristic::PROPERTY_NOTIFY
+    );
+    pEcho->addDescriptor(new BLE2902());
+    pEcho->setCallbacks(new EchoCallbacks());
+
     pService->start();
-    
+
     BLEAdvertising* pAdvertising = BLEDevice::getAdvertising();
     pAdvertising->addServiceUUID(SERVICE_UUID);
     pAdvertising->setScanResponse(true);
@@ -45,17 +564,15 @@ void setup() {
 }
 
 void loop() {
-    if (Serial2.available()) {
-        String incomingData = Serial2.readStringUntil('\n');
-        if (incomingData.length() > 0) {
-            float Value = incomingData.toFloat();
-            
-            // Обновляем значение характеристики
-            String dataStr = String(Value);
-            pCharacteristic->setValue(dataStr.c_str());
-        
-            Serial.println(Value);
-        }
-    }
-    delay(100);
-}
\ No newline at end of file
+    readUart();
+
+    applyControl();
+    if (requestedMode >= 0) {
+        applyMode();
+    }
+    if (resumeRequested) {
+        applyResume();
+    }
+    transmitPending();
+    printStats();
+}
@@ -2,21 +2,251 @@
 #define L0p 10
 #define port A0
 
-void setup() 
+// Частота оцифровки ЭМГ (Timer1) по умолчанию, ESP32 может изменить командой
+#define SAMPLE_RATE_HZ   1000
+#define MIN_RATE_HZ      100
+#define MAX_RATE_HZ      2000
+#define SERIAL_BAUD      500000
+
+// Кольцевой буфер отсчетов между прерыванием таймера и loop()
+#define RING_SIZE        256  // степень двойки, ~256 мс при 1 кГц
+#define LEAD_OFF_BIT     0x8000  // старший бит отсчета: электроды отключены
+
+// Блок отсчетов для ESP32 - тот же заголовок, что у кадра BLE (little-endian):
+//   uint8  version      BLOCK_VERSION
+//   uint8  flags        BLOCK_FLAG_*
+//   uint32 seq          порядковый номер первого отсчета в блоке
+//   uint32 timestamp_us micros() в момент первого отсчета
+//   uint16 period_us    интервал между отсчетами
+//   uint16 samples[N]   отсчеты АЦП (10 бит)
+//   uint16 crc          CRC-16/CCITT-FALSE всех предыдущих байт
+// Блок кодируется COBS и завершается байтом 0x00 - приемник находит границу
+// блока после любой ошибки на линии.
+#define BLOCK_VERSION       1
+#define BLOCK_HEADER_SIZE   12
+#define BLOCK_FLAG_LEAD_OFF 0x01
+#define BLOCK_SAMPLES       32
+
+// Команды от ESP32 в обратную сторону: uint8 opcode + аргументы + uint16 crc,
+// так же COBS и 0x00. Оцифровка идет только между CMD_START и CMD_STOP.
+#define CMD_START           0x01
+#define CMD_STOP            0x02
+#define CMD_RATE            0x03  // uint16 частота, Гц
+#define CMD_MAX_SIZE        8
+
+volatile uint16_t ring[RING_SIZE];
+volatile uint32_t headSeq = 0;      // seq следующего отсчета (пишет прерывание)
+volatile uint32_t headTimeUs = 0;   // micros() последнего отсчета
+volatile bool adcStarted = false;
+uint32_t tailSeq = 0;               // seq следующего отсчета для передачи
+uint16_t samplePeriodUs = 1000000UL / SAMPLE_RATE_HZ;
+bool sampling = false;
+
+uint8_t command[CMD_MAX_SIZE + 2];
+uint8_t commandLength = 0;
+
+uint8_t block[BLOCK_HEADER_SIZE + BLOCK_SAMPLES * 2 + 2];
+uint8_t encoded[sizeof(block) + sizeof(block) / 254 + 2];
+
+// Прерывание Timer1 каждый период оцифровки: забираем результат преобразования,
+// запущенного в прошлом прерывании, и запускаем следующее - без ожидания АЦП
+ISR(TIMER1_COMPA_vect) {
+  if (adcStarted) {
+    uint16_t value = ADC;
+    if (digitalRead(L0m) == 1 && digitalRead(L0p) == 1) {
+      value |= LEAD_OFF_BIT;
+    }
+    ring[headSeq & (RING_SIZE - 1)] = value;
+    headSeq++;
+    headTimeUs = micros();
+  }
+  ADCSRA |= _BV(ADSC);
+  adcStarted = true;
+}
+
+static void putU16(uint8_t* p, uint16_t v) {
+  p[0] = v & 0xFF;
+  p[1] = v >> 8;
+}
+
+static void putU32(uint8_t* p, uint32_t v) {
+  p[0] = v & 0xFF;
+  p[1] = (v >> 8) & 0xFF;
+  p[2] = (v >> 16) & 0xFF;
+  p[3] = v >> 24;
+}
+
+uint16_t crc16(const uint8_t* data, size_t length) {
+  uint16_t crc = 0xFFFF;
+  for (size_t i = 0; i < length; i++) {
+    crc ^= (uint16_t)data[i] << 8;
+    for (uint8_t bit = 0; bit < 8; bit++) {
+      crc = crc & 0x8000 ? (crc << 1) ^ 0x1021 : crc << 1;
+    }
+  }
+  return crc;
+}
+
+// COBS: убирает нули из данных, 0x00 остается только разделителем блоков
+size_t cobsEncode(const uint8_t* data, size_t length, uint8_t* out) {
+  size_t codeIndex = 0;
+  size_t outIndex = 1;
+  uint8_t code = 1;
+  for (size_t i = 0; i < length; i++) {
+    if (data[i] != 0) {
+      out[outIndex++] = data[i];
+      code++;
+    }
+    if (data[i] == 0 || code == 0xFF) {
+      out[codeIndex] = code;
+      codeIndex = outIndex++;
+      code = 1;
+    }
+  }
+  out[codeIndex] = code;
+  return outIndex;
+}
+
+// Декодирует COBS на месте, возвращает длину (0 - ошибка)
+size_t cobsDecode(uint8_t* data, size_t length) {
+  size_t in = 0;
+  size_t out = 0;
+  while (in < length) {
+    uint8_t code = data[in++];
+    if (code == 0 || in + code - 1 > length) {
+      return 0;
+    }
+    for (uint8_t i = 1; i < code; i++) {
+      data[out++] = data[in++];
+    }
+    if (code != 0xFF && in < length) {
+      data[out++] = 0;
+    }
+  }
+  return out;
+}
+
+void setupSampler() {
+  analogRead(port);  // настраивает опорное напряжение и канал АЦП
+
+  noInterrupts();
+  TCCR1A = 0;
+  TCCR1B = _BV(WGM12) | _BV(CS11);  // CTC, делитель 8
+  TCNT1 = 0;
+  OCR1A = F_CPU / 8 / SAMPLE_RATE_HZ - 1;
+  TIMSK1 = 0;  // ждем CMD_START
+  interrupts();
+}
+
+void startSampling() {
+  noInterrupts();
+  adcStarted = false;
+  TCNT1 = 0;
+  TIMSK1 = _BV(OCIE1A);
+  interrupts();
+  sampling = true;
+}
+
+void stopSampling() {
+  noInterrupts();
+  TIMSK1 = 0;
+  interrupts();
+  sampling = false;
+}
+
+void setRate(uint16_t rate) {
+  rate = constrain(rate, MIN_RATE_HZ, MAX_RATE_HZ);
+  noInterrupts();
+  OCR1A = F_CPU / 8 / rate - 1;
+  TCNT1 = 0;
+  tailSeq = headSeq;  // отсчеты на старой частоте не смешиваем с новыми
+  interrupts();
+  samplePeriodUs = 1000000UL / rate;
+}
+
+void handleCommand(uint8_t* data, size_t encodedLength) {
+  size_t length = cobsDecode(data, encodedLength);
+  if (length < 3 || crc16(data, length - 2) != (data[length - 2] | (data[length - 1] << 8))) {
+    return;
+  }
+  if (data[0] == CMD_START) {
+    startSampling();
+  } else if (data[0] == CMD_STOP) {
+    stopSampling();
+  } else if (data[0] == CMD_RATE && length == 5) {
+    setRate(data[1] | (data[2] << 8));
+  }
+}
+
+void readCommands() {
+  while (Serial.available() > 0) {
+    uint8_t b = Serial.read();
+    if (b == 0) {
+      if (commandLength > 0 && commandLength <= sizeof(command)) {
+        handleCommand(command, commandLength);
+      }
+      commandLength = 0;
+    } else if (commandLength < sizeof(command)) {
+      command[commandLength++] = b;
+    } else {
+      commandLength = sizeof(command) + 1;  // слишком длинная - пропускаем до 0x00
+    }
+  }
+}
+
+// Отправляет блок из count отсчетов начиная с tailSeq
+void sendBlock(uint16_t count, uint32_t firstUs, bool leadOff) {
+  block[0] = BLOCK_VERSION;
+  block[1] = leadOff ? BLOCK_FLAG_LEAD_OFF : 0;
+  putU32(block + 2, tailSeq);
+  putU32(block + 6, firstUs);
+  putU16(block + 10, samplePeriodUs);
+  for (uint16_t i = 0; i < count; i++) {
+    putU16(block + BLOCK_HEADER_SIZE + i * 2, ring[(tailSeq + i) & (RING_SIZE - 1)] & ~LEAD_OFF_BIT);
+  }
+  size_t length = BLOCK_HEADER_SIZE + count * 2;
+  putU16(block + length, crc16(block, length));
+
+  size_t size = cobsEncode(block, length + 2, encoded);
+  encoded[size++] = 0;
+  Serial.write(encoded, size);
+
+  tailSeq += count;
+}
+
+void setup()
 {
-  Serial.begin(115200);
+  Serial.begin(SERIAL_BAUD);
+  setupSampler();
 }
 
 void loop() {
-  if ((digitalRead(L0m) == 1) && (digitalRead(L0p) == 1))
-  {
-    Serial.println("!");
+  readCommands();
+
+  noInterrupts();
+  uint32_t head = headSeq;
+  uint32_t lastUs = headTimeUs;
+  interrupts();
+
+  if (head - tailSeq > RING_SIZE) {
+    tailSeq = head - RING_SIZE;  // loop() не успел - пропуск виден приемнику по seq
+  }
+
+  // Блок - подряд идущие отсчеты с одинаковым состоянием электродов
+  uint32_t pending = head - tailSeq;
+  if (pending == 0) {
+    return;
+  }
+  bool leadOff = ring[tailSeq & (RING_SIZE - 1)] & LEAD_OFF_BIT;
+  uint16_t count = 1;
+  while (count < pending && count < BLOCK_SAMPLES &&
+         (bool)(ring[(tailSeq + count) & (RING_SIZE - 1)] & LEAD_OFF_BIT) == leadOff) {
+    count++;
   }
-  else
-  {
-    int sensorValue = analogRead(port);
-    
-    Serial.println(sensorValue);
+
+  // После CMD_STOP отправляем и неполный блок
+  if (count == BLOCK_SAMPLES || count < pending || !sampling) {
+    uint32_t firstUs = lastUs - (head - 1 - tailSeq) * samplePeriodUs;
+    sendBlock(count, firstUs, leadOff);
   }
-  delay(1000);
 }
@@ -2,7 +2,9 @@
 # MIT license; Copyright (c) 2021 Jim Mussared
 
 from micropython import const
+from collections import deque
 
+import binascii
 import bluetooth
 import struct
 
@@ -43,6 +45,11 @@ _ADV_TYPE_UUID128_COMPLETE = const(0x7)
 _ADV_TYPE_APPEARANCE = const(0x19)
 _ADV_TYPE_MANUFACTURER = const(0xFF)
 
+# Default bound on advertising reports waiting for the scan iterator. When
+# full, the oldest report is discarded (a newer one for the same device will
+# usually follow).
+_DEFAULT_QUEUE_LEN = const(32)
+
 
 # Keep track of the active scanner so IRQs can be delivered to it.
 _active_scanner = None
@@ -58,8 +65,7 @@ def _central_irq(event, data):
         addr_type, addr, adv_type, rssi, adv_data = data
         if not _active_scanner:
             return
-        _active_scanner._queue.append((addr_type, bytes(addr), adv_type, rssi, bytes(adv_data)))
-        _active_scanner._event.set()
+        _active_scanner._irq_result(addr_type, addr, adv_type, rssi, adv_data)
     elif event == _IRQ_SCAN_DONE:
         if not _active_scanner:
             return
@@ -143,6 +149,51 @@ async def _connect(
         _connecting.remove(device)
 
 
+# Returns true if any field of the given types in the advertising payload
+# equals value (or, with step, any step-sized entry of the field does, for
+# packed UUID lists). Compares in place so it can run in the IRQ handler
+# without allocating.
+def _payload_has(payload, type_a, type_b, value, step=0):
+    n = len(value)
+    i = 0
+    while i + 1 < len(payload):
+        length = payload[i]
+        if payload[i + 1] == type_a or payload[i + 1] == type_b:
+            start = i + 2
+            end = min(i + 1 + length, len(payload))  # truncated payload
+            while start < end:
+                size = step or end - start
+                if size == n and start + n <= end:
+                    j = 0
+                    while j < n and payload[start + j] == value[j]:
+                        j += 1
+                    if j == n:
+                        return True
+                start += size
+        i += 1 + length
+    return False
+
+
+# Compare a 6-byte address from the IRQ (a memoryview) with a stored one
+# without allocating.
+def _addr_equal(addr, other):
+    i = 0
+    while i < 6:
+        if addr[i] != other[i]:
+            return False
+        i += 1
+    return True
+
+
+# Advertising field types that carry a UUID of this size, plus the UUID.
+def _uuid_filter(uuid):
+    if len(uuid) == 2:
+        return (_ADV_TYPE_UUID16_INCOMPLETE, _ADV_TYPE_UUID16_COMPLETE, uuid)
+    if len(uuid) == 4:
+        return (_ADV_TYPE_UUID32_INCOMPLETE, _ADV_TYPE_UUID32_COMPLETE, uuid)
+    return (_ADV_TYPE_UUID128_INCOMPLETE, _ADV_TYPE_UUID128_COMPLETE, uuid)
+
+
 # Represents a single device that has been found during a scan. The scan
 # iterator will return the same ScanResult instance multiple times as its data
 # changes (i.e. changing RSSI or advertising data).
@@ -153,10 +204,13 @@ class ScanResult:
         self.resp_data = None
         self.rssi = None
         self.connectable = False
+        # AD type -> list of field values (memoryview slices into the payloads).
+        self._fields = {}
 
     # New scan result available, return true if it changes our state.
     def _update(self, adv_type, rssi, adv_data):
         updated = False
+        payloads = (self.adv_data, self.resp_data)
 
         if rssi != self.rssi:
             self.rssi = rssi
@@ -176,25 +230,38 @@ class ScanResult:
                 self.resp_data = adv_data
                 updated = True
 
-        return updated
+        if payloads[0] is not self.adv_data or payloads[1] is not self.resp_data:
+            self._index()
 
-    def __str__(self):
-        return "Scan result: {} {}".format(self.device, self.rssi)
+        return updated
 
-    # Gets all the fields for the specified types.
-    def _decode_field(self, *adv_type):
+    # Parse the payloads once per change into the AD type -> fields index.
+    def _index(self):
         # Advertising payloads are repeated packets of the following form:
         #   1 byte data length (N + 1)
         #   1 byte type (see constants below)
         #   N bytes type-specific data
+        fields = {}
         for payload in (self.adv_data, self.resp_data):
             if not payload:
                 continue
+            payload = memoryview(payload)
             i = 0
             while i + 1 < len(payload):
-                if payload[i + 1] in adv_type:
-                    yield payload[i + 2 : i + payload[i] + 1]
-                i += 1 + payload[i]
+                end = i + payload[i] + 1
+                if payload[i]:
+                    fields.setdefault(payload[i + 1], []).append(payload[i + 2 : end])
+                i = end
+        self._fields = fields
+
+    def __str__(self):
+        return "Scan result: {} {}".format(self.device, self.rssi)
+
+    # Gets all the fields for the specified types, as memoryview slices of
+    # the payload they were parsed from.
+    def _decode_field(self, *adv_type):
+        for t in adv_type:
+            yield from self._fields.get(t, ())
 
     # Returns the value of the complete (or shortened) advertised name, if available.
     def name(self):
@@ -226,14 +293,48 @@ class ScanResult:
 # async with aioble.scan(...) as scanner:
 #   async for result in scanner:
 #     ...
+#
+# Optional filters are applied in the IRQ handler, so reports from other
+# advertisers are discarded before anything is allocated for them:
+#   services -- list of bluetooth.UUID, matches if any is advertised
+#   name -- exact complete or shortened advertised name
+#   addr -- list of addresses (6 bytes or "aa:bb:cc:dd:ee:ff")
+# A device that passed once keeps being reported (e.g. its scan response
+# without the name).
 class scan:
-    def __init__(self, duration_ms, interval_us=None, window_us=None, active=False):
-        self._queue = []
+    def __init__(
+        self,
+        duration_ms,
+        interval_us=None,
+        window_us=None,
+        active=False,
+        services=None,
+        name=None,
+        addr=None,
+        queue_len=_DEFAULT_QUEUE_LEN,
+    ):
+        self._queue = deque((), queue_len)
+        self._queue_len = queue_len
         self._event = asyncio.ThreadSafeFlag()
         self._done = False
 
-        # Keep track of what we've already seen.
-        self._results = set()
+        # Number of reports discarded because the queue was full.
+        self.dropped = 0
+
+        # Keep track of what we've already seen, keyed by (addr_type, addr).
+        self._results = {}
+        # (addr_type, addr) of devices that passed the name/services filter,
+        # searched from the IRQ without building a key.
+        self._matched = []
+
+        # Filters, pre-converted to bytes for in-place comparison.
+        self._services = [_uuid_filter(bytes(u)) for u in services] if services else None
+        self._name = name.encode() if isinstance(name, str) else name
+        self._addrs = (
+            [a if len(a) == 6 else binascii.unhexlify(a.replace(":", "")) for a in addr]
+            if addr
+            else None
+        )
 
         # Ideally we'd start the scan here and avoid having to save these
         # values, but we need to stop any previous scan first via awaiting
@@ -261,6 +362,41 @@ class scan:
         assert _active_scanner == self
         return self
 
+    # Returns true if the advertising payload passes the name/services filters.
+    def _matches(self, adv_data):
+        if self._name is not None and not _payload_has(
+            adv_data, _ADV_TYPE_NAME, _ADV_TYPE_SHORT_NAME, self._name
+        ):
+            return False
+        if self._services is not None:
+            for type_a, type_b, uuid in self._services:
+                if _payload_has(adv_data, type_a, type_b, uuid, len(uuid)):
+                    return True
+            return False
+        return True
+
+    # Called from the IRQ handler for every advertising report.
+    # Filters run on the IRQ's memoryviews, so rejected reports don't allocate.
+    def _irq_result(self, addr_type, addr, adv_type, rssi, adv_data):
+        if self._addrs is not None:
+            for a in self._addrs:
+                if _addr_equal(addr, a):
+                    break
+            else:
+                return
+        if self._name is not None or self._services is not None:
+            for known_type, known in self._matched:
+                if known_type == addr_type and _addr_equal(addr, known):
+                    break
+            else:
+                if not self._matches(adv_data):
+                    return
+                self._matched.append((addr_type, bytes(addr)))
+        if len(self._queue) >= self._queue_len:
+            self.dropped += 1
+        self._queue.append((addr_type, bytes(addr), adv_type, rssi, bytes(adv_data)))
+        self._event.set()
+
     async def __anext__(self):
         global _active_scanner
 
@@ -270,18 +406,15 @@ class scan:
 
         while True:
             while self._queue:
-                addr_type, addr, adv_type, rssi, adv_data = self._queue.pop()
+                addr_type, addr, adv_type, rssi, adv_data = self._queue.popleft()
 
                 # Try to find an existing ScanResult for this device.
-                for r in self._results:
-                    if r.device.addr_type == addr_type and r.device.addr == addr:
-                        result = r
-                        break
-                else:
+                key = (addr_type, addr)
+                result = self._results.get(key)
+                if result is None:
                     # New device, create a new Device & ScanResult.
-                    device = Device(addr_type, addr)
-                    result = ScanResult(device)
-                    self._results.add(result)
+                    result = ScanResult(Device(addr_type, addr))
+                    self._results[key] = result
 
                 # Add the new information from this event.
                 if result._update(adv_type, rssi, adv_data):
@@ -37,8 +37,8 @@ _FLAG_INDICATE = const(0x0020)
 
 # Forward IRQs directly to static methods on the type that handles them and
 # knows how to map handles to instances. Note: We copy all uuid and data
-# params here for safety, but a future optimisation might be able to avoid
-# these copies in a few places.
+# params here for safety, except notify/indicate data, which is copied by
+# ClientCharacteristic (into a capture buffer if enabled, see capture()).
 def _client_irq(event, data):
     if event == _IRQ_GATTC_SERVICE_RESULT:
         conn_handle, start_handle, end_handle, uuid = data
@@ -73,10 +73,10 @@ def _client_irq(event, data):
         ClientCharacteristic._write_done(conn_handle, value_handle, status)
     elif event == _IRQ_GATTC_NOTIFY:
         conn_handle, value_handle, notify_data = data
-        ClientCharacteristic._on_notify(conn_handle, value_handle, bytes(notify_data))
+        ClientCharacteristic._on_notify(conn_handle, value_handle, notify_data)
     elif event == _IRQ_GATTC_INDICATE:
         conn_handle, value_handle, indicate_data = data
-        ClientCharacteristic._on_indicate(conn_handle, value_handle, bytes(indicate_data))
+        ClientCharacteristic._on_indicate(conn_handle, value_handle, indicate_data)
 
 
 register_irq_handler(_client_irq, None)
@@ -193,6 +193,54 @@ class ClientService:
         ble.gattc_discover_services(connection._conn_handle, uuid)
 
 
+# Fixed pool of preallocated buffers used as the notify/indicate queue by
+# ClientCharacteristic.capture(). Behaves like the deque it replaces (len,
+# append, popleft), but append copies into a free buffer without allocating,
+# and popleft returns a memoryview of that buffer. The buffer handed out by
+# popleft stays reserved until the next popleft, so one buffer more than
+# `depth` is allocated and `depth` items can always be queued.
+class _CapturePool:
+    def __init__(self, depth, size):
+        self._buffers = [bytearray(size) for _ in range(depth + 1)]
+        self._lengths = [0] * (depth + 1)
+        self._head = 0  # Oldest buffer (the one handed out, if _held).
+        self._count = 0  # Buffers in use, including the handed out one.
+        self._held = False
+
+    # Number of items waiting to be returned by popleft.
+    def __len__(self):
+        return self._count - self._held
+
+    # Called from the IRQ handler. Returns the number of bytes stored, or -1
+    # if all buffers are in use: the new data is dropped, so queued items are
+    # never overwritten.
+    def append(self, data):
+        n_buffers = len(self._buffers)
+        if self._count == n_buffers:
+            return -1
+        i = (self._head + self._count) % n_buffers
+        buf = self._buffers[i]
+        n = len(data)
+        if n > len(buf):
+            n = len(buf)
+            buf[:] = data[0:n]  # Truncated (the slice allocates, but is rare).
+        else:
+            buf[0:n] = data
+        self._lengths[i] = n
+        self._count += 1
+        return n
+
+    def popleft(self):
+        if self._held:
+            self._head = (self._head + 1) % len(self._buffers)
+            self._count -= 1
+        if not self._count:
+            self._held = False
+            raise IndexError
+        self._held = True
+        return memoryview(self._buffers[self._head])[0 : self._lengths[self._head]]
+
+
 class BaseClientCharacteristic:
     def __init__(self, value_handle, properties, uuid):
         # Used for read/write/notify ops.
@@ -326,6 +374,12 @@ class ClientCharacteristic(BaseClientCharacteristic):
             self._indicate_event = asyncio.ThreadSafeFlag()
             self._indicate_queue = deque((), 1)
 
+        # Notifications/indications lost before notified()/indicated() got
+        # them: replaced in the default single-item queue, or arriving while
+        # the capture pool is full. And captured ones cut to the buffer size.
+        self.dropped = 0
+        self.truncated = 0
+
     def __str__(self):
         return "Characteristic: {} {} {} {}".format(
             self._end_handle, self._value_handle, self.properties, self.uuid
@@ -360,6 +414,19 @@ class ClientCharacteristic(BaseClientCharacteristic):
             uuid,
         )
 
+    # Queue up to `depth` notifications and indications in preallocated
+    # buffers of `size` bytes (default: fits the current MTU) instead of only
+    # keeping the most recent one. Copying into the pool doesn't allocate, and
+    # notified()/indicated() then return memoryviews of the buffers, valid
+    # until the next call. Data longer than `size` is truncated (counted in
+    # self.truncated).
+    def capture(self, depth=8, size=None):
+        size = size or (self._connection().mtu or 247) - 3
+        if self.properties & _FLAG_NOTIFY:
+            self._notify_queue = _CapturePool(depth, size)
+        if self.properties & _FLAG_INDICATE:
+            self._indicate_queue = _CapturePool(depth, size)
+
     # Helper for notified() and indicated().
     async def _notified_indicated(self, queue, event, timeout_ms):
         # Ensure that events for this connection can route to this characteristic.
@@ -386,10 +453,22 @@ class ClientCharacteristic(BaseClientCharacteristic):
     def _on_notify_indicate(self, queue, event, data):
         # If we've gone from empty to one item, then wake something
         # blocking on `await char.notified()` (or `await char.indicated()`).
-        wake = len(queue) == 0
         # Append the data. By default this is a deque with max-length==1, so it
-        # replaces. But if capture is enabled then it will append.
-        queue.append(data)
+        # replaces. But if capture is enabled then it will append (copying
+        # into a free buffer, or dropping the data if there is none).
+        if isinstance(queue, _CapturePool):
+            n = queue.append(data)
+            if n < 0:
+                self.dropped += 1
+            elif n < len(data):
+                self.truncated += 1
+            # Only wake if the data was actually queued.
+            wake = n >= 0 and len(queue) == 1
+        else:
+            wake = len(queue) == 0
+            if not wake:
+                self.dropped += 1
+            queue.append(bytes(data))
         if wake:
             # Queue is now non-empty. If something is waiting, it will be
             # worken. If something isn't waiting right now, then a future
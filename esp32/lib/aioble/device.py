@@ -5,6 +5,7 @@ from micropython import const
 
 import asyncio
 import binascii
+import time
 
 from .core import ble, register_irq_handler, log_error
 
@@ -26,7 +27,99 @@ def _device_irq(event, data):
                 device._mtu_event.set()
 
 
-register_irq_handler(_device_irq, None)
+def _device_shutdown():
+    global _deadlines
+    if _deadlines._task:
+        _deadlines._task.cancel()
+    _deadlines = _Deadlines()
+
+
+# Deadlines of all armed DeviceTimeouts, shared by every operation so that
+# arming and disarming a timeout doesn't allocate a task. The timeouts form a
+# doubly-linked list sorted by deadline (usually a new deadline is the latest
+# one, so insertion from the tail is O(1)), and a single task sleeps until the
+# earliest of them.
+class _Deadlines:
+    def __init__(self):
+        self._head = None
+        self._tail = None
+        self._task = None
+        # The task waits on this while nothing is armed.
+        self._idle = asyncio.ThreadSafeFlag()
+        self._waiting = False
+        # Deadline the task is sleeping until, and whether it was woken early
+        # (via cancel) because an earlier deadline was armed.
+        self._wake_ms = 0
+        self._woken = False
+
+    def arm(self, timeout):
+        # Insert sorted, walking back from the tail.
+        prev = self._tail
+        while prev and time.ticks_diff(prev._deadline, timeout._deadline) > 0:
+            prev = prev._prev
+        timeout._prev = prev
+        timeout._next = prev._next if prev else self._head
+        if timeout._next:
+            timeout._next._prev = timeout
+        else:
+            self._tail = timeout
+        if prev:
+            prev._next = timeout
+        else:
+            self._head = timeout
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        elif self._waiting:
+            self._idle.set()
+        elif self._head is timeout and time.ticks_diff(self._wake_ms, timeout._deadline) > 0:
+            # Rare: a shorter timeout than everything pending.
+            self._woken = True
+            self._task.cancel()
+
+    def disarm(self, timeout):
+        # The task keeps sleeping until its current deadline and then finds
+        # nothing (or a later deadline) to act on.
+        if timeout._prev:
+            timeout._prev._next = timeout._next
+        elif self._head is timeout:
+            self._head = timeout._next
+        else:
+            return  # Not armed (or already expired).
+        if timeout._next:
+            timeout._next._prev = timeout._prev
+        else:
+            self._tail = timeout._prev
+        timeout._prev = timeout._next = None
+
+    async def _run(self):
+        while True:
+            now = time.ticks_ms()
+            while self._head and time.ticks_diff(self._head._deadline, now) <= 0:
+                expired = self._head
+                self.disarm(expired)
+                expired._expired = True
+                expired._task.cancel()
+
+            try:
+                if self._head:
+                    self._wake_ms = self._head._deadline
+                    await asyncio.sleep_ms(time.ticks_diff(self._wake_ms, now))
+                else:
+                    self._waiting = True
+                    await self._idle.wait()
+                    self._waiting = False
+            except asyncio.CancelledError:
+                if not self._woken:
+                    self._task = None
+                    raise
+                self._woken = False
+
+
+_deadlines = _Deadlines()
+
+
+register_irq_handler(_device_irq, _device_shutdown)
 
 
 # Context manager to allow an operation to be cancelled by timeout or device
@@ -41,10 +134,14 @@ class DeviceTimeout:
         # allows this to be used either as a just-disconnect, just-timeout, or
         # no-op.
 
-        # This task is active while the operation is in progress. It sleeps
-        # until the timeout, and then cancels the working task. If the working
-        # task completes, __exit__ will cancel the sleep.
-        self._timeout_task = None
+        # While the operation is in progress the timeout is armed in
+        # _deadlines, linked by _prev/_next. When the deadline passes, the
+        # shared task sets _expired and cancels the working task; if the
+        # working task completes first, __exit__ disarms it.
+        self._deadline = 0
+        self._prev = None
+        self._next = None
+        self._expired = False
 
         # This is the task waiting for the actual operation to complete.
         # Usually this is waiting on an event that will be set() by an IRQ
@@ -54,26 +151,12 @@ class DeviceTimeout:
         # Tell the connection that if it disconnects, it should cancel this
         # operation (by cancelling self._task).
         if connection:
-            connection._timeouts.append(self)
-
-    async def _timeout_sleep(self):
-        try:
-            await asyncio.sleep_ms(self._timeout_ms)
-        except asyncio.CancelledError:
-            # The operation completed successfully and this timeout task was
-            # cancelled by __exit__.
-            return
-
-        # The sleep completed, so we should trigger the timeout. Set
-        # self._timeout_task to None so that we can tell the difference
-        # between a disconnect and a timeout in __exit__.
-        self._timeout_task = None
-        self._task.cancel()
+            connection._timeouts.add(self)
 
     def __enter__(self):
         if self._timeout_ms:
-            # Schedule the timeout waiter.
-            self._timeout_task = asyncio.create_task(self._timeout_sleep())
+            self._deadline = time.ticks_add(time.ticks_ms(), self._timeout_ms)
+            _deadlines.arm(self)
 
     def __exit__(self, exc_type, exc_val, exc_traceback):
         # One of five things happened:
@@ -90,7 +173,7 @@ class DeviceTimeout:
         try:
             if exc_type == asyncio.CancelledError:
                 # Case 2, we started a timeout and it's completed.
-                if self._timeout_ms and self._timeout_task is None:
+                if self._expired:
                     raise asyncio.TimeoutError
 
                 # Case 3, we have a disconnected device.
@@ -101,12 +184,12 @@ class DeviceTimeout:
                 # Allow the cancellation to propagate.
                 return
 
-            # Case 1 & 4. Either way, just stop the timeout task and let the
+            # Case 1 & 4. Either way, just disarm the timeout and let the
             # exception (if case 4) propagate.
         finally:
-            # In all cases, if the timeout is still running, cancel it.
-            if self._timeout_task:
-                self._timeout_task.cancel()
+            # In all cases, if the timeout is still armed, disarm it.
+            if self._timeout_ms:
+                _deadlines.disarm(self)
 
 
 class Device:
@@ -192,8 +275,9 @@ class DeviceConnection:
         self._task = None
 
         # DeviceTimeout instances that are currently waiting on this device
-        # and need to be notified if disconnection occurs.
-        self._timeouts = []
+        # and need to be notified if disconnection occurs. A set, so removal
+        # in DeviceTimeout.__exit__ is O(1) and doesn't reallocate.
+        self._timeouts = set()
 
         # Fired by the encryption update event.
         self._pair_event = None
@@ -5,6 +5,7 @@ from micropython import const
 from collections import deque
 import bluetooth
 import asyncio
+import time
 
 from .core import (
     ensure_active,
@@ -15,7 +16,7 @@ from .core import (
     register_irq_handler,
     GattError,
 )
-from .device import DeviceConnection, DeviceTimeout
+from .device import DeviceConnection, DeviceDisconnectedError, DeviceTimeout
 
 _registered_characteristics = {}
 
@@ -38,9 +39,23 @@ _FLAG_WRITE_AUTHORIZED = const(0x4000)
 
 _FLAG_WRITE_CAPTURE = const(0x10000)
 
+# Client Characteristic Configuration Descriptor bits.
+_CCCD_NOTIFY = const(1)
+_CCCD_INDICATE = const(2)
+
 
 _WRITE_CAPTURE_QUEUE_LIMIT = const(10)
 
+_DEFAULT_MTU = const(23)
+
+# Indications queued per connection behind the one awaiting confirmation.
+_INDICATE_QUEUE_LEN = const(8)
+_INDICATE_SLOTS = const(_INDICATE_QUEUE_LEN + 1)
+
+# Backoff while the controller has no free buffers for a notification.
+_STREAM_RETRY_MIN_MS = const(1)
+_STREAM_RETRY_MAX_MS = const(16)
+
 
 def _server_irq(event, data):
     if event == _IRQ_GATTS_WRITE:
@@ -188,6 +203,16 @@ class BaseCharacteristic:
                 # then set event to handle in written() task.
                 characteristic._write_data = conn
                 characteristic._write_event.set()
+        elif characteristic := _registered_characteristics.get(value_handle - 1, None):
+            # The CCCD immediately follows the value handle. Stacks that
+            # report CCCD writes (e.g. BTstack) keep the subscription state
+            # up to date here, on others use Characteristic.subscribe().
+            if conn := DeviceConnection._connected.get(conn_handle, None):
+                if hasattr(characteristic, "_subscribers"):
+                    # An empty (or unset) value means unsubscribed.
+                    cccd = ble.gatts_read(value_handle)
+                    bits = cccd[0] if cccd else 0
+                    characteristic.subscribe(conn, bool(bits & _CCCD_NOTIFY), bool(bits & _CCCD_INDICATE))
 
     def _remote_read(conn_handle, value_handle):
         if characteristic := _registered_characteristics.get(value_handle, None):
@@ -231,13 +256,14 @@ class Characteristic(BaseCharacteristic):
             self._write_data = None
         if notify:
             flags |= _FLAG_NOTIFY
+        if notify or indicate:
+            # Map of connection to its CCCD bits, see subscribe().
+            self._subscribers = {}
         if indicate:
             flags |= _FLAG_INDICATE
-            # TODO: This should probably be a dict of connection to (ev, status).
-            # Right now we just support a single indication at a time.
-            self._indicate_connection = None
-            self._indicate_event = asyncio.ThreadSafeFlag()
-            self._indicate_status = None
+            # Map of connection to its _IndicationQueue, so indications to
+            # different connections proceed in parallel.
+            self._indications = {}
 
         self.uuid = uuid
         self.flags = flags
@@ -257,36 +283,261 @@ class Characteristic(BaseCharacteristic):
             raise ValueError("Not supported")
         ble.gatts_notify(connection._conn_handle, self._value_handle, data)
 
-    async def indicate(self, connection, data=None, timeout_ms=1000):
+    # Record whether this connection has enabled notifications/indications.
+    # Called automatically on stacks that report CCCD writes.
+    def subscribe(self, connection, notify=True, indicate=False):
+        if not hasattr(self, "_subscribers"):
+            raise ValueError("Not supported")
+        flags = (_CCCD_NOTIFY if notify else 0) | (_CCCD_INDICATE if indicate else 0)
+        if flags and connection.is_connected():
+            self._subscribers[connection] = flags
+        else:
+            self._subscribers.pop(connection, None)
+
+    def is_subscribed(self, connection):
+        return connection.is_connected() and connection in getattr(self, "_subscribers", ())
+
+    # Send the same notification to every subscribed connection. Returns the
+    # number of connections it was sent to (a connection whose controller
+    # buffers are full is skipped). Disconnected connections are forgotten.
+    def notify_all(self, data=None):
+        if not (self.flags & _FLAG_NOTIFY):
+            raise ValueError("Not supported")
+        sent = 0
+        stale = False
+        for connection, flags in self._subscribers.items():
+            if not connection.is_connected():
+                stale = True
+            elif flags & _CCCD_NOTIFY:
+                try:
+                    ble.gatts_notify(connection._conn_handle, self._value_handle, data)
+                    sent += 1
+                except OSError:
+                    pass
+        if stale:
+            for connection in [c for c in self._subscribers if not c.is_connected()]:
+                del self._subscribers[connection]
+        return sent
+
+    # Notification writer for this connection that waits for the controller
+    # instead of failing, see CharacteristicStream.
+    def stream(self, connection):
+        if not (self.flags & _FLAG_NOTIFY):
+            raise ValueError("Not supported")
+        return CharacteristicStream(self, connection)
+
+    # Send an indication and (by default) wait for the client to confirm it.
+    # Only one indication per connection can be awaiting confirmation, the
+    # rest are queued and sent from the IRQ as soon as the previous one is
+    # confirmed. With wait=False this returns once the indication is queued
+    # (waiting for space if the queue is full), so the link stays busy
+    # without a round trip through the caller per indication. Failures of
+    # such indications are raised by the next indicate() or indicated().
+    async def indicate(self, connection, data=None, timeout_ms=1000, wait=True):
         if not (self.flags & _FLAG_INDICATE):
             raise ValueError("Not supported")
-        if self._indicate_connection is not None:
-            raise ValueError("In progress")
         if not connection.is_connected():
             raise ValueError("Not connected")
 
-        self._indicate_connection = connection
-        self._indicate_status = None
-
-        try:
+        queue = self._indications.get(connection, None)
+        if queue is None:
+            for c in [c for c in self._indications if not c.is_connected()]:
+                del self._indications[c]
+            queue = _IndicationQueue(connection, self._value_handle)
+            self._indications[connection] = queue
+
+        with connection.timeout(timeout_ms):
+            queue.check()
+            seq = await queue.append(data, wait)
+            if wait:
+                await queue.wait(seq)
+
+    # Wait for all queued indications to this connection to be confirmed.
+    async def indicated(self, connection, timeout_ms=1000):
+        if queue := getattr(self, "_indications", {}).get(connection, None):
             with connection.timeout(timeout_ms):
-                ble.gatts_indicate(connection._conn_handle, self._value_handle, data)
-                await self._indicate_event.wait()
-                if self._indicate_status != 0:
-                    raise GattError(self._indicate_status)
-        finally:
-            self._indicate_connection = None
+                await queue.drain()
+                queue.check()
 
     def _indicate_done(conn_handle, value_handle, status):
         if characteristic := _registered_characteristics.get(value_handle, None):
             if connection := DeviceConnection._connected.get(conn_handle, None):
-                if not characteristic._indicate_connection:
-                    # Timeout.
-                    return
-                # See TODO in __init__ to support multiple concurrent indications.
-                assert connection == characteristic._indicate_connection
-                characteristic._indicate_status = status
-                characteristic._indicate_event.set()
+                if queue := characteristic._indications.get(connection, None):
+                    queue._confirm(status)
+
+
+# Indications to one connection. Fixed ring of slots, numbered by sequence:
+# [_done, _sent) is awaiting confirmation (at most one), [_sent, _queued)
+# is waiting to be sent (up to _INDICATE_QUEUE_LEN, hence one extra slot).
+class _IndicationQueue:
+    def __init__(self, connection, value_handle):
+        self._connection = connection
+        self._value_handle = value_handle
+        self._data = [None] * _INDICATE_SLOTS
+        self._status = [0] * _INDICATE_SLOTS
+        # Set when the slot's indication completes, for a waiting indicate().
+        self._events = [asyncio.ThreadSafeFlag() for _ in range(_INDICATE_SLOTS)]
+        # True while a waiting indicate() hasn't collected the slot's status.
+        self._waiting = [False] * _INDICATE_SLOTS
+        # True for wait=False indications, whose failure is reported later.
+        self._report = [False] * _INDICATE_SLOTS
+        # Set whenever a slot becomes free. Only the task holding _lock waits
+        # on it.
+        self._space = asyncio.ThreadSafeFlag()
+        self._lock = asyncio.Lock()
+        self._queued = 0
+        self._sent = 0
+        self._done = 0
+        # Status of the first failed wait=False indication not yet reported.
+        self._error = 0
+
+    def _full(self):
+        return (
+            self._queued - self._done > _INDICATE_QUEUE_LEN
+            or self._waiting[self._queued % _INDICATE_SLOTS]
+        )
+
+    def check(self):
+        if error := self._error:
+            self._error = 0
+            raise GattError(error)
+
+    async def append(self, data, wait):
+        if self._full():
+            async with self._lock:
+                while self._full():
+                    await self._space.wait()
+
+        seq = self._queued
+        slot = seq % _INDICATE_SLOTS
+        self._waiting[slot] = wait
+        self._report[slot] = not wait
+        if self._done < seq and data is not None:
+            # Not sent straight away, and the caller may reuse its buffer.
+            data = bytes(data)
+        self._data[slot] = data
+        self._queued = seq + 1
+        self._send()
+        return seq
+
+    async def wait(self, seq):
+        slot = seq % _INDICATE_SLOTS
+        try:
+            while self._done <= seq:
+                await self._events[slot].wait()
+            status = self._status[slot]
+        finally:
+            self._waiting[slot] = False
+            self._space.set()
+        if status != 0:
+            raise GattError(status)
+
+    async def drain(self):
+        async with self._lock:
+            while self._done < self._queued:
+                await self._space.wait()
+
+    # Send the next queued indication if none is awaiting confirmation.
+    # Called from indicate() and from the IRQ.
+    def _send(self):
+        while self._sent == self._done < self._queued:
+            slot = self._sent % _INDICATE_SLOTS
+            data = self._data[slot]
+            self._data[slot] = None
+            self._sent += 1
+            try:
+                ble.gatts_indicate(self._connection._conn_handle, self._value_handle, data)
+                return
+            except OSError as e:
+                self._complete(e.args[0] if e.args else -1)
+
+    def _complete(self, status):
+        slot = self._done % _INDICATE_SLOTS
+        self._status[slot] = status
+        if status != 0 and self._report[slot] and not self._error:
+            self._error = status
+        self._done += 1
+        self._events[slot].set()
+        self._space.set()
+
+    def _confirm(self, status):
+        if self._done == self._sent:
+            # Nothing awaiting confirmation.
+            return
+        self._complete(status)
+        self._send()
+
+
+# Streams notifications to a single connection. Use with:
+#   stream = characteristic.stream(connection)
+#   await stream.write(data)  # coalesced into (MTU - 3)-byte notifications
+#   await stream.flush()  # send whatever is still buffered
+# or `await stream.send(packet)` to notify one packet as is. When the
+# controller's buffers are full (gatts_notify raises OSError), these wait and
+# retry rather than dropping the data. Raises DeviceDisconnectedError if the
+# connection goes away.
+class CharacteristicStream:
+    def __init__(self, characteristic, connection):
+        self._characteristic = characteristic
+        self._connection = connection
+
+        # Coalescing buffer, sized to the MTU when first written to.
+        self._buf = None
+        self._len = 0
+
+        # Public statistics.
+        self.bytes_sent = 0
+        self.notifications = 0
+        self.busy = 0  # Retries because the controller had no free buffers.
+        self._started = None
+
+    async def send(self, data):
+        delay = _STREAM_RETRY_MIN_MS
+        while True:
+            if not self._connection.is_connected():
+                raise DeviceDisconnectedError
+            try:
+                self._characteristic.notify(self._connection, data)
+                break
+            except OSError:
+                self.busy += 1
+                await asyncio.sleep_ms(delay)
+                delay = min(delay * 2, _STREAM_RETRY_MAX_MS)
+
+        if self._started is None:
+            self._started = time.ticks_ms()
+        self.bytes_sent += len(data)
+        self.notifications += 1
+
+    async def write(self, data):
+        size = (self._connection.mtu or _DEFAULT_MTU) - 3
+        if self._buf is None or len(self._buf) != size:
+            # First write, or the MTU was exchanged since.
+            await self.flush()
+            self._buf = bytearray(size)
+
+        data = memoryview(data)
+        offset = 0
+        while offset < len(data):
+            n = min(size - self._len, len(data) - offset)
+            self._buf[self._len : self._len + n] = data[offset : offset + n]
+            self._len += n
+            offset += n
+            if self._len == size:
+                # gatts_notify copies the data, so the buffer can be reused.
+                await self.send(self._buf)
+                self._len = 0
+
+    async def flush(self):
+        if self._len:
+            await self.send(memoryview(self._buf)[: self._len])
+            self._len = 0
+
+    # Achieved throughput in bytes/second since the first notification.
+    def throughput(self):
+        if self._started is None:
+            return 0
+        return self.bytes_sent * 1000 // max(1, time.ticks_diff(time.ticks_ms(), self._started))
 
 
 class BufferedCharacteristic(Characteristic):
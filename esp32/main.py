@@ -1,53 +1,1322 @@
-from machine import UART, Pin, reset
+# Прошивка датчика ЭМГ на MicroPython (aioble)
+#
+# Тот же сервис, характеристики, формат кадров и команды управления, что у
+# Esp32.ino: приложение (GUI/sensor.py) работает с любой из двух прошивок.
+# Отсчеты приходят от arduino.ino по UART блоками COBS + CRC-16 или, при
+# SOURCE = 'adc', с АЦП самой ESP32 по прерыванию таймера.
+#
+# Все буферы выделяются при старте. Прием UART, кольцевые буферы, огибающая и
+# упаковка кадров - функции viper без выделения памяти, поэтому сборщик мусора
+# не останавливает поток отсчетов на килогерцах.
+
+from machine import ADC, UART, Pin, Timer, reset
+from micropython import const
+from array import array
+import asyncio
+import bluetooth
+import micropython
 import time
-import sys
+import gc
+import os
 
-print("=" * 50)
-print("🔧 ДИАГНОСТИКА ESP32")
-print("=" * 50)
+import aioble
+from aioble.device import Device, DeviceConnection
 
-# Проверка пинов
-try:
-    uart = UART(1, baudrate=9600, tx=Pin(19), rx=Pin(21))
-    print("✅ UART1 инициализирован")
-    print(f"   TX: Pin 19, RX: Pin 21, Baudrate: 9600")
-except Exception as e:
-    print(f"❌ Ошибка UART: {e}")
+_SERVICE_UUID = bluetooth.UUID("4fafc201-1fb5-459e-8fcc-c5c9c331914b")
+_CHARACTERISTIC_UUID = bluetooth.UUID("beb5483e-36e1-4688-b7f5-ea07361b26a8")
+_CONTROL_UUID = bluetooth.UUID("beb5483f-36e1-4688-b7f5-ea07361b26a8")
+_RECORDS_UUID = bluetooth.UUID("beb54840-36e1-4688-b7f5-ea07361b26a8")
+_ECHO_UUID = bluetooth.UUID("beb54841-36e1-4688-b7f5-ea07361b26a8")  # замер задержки
 
-# Проверка памяти
-import gc
-mem_free = gc.mem_free()
-mem_alloc = gc.mem_alloc()
-print(f"📊 Память: свободно {mem_free} байт, использовано {mem_alloc} байт")
+_ADV_INTERVAL_US = const(250_000)
+_MAX_CENTRALS = const(2)  # тренер и спортсмен: кадры уходят всем подписанным
+_MTU = const(247)
+_DEFAULT_MTU = const(23)
+
+# Кадр уведомления (little-endian), как в Esp32.ino:
+# version, flags, uint32 seq, uint32 timestamp_us, uint16 period_us, uint16 samples[N]
+_FRAME_VERSION = const(1)
+_FRAME_HEADER_SIZE = const(12)
+_FRAME_FLAG_LEAD_OFF = const(0x01)
+_FRAME_FLAG_BACKLOG = const(0x02)
+_FRAME_FLAG_RESUMED = const(0x04)
+_FRAME_FLAG_ENVELOPE = const(0x08)
+_FRAME_MAX_SAMPLES = const(116)  # (247 MTU - 3 ATT - 12 заголовок) / 2
+_FRAME_TIMEOUT_MS = const(200)  # не держим неполный кадр дольше
+_FRAMES_PER_PASS = const(8)  # кадров потока за проход при догоне
+_TRANSMIT_INTERVAL_MS = const(10)
+
+# Источник отсчетов: 'uart' - arduino.ino, 'adc' - АЦП самой ESP32
+SOURCE = 'uart'
+# Вместо датчика - тест: None, линия UART (UartBenchmark): 'loopback' - перемычка
+# TX->RX на самой ESP32, 'arduino' - настоящая линия от arduino.ino;
+# 'timeouts' - цена таймаутов операций GATT в aioble (TimeoutBenchmark)
+BENCHMARK = None
+
+# Команды характеристики управления: uint8 opcode + аргументы
+_CMD_RESUME = const(0x01)  # uint32 seq [+ uint32 seq огибающей]
+_CMD_MODE = const(0x02)  # uint8 mode
+_CMD_START = const(0x03)
+_CMD_STOP = const(0x04)
+_CMD_RATE = const(0x05)  # uint16 частота, Гц
+_CMD_FRAME_SIZE = const(0x06)  # uint8 максимум отсчетов в кадре, 0 - по MTU
+_CMD_RECORD = const(0x07)  # uint8 1 - запись во флеш, 0 - конец записи
+_CMD_SYNC = const(0x08)  # uint16 id записи + uint8 способ (_SYNC_*)
+_CMD_DELETE = const(0x09)  # uint16 id записи - хост сохранил ее у себя
+_RESUME_LIVE = 0xFFFFFFFF
+
+_MODE_RAW = const(0)
+_MODE_ENVELOPE = const(1)
+_MODE_BOTH = const(2)
+
+# Линия от arduino.ino: блоки с тем же заголовком + CRC-16, COBS, разделитель 0x00
+_UART_ID = const(1)
+_UART_TX = const(19)
+_UART_RX = const(21)
+_UART_BAUD = const(500_000)
+_UART_RX_BUFFER = const(1024)
+_UART_POLL_MS = const(5)
+_UART_HEADER_SIZE = const(12)
+_UART_MAX_SAMPLES = const(64)
+_UART_MAX_ENCODED = const(12 + 64 * 2 + 2 + 2)
+_UART_FLAG_LEAD_OFF = const(0x01)
+_UART_CMD_START = const(0x01)
+_UART_CMD_STOP = const(0x02)
+_UART_CMD_RATE = const(0x03)
+
+_SAMPLE_RATE_HZ = const(1000)  # по умолчанию, как в arduino.ino
+
+# АЦП самой ESP32 вместо Arduino (SOURCE = 'adc'): электрод на ADC1 - ADC2
+# недоступен при работающем радио; LO+/LO- модуля AD8232 на цифровые входы
+_ADC_PIN = const(34)
+_ADC_LEAD_OFF_PLUS = const(32)
+_ADC_LEAD_OFF_MINUS = const(33)
+_ADC_TIMER = const(0)
+_ADC_MIN_RATE_HZ = const(100)
+_ADC_MAX_RATE_HZ = const(2000)
+_ADC_STAGE = const(256)  # промежуточный буфер прерывания, степень двойки
+_ADC_BATCH = const(16)  # отсчетов на один drain
+_ADC_FLUSH_MS = const(50)
+_LEAD_OFF_BIT = const(0x8000)
+_TICKS_MASK = const(0x3FFFFFFF)  # ticks_us() переполняется через 2^30
+_SELF_TEST_SAMPLES = const(1000)
+_SELF_TEST_MS = const(2000)
+
+# Огибающая: скользящее RMS без постоянной составляющей (как в Esp32.ino)
+_ENVELOPE_WINDOW = const(64)
+_ENVELOPE_DECIMATION = const(20)
+_ENVELOPE_DC_SHIFT = const(7)
+
+# Кольцевые буферы - догон после обрыва связи через CMD_RESUME, как BACKLOG_SIZE
+# в Esp32.ino: обрыв на 5-10 с не теряет отсчетов. Сигнал - 60 КБ кучи с временами
+_RAW_BACKLOG = const(10240)  # ~10 с при 1 кГц, копия - RAW_BACKLOG в GUI/simulator.py
+_ENVELOPE_BACKLOG = const(512)  # ~10 с при 50 Гц
+
+# Запись во флеш без клиента: заголовок файла
+#   4s magic, uint8 версия, uint8 бит на отсчет, uint16 частота, Гц
+# и блоки: заголовок кадра, uint16 число отсчетов, отсчеты по 10 бит (4 в 5 байтах)
+_RECORD_DIR = '/rec'
+_RECORD_MAGIC = b'EMGR'
+_RECORD_VERSION = const(1)
+_RECORD_BLOCK_HEADER = const(14)
+_RECORD_BLOCK_SAMPLES = const(256)
+_RECORD_BLOCK_SIZE = const(14 + 256 // 4 * 5)
+_RECORD_INTERVAL_MS = const(100)
+_RECORD_SPACE_CHECK_BLOCKS = const(64)
+_RECORD_MIN_FREE = const(65536)  # байт флеша, которые оставляем свободными
+_RECORD_CATALOG_MAX = const(40)  # записей в каталоге (<HI id, размер)
+_RECORD_AUTO_HEADROOM_MS = const(1000)  # запас до перезаписи неотправленных отсчетов
+
+# Выгрузка записей
+_SYNC_L2CAP = const(0)
+_SYNC_GATT = const(1)
+_L2CAP_PSM = const(0x0081)
+_L2CAP_MTU = const(512)
+_SYNC_CHUNK = const(4096)
+_SYNC_TIMEOUT_MS = const(5000)
+
+# Тест UART
+_BENCH_BAUDS = (115_200, 250_000, 500_000, 921_600, 1_000_000, 2_000_000)
+_BENCH_BLOCK_SAMPLES = (8, 32, 64)  # не больше _UART_MAX_SAMPLES
+_BENCH_RATES = (250, 500, 1000, 2000)  # частоты arduino.ino в режиме 'arduino'
+_BENCH_ARDUINO_BLOCK = const(32)  # BLOCK_SAMPLES в arduino.ino
+_BENCH_BLOCK_VARIANTS = const(16)
+_BENCH_DURATION_MS = const(3000)
+_BENCH_SETTLE_MS = const(100)
+_BENCH_ARRIVALS = const(4096)  # времен прихода блоков для джиттера
+
+# Тест таймаутов aioble
+_BENCH_OPS = const(2000)
+_BENCH_ALLOC_OPS = const(100)  # операций с выключенным сборщиком для замера памяти
+_BENCH_TIMEOUT_MS = const(1000)  # как у ClientCharacteristic.read()/write()
+
+_STATS_INTERVAL_MS = const(5000)
+
+
+@micropython.viper
+def _crc16(data: ptr8, length: int) -> int:
+    """CRC-16/CCITT-FALSE"""
+    crc = 0xFFFF
+    for i in range(length):
+        crc ^= data[i] << 8
+        for _ in range(8):
+            if crc & 0x8000:
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+
+@micropython.viper
+def _cobs_decode(data: ptr8, length: int) -> int:
+    """Декодирует COBS на месте, возвращает длину (0 - ошибка)"""
+    src = 0
+    dst = 0
+    while src < length:
+        code = data[src]
+        src += 1
+        if code == 0 or src + code - 1 > length:
+            return 0
+        for _ in range(code - 1):
+            data[dst] = data[src]
+            dst += 1
+            src += 1
+        if code != 0xFF and src < length:
+            data[dst] = 0
+            dst += 1
+    return dst
+
+
+@micropython.viper
+def _isqrt(value: int) -> int:
+    root = 0
+    bit = 1 << 28
+    while bit > value:
+        bit >>= 2
+    while bit != 0:
+        if value >= root + bit:
+            value -= root + bit
+            root = (root >> 1) + bit
+        else:
+            root >>= 1
+        bit >>= 2
+    return root
+
+
+def _cobs_encode(data):
+    """COBS вне цикла отсчетов: команды arduino.ino и блоки теста UART"""
+    out = bytearray(1)
+    code_index = 0
+    code = 1
+    for b in data:
+        if b:
+            out.append(b)
+            code += 1
+        if not b or code == 0xFF:
+            out[code_index] = code
+            code_index = len(out)
+            out.append(0)
+            code = 1
+    out[code_index] = code
+    return out
+
+
+class StreamCursor:
+    """Передача потока одному клиенту: свой seq, флаги кадра и таймаут неполного кадра"""
+
+    def __init__(self, seq):
+        self.send = seq  # seq следующего отсчета для передачи
+        self.pending_since = time.ticks_ms()  # с этого момента ждет неполный кадр
+        self.pending_flags = 0
+
+
+class SampleStream:
+    """Поток отсчетов для BLE: кольцевой буфер, нумерация seq, флаг кадра
+
+    Каждый клиент читает буфер своим StreamCursor: отстающий из-за занятого
+    эфира клиент догоняет сам, не заставляя остальных получать кадры заново.
+    """
+
+    def __init__(self, size, frame_flag):
+        self.samples = array('H', [0] * size)
+        self.times = array('I', [0] * size)
+        self.size = size
+        self.frame_flag = frame_flag
+        self.head = 0  # seq следующего записываемого отсчета
+        self.send = 0  # seq первого отсчета, который получили не все клиенты
+        self.cursors = {}  # соединение -> StreamCursor
+
+    def attach(self, connection):
+        # Новый клиент начинает с отсчетов, которые получили не все, - после
+        # обрыва это те, что копились без связи (CMD_RESUME уточнит)
+        self.cursors[connection] = StreamCursor(self.send)
+
+    def detach(self, connection):
+        del self.cursors[connection]
+
+    def flag(self, flag):
+        for cursor in self.cursors.values():
+            cursor.pending_flags |= flag
+
+    def resume(self, connection, seq):
+        cursor = self.cursors.get(connection)
+        if cursor is None:
+            return
+        oldest = max(0, self.head - self.size)
+        if seq == _RESUME_LIVE or seq > self.head:
+            seq = self.head
+        elif seq < oldest:
+            seq = oldest  # часть отсчетов уже перезаписана
+        cursor.send = seq
+        cursor.pending_since = time.ticks_ms()
+        cursor.pending_flags |= _FRAME_FLAG_RESUMED
+        self.send = min(self.send, seq)
+
+    @micropython.viper
+    def fill_frame(self, frame: ptr8, seq: int, count: int):
+        """Заголовок без флагов и count отсчетов начиная с seq"""
+        samples = ptr16(self.samples)
+        times = ptr32(self.times)
+        size = int(self.size)
+        index = seq % size
+
+        first = uint(times[index])
+        period = 0
+        if count > 1:
+            span = int(uint(times[(seq + count - 1) % size]) - first)
+            period = span // (count - 1)
+
+        frame[0] = _FRAME_VERSION
+        frame[1] = 0
+        frame[2] = seq & 0xFF
+        frame[3] = (seq >> 8) & 0xFF
+        frame[4] = (seq >> 16) & 0xFF
+        frame[5] = (seq >> 24) & 0xFF
+        frame[6] = int(first) & 0xFF
+        frame[7] = int(first >> 8) & 0xFF
+        frame[8] = int(first >> 16) & 0xFF
+        frame[9] = int(first >> 24) & 0xFF
+        frame[10] = period & 0xFF
+        frame[11] = (period >> 8) & 0xFF
+        for i in range(count):
+            value = samples[index]
+            frame[_FRAME_HEADER_SIZE + 2 * i] = value & 0xFF
+            frame[_FRAME_HEADER_SIZE + 2 * i + 1] = value >> 8
+            index += 1
+            if index == size:
+                index = 0
+
+    @micropython.viper
+    def fill_record(self, block: ptr8, seq: int, count: int) -> int:
+        """Блок записи: заголовок кадра, uint16 count, отсчеты по 10 бит (4 в 5 байтах)"""
+        samples = ptr16(self.samples)
+        times = ptr32(self.times)
+        size = int(self.size)
+
+        first = uint(times[seq % size])
+        period = 0
+        if count > 1:
+            span = int(uint(times[(seq + count - 1) % size]) - first)
+            period = span // (count - 1)
+
+        block[0] = _FRAME_VERSION
+        block[1] = 0
+        block[2] = seq & 0xFF
+        block[3] = (seq >> 8) & 0xFF
+        block[4] = (seq >> 16) & 0xFF
+        block[5] = (seq >> 24) & 0xFF
+        block[6] = int(first) & 0xFF
+        block[7] = int(first >> 8) & 0xFF
+        block[8] = int(first >> 16) & 0xFF
+        block[9] = int(first >> 24) & 0xFF
+        block[10] = period & 0xFF
+        block[11] = (period >> 8) & 0xFF
+        block[12] = count & 0xFF
+        block[13] = count >> 8
+
+        out = _RECORD_BLOCK_HEADER
+        i = 0
+        while i < count:
+            a = samples[(seq + i) % size] & 0x3FF
+            b = 0
+            c = 0
+            d = 0
+            if i + 1 < count:
+                b = samples[(seq + i + 1) % size] & 0x3FF
+            if i + 2 < count:
+                c = samples[(seq + i + 2) % size] & 0x3FF
+            if i + 3 < count:
+                d = samples[(seq + i + 3) % size] & 0x3FF
+            block[out] = a & 0xFF
+            block[out + 1] = (a >> 8) | ((b & 0x3F) << 2)
+            block[out + 2] = (b >> 6) | ((c & 0x0F) << 4)
+            block[out + 3] = (c >> 4) | ((d & 0x03) << 6)
+            block[out + 4] = d >> 2
+            out += 5
+            i += 4
+        return out
+
+
+class UartSource:
+    """Отсчеты от arduino.ino: блоки COBS + CRC-16 по UART"""
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.uart = UART(_UART_ID, baudrate=_UART_BAUD, tx=Pin(_UART_TX), rx=Pin(_UART_RX), rxbuf=_UART_RX_BUFFER)
+        # Накопленный блок и [длина, переполнение]
+        self.rx_chunk = bytearray(256)
+        self.rx = bytearray(_UART_MAX_ENCODED)
+        self.rx_limit = _UART_MAX_ENCODED
+        self.rx_state = array('i', [0, 0])
+        # [блоков, ошибок, потеряно отсчетов, seq известен, ожидаемый seq, перезапусков Arduino]
+        self.stats = array('I', [0] * 6)
+
+        self.send_command(_UART_CMD_STOP)  # arduino.ino могла остаться запущенной
+
+    def start(self):
+        self.send_command(_UART_CMD_START)
+
+    def stop(self):
+        self.send_command(_UART_CMD_STOP)
+
+    def set_rate(self, rate):
+        self.send_command(_UART_CMD_RATE, rate)
+
+    def report(self):
+        blocks, errors, lost, _, _, restarts = self.stats
+        return f"UART: блоков {blocks}, ошибок {errors}, потеряно отсчетов {lost}, перезапусков Arduino {restarts}"
+
+    @micropython.viper
+    def feed(self, chunk: ptr8, n: int):
+        """Накапливает байты UART до разделителя 0x00"""
+        rx = ptr8(self.rx)
+        state = ptr32(self.rx_state)
+        stats = ptr32(self.stats)
+        length = int(state[0])
+        overflow = int(state[1])
+        limit = int(self.rx_limit)
+        for i in range(n):
+            b = chunk[i]
+            if b == 0:
+                if overflow:
+                    stats[1] += 1
+                elif length > 0:
+                    self.handle_block(length)
+                length = 0
+                overflow = 0
+            elif length < limit:
+                rx[length] = b
+                length += 1
+            else:
+                overflow = 1  # блок длиннее буфера - пропускаем до разделителя
+        state[0] = length
+        state[1] = overflow
+
+    @micropython.viper
+    def handle_block(self, encoded: int):
+        """Проверяет блок от Arduino и кладет отсчеты в буферы потоков"""
+        rx = ptr8(self.rx)
+        stats = ptr32(self.stats)
+        length = int(_cobs_decode(self.rx, encoded))
+        if length < _UART_HEADER_SIZE + 2 or (length - _UART_HEADER_SIZE) & 1 or rx[0] != _FRAME_VERSION:
+            stats[1] += 1
+            return
+        if int(_crc16(self.rx, length - 2)) != rx[length - 2] | (rx[length - 1] << 8):
+            stats[1] += 1
+            return
+        stats[0] += 1
+
+        flags = rx[1]
+        seq = uint(rx[2] | (rx[3] << 8) | (rx[4] << 16)) | (uint(rx[5]) << 24)
+        first = uint(rx[6] | (rx[7] << 8) | (rx[8] << 16)) | (uint(rx[9]) << 24)
+        period = uint(rx[10] | (rx[11] << 8))
+        count = (length - _UART_HEADER_SIZE - 2) >> 1
+
+        if stats[3] and uint(stats[4]) != seq:
+            gap = int(seq - uint(stats[4]))
+            if gap > 0:
+                stats[2] += gap  # блок потерян на линии
+            else:
+                stats[5] += 1  # seq назад - Arduino перезапустилась, считаем заново
+        stats[3] = 1
+        stats[4] = seq + uint(count)
+
+        sensor = self.sensor
+        if flags & _UART_FLAG_LEAD_OFF:
+            sensor.lead_off()  # отсчеты без электродов не передаем
+            return
+
+        raw = sensor.raw
+        samples = ptr16(raw.samples)
+        times = ptr32(raw.times)
+        size = int(raw.size)
+        head = int(raw.head)
+
+        index = head % size
+        for i in range(count):
+            value = rx[_UART_HEADER_SIZE + 2 * i] | (rx[_UART_HEADER_SIZE + 2 * i + 1] << 8)
+            samples[index] = value
+            times[index] = first + uint(i) * period
+            sensor.update_envelope(value, index)
+            head += 1
+            index += 1
+            if index == size:
+                index = 0
+        raw.head = head
+
+    async def task(self):
+        while True:
+            n = self.uart.readinto(self.rx_chunk)
+            if n:
+                self.feed(self.rx_chunk, n)
+            await asyncio.sleep_ms(_UART_POLL_MS)
+
+    def send_command(self, opcode, arg=None):
+        """Команда для arduino.ino: opcode [+ uint16] + CRC-16, COBS"""
+        command = bytearray((opcode,))
+        if arg is not None:
+            command += arg.to_bytes(2, 'little')
+        command += _crc16(command, len(command)).to_bytes(2, 'little')
+        self.uart.write(_cobs_encode(command) + b'\x00')
+
+
+class AdcSource:
+    """Отсчеты с АЦП самой ESP32 по прерыванию machine.Timer, без Arduino
+
+    Прерывание только читает АЦП и электроды в промежуточный буфер и раз в
+    _ADC_BATCH отсчетов планирует drain через micropython.schedule - в нем
+    нет выделения памяти. drain переносит отсчеты в поток с временем uint32 мкс.
+    """
+
+    def __init__(self, sensor):
+        self.sensor = sensor
+        self.adc = ADC(Pin(_ADC_PIN), atten=ADC.ATTN_11DB)
+        self.lead_off_plus = Pin(_ADC_LEAD_OFF_PLUS, Pin.IN)
+        self.lead_off_minus = Pin(_ADC_LEAD_OFF_MINUS, Pin.IN)
+        self.timer = Timer(_ADC_TIMER)
+        self.rate = _SAMPLE_RATE_HZ
+        self.running = False
+
+        self.staged = array('H', [0] * _ADC_STAGE)
+        self.staged_ticks = array('I', [0] * _ADC_STAGE)
+        # [записано, прочитано, переполнений, drain запланирован,
+        #  ticks_us последнего отсчета, время uint32 мкс, время известно]
+        self.state = array('I', [0] * 7)
+        # Связанные методы создаем заранее: в прерывании нельзя выделять память
+        self._sample = self.sample
+        self._drain = self.drain
+
+    def start(self):
+        self.timer.init(freq=self.rate, mode=Timer.PERIODIC, callback=self._sample)
+        self.running = True
+
+    def stop(self):
+        self.timer.deinit()
+        self.running = False
+        self.schedule_drain()  # неполная пачка
+
+    def set_rate(self, rate):
+        self.rate = min(max(rate, _ADC_MIN_RATE_HZ), _ADC_MAX_RATE_HZ)
+        if self.running:
+            self.start()
+
+    def report(self):
+        return f"АЦП: {self.rate} Гц, отсчетов {self.state[0]}, переполнений {self.state[2]}"
+
+    def schedule_drain(self):
+        if not self.state[3] and self.state[0] != self.state[1]:
+            self.state[3] = 1
+            micropython.schedule(self._drain, None)
+
+    @micropython.viper
+    def sample(self, timer):
+        state = ptr32(self.state)
+        written = int(state[0])
+        if written - int(state[1]) >= _ADC_STAGE:
+            state[2] += 1  # drain не успевает - отсчет теряется
+            return
+        value = int(self.adc.read_u16()) >> 6  # 10 бит, шкала как у arduino.ino
+        if int(self.lead_off_plus.value()) and int(self.lead_off_minus.value()):
+            value |= _LEAD_OFF_BIT
+        index = written & (_ADC_STAGE - 1)
+        ptr16(self.staged)[index] = value
+        ptr32(self.staged_ticks)[index] = int(time.ticks_us())
+        written += 1
+        state[0] = written
+        if written - int(state[1]) >= _ADC_BATCH and not state[3]:
+            state[3] = 1
+            micropython.schedule(self._drain, None)
+
+    @micropython.viper
+    def drain(self, _):
+        """Переносит отсчеты из промежуточного буфера в поток"""
+        state = ptr32(self.state)
+        staged = ptr16(self.staged)
+        staged_ticks = ptr32(self.staged_ticks)
+        sensor = self.sensor
+        raw = sensor.raw
+        samples = ptr16(raw.samples)
+        times = ptr32(raw.times)
+        size = int(raw.size)
+        head = int(raw.head)
+        position = head % size
+
+        read = int(state[1])
+        written = int(state[0])
+        now = uint(state[5])
+        lead_off = 0
+        while read != written:
+            index = read & (_ADC_STAGE - 1)
+            value = staged[index]
+            ticks = int(staged_ticks[index])
+            read += 1
+            # ticks_us переполняется через 2^30 мкс - ведем свое время uint32, как micros()
+            if state[6]:
+                now += uint((ticks - int(state[4])) & _TICKS_MASK)
+            else:
+                now = uint(ticks)
+                state[6] = 1
+            state[4] = ticks
+            if value & _LEAD_OFF_BIT:
+                lead_off = 1
+                continue
+            samples[position] = value
+            times[position] = now
+            sensor.update_envelope(value, position)
+            head += 1
+            position += 1
+            if position == size:
+                position = 0
+
+        state[5] = now
+        state[1] = read
+        state[3] = 0
+        raw.head = head
+        if lead_off:
+            sensor.lead_off()
+
+    async def task(self):
+        # Низкие частоты и хвост пачки: не ждем _ADC_BATCH отсчетов дольше
+        while True:
+            await asyncio.sleep_ms(_ADC_FLUSH_MS)
+            self.schedule_drain()
+
+    @micropython.viper
+    def probe(self, timer):
+        """Прерывание самотеста: время каждого срабатывания с чтением АЦП"""
+        state = ptr32(self.probe_state)
+        count = int(state[0])
+        if count >= _SELF_TEST_SAMPLES:
+            return
+        self.adc.read_u16()
+        ptr32(self.probe_ticks)[count] = int(time.ticks_us())
+        state[0] = count + 1
+
+    def self_test(self):
+        """Джиттер таймера и устойчивая частота всего пути до буфера потока"""
+        period_us = 1_000_000 / self.rate
+
+        self.probe_ticks = array('I', [0] * _SELF_TEST_SAMPLES)
+        self.probe_state = array('I', [0])
+        self.timer.init(freq=self.rate, mode=Timer.PERIODIC, callback=self.probe)
+        deadline = time.ticks_add(time.ticks_ms(), _SELF_TEST_SAMPLES * 1000 // self.rate + 500)
+        while self.probe_state[0] < _SELF_TEST_SAMPLES and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            time.sleep_ms(10)
+        self.timer.deinit()
 
-# Тест работы
-print("\n🎯 Начинаем основной цикл...")
-print("📝 Отправляем 'TEST:X' в UART каждые 3 секунды")
-print("📖 Читаем данные из UART если есть")
-print("⏹️  Нажмите Ctrl+C в мониторе порта для остановки")
+        count = self.probe_state[0]
+        if count > 1:
+            intervals = [time.ticks_diff(self.probe_ticks[i + 1], self.probe_ticks[i]) for i in range(count - 1)]
+            mean = sum(intervals) / len(intervals)
+            std = (sum((x - mean) ** 2 for x in intervals) / len(intervals)) ** 0.5
+            worst = max(abs(x - period_us) for x in intervals)
+            print(f"🧪 Таймер: период {mean:.1f} мкс (ожидалось {period_us:.0f}), "
+                  f"джиттер σ {std:.1f} мкс, макс отклонение {worst:.0f} мкс")
+        else:
+            print("❌ Таймер: прерывания не срабатывают")
+        del self.probe_ticks, self.probe_state
+
+        raw = self.sensor.raw
+        head = raw.head
+        overflows = self.state[2]
+        started = time.ticks_us()
+        self.start()
+        time.sleep_ms(_SELF_TEST_MS)
+        self.stop()
+        time.sleep_ms(50)  # последний drain
+        elapsed = time.ticks_diff(time.ticks_us(), started) / 1_000_000
+        received = raw.head - head
+        print(f"🧪 Устойчивая частота: {received / elapsed:.0f} Гц из {self.rate}, "
+              f"переполнений {self.state[2] - overflows}")
+
+        # Отсчеты самотеста не передаем
+        for stream in (raw, self.sensor.envelope):
+            stream.send = stream.head
+        gc.collect()
+
+
+class Recorder:
+    """Запись сырого сигнала во флеш без клиента и выгрузка записей
+
+    Запись идет по CMD_RECORD или сама, если связь потеряна во время замера
+    дольше, чем помещается в кольцевом буфере: короткий обрыв клиент догонит
+    по CMD_RESUME, а в файл попадают только отсчеты, которые буфер потеряет.
+    Такая запись заканчивается при переподключении. Файл - заголовок
+    _RECORD_MAGIC и блоки по _RECORD_BLOCK_SAMPLES отсчетов, упакованных по
+    10 бит. Выгрузка - CMD_SYNC: через L2CAP одним потоком или уведомлениями
+    характеристики записей, если хост не умеет L2CAP.
+    """
+
+    def __init__(self, sensor, records):
+        self.sensor = sensor
+        self.records = records  # характеристика: каталог и выгрузка по GATT
+        self.file = None
+        self.auto = False  # запись начата из-за обрыва связи
+        self.seq = 0  # seq сырого потока следующего записываемого отсчета
+        self.blocks = 0
+        self.block = bytearray(_RECORD_BLOCK_SIZE)
+        self.block_view = memoryview(self.block)
+        self.sync_buffer = bytearray(_SYNC_CHUNK)
+        try:
+            os.mkdir(_RECORD_DIR)
+        except OSError:
+            pass  # уже есть
+        self.publish_catalog()
+
+    @staticmethod
+    def path(record_id):
+        return f"{_RECORD_DIR}/{record_id:05d}.emg"
+
+    def catalog(self):
+        """[(id, размер)] записей во флеше"""
+        entries = []
+        for name, *_ in os.ilistdir(_RECORD_DIR):
+            if name.endswith('.emg') and not (self.file and name == f"{self.record_id:05d}.emg"):
+                entries.append((int(name[:-4]), os.stat(f"{_RECORD_DIR}/{name}")[6]))
+        return sorted(entries)
+
+    def publish_catalog(self):
+        entries = self.catalog()[:_RECORD_CATALOG_MAX]
+        data = bytearray(6 * len(entries))
+        for i, (record_id, size) in enumerate(entries):
+            data[6 * i:6 * i + 6] = record_id.to_bytes(2, 'little') + size.to_bytes(4, 'little')
+        self.records.write(data)
+
+    def start(self, auto=False):
+        if self.file:
+            return
+        entries = self.catalog()
+        self.record_id = entries[-1][0] + 1 if entries else 1
+        self.file = open(self.path(self.record_id), 'wb')
+        self.file.write(_RECORD_MAGIC + bytes((_RECORD_VERSION, 10)) + self.sensor.rate.to_bytes(2, 'little'))
+        self.auto = auto
+        # Без связи - с первого отсчета, который клиент не получил
+        self.seq = self.sensor.raw.send if auto else self.sensor.raw.head
+        self.blocks = 0
+        print(f"💾 Запись {self.record_id} во флеш{' (нет связи)' if auto else ''}")
+
+    def stop(self):
+        if not self.file:
+            return
+        self.write_blocks(final=True)
+        self.file.close()
+        self.file = None
+        if self.auto and not self.blocks:
+            os.remove(self.path(self.record_id))  # клиент вернулся раньше, чем буфер что-то потерял
+        print(f"💾 Запись {self.record_id} завершена: блоков {self.blocks}")
+        self.publish_catalog()
+
+    def headroom(self):
+        raw = self.sensor.raw
+        return min(raw.size // 2, self.sensor.rate * _RECORD_AUTO_HEADROOM_MS // 1000)
+
+    def outlasts_backlog(self):
+        """Неотправленные отсчеты вот-вот начнут перезаписываться"""
+        raw = self.sensor.raw
+        return raw.head - raw.send >= raw.size - self.headroom()
+
+    def write_blocks(self, final=False):
+        raw = self.sensor.raw
+        if raw.head - self.seq > raw.size:
+            self.seq = raw.head - raw.size  # флеш не успевала - пропуск виден по seq блока
+        # Запись без связи отстает от буфера: последние отсчеты клиент получит по CMD_RESUME
+        end = raw.head - raw.size + self.headroom() if self.auto else raw.head
+        while True:
+            count = min(end - self.seq, _RECORD_BLOCK_SAMPLES)
+            if count <= 0 or (count < _RECORD_BLOCK_SAMPLES and not final):
+                return
+            length = raw.fill_record(self.block, self.seq, count)
+            self.file.write(self.block_view[:length])
+            self.seq += count
+            self.blocks += 1
+            if self.blocks % _RECORD_SPACE_CHECK_BLOCKS == 0:
+                self.file.flush()
+                stat = os.statvfs(_RECORD_DIR)
+                if stat[0] * stat[3] < _RECORD_MIN_FREE:
+                    print("⚠️ Флеш заполнена - запись остановлена")
+                    self.stop()
+                    return
+
+    async def task(self):
+        while True:
+            await asyncio.sleep_ms(_RECORD_INTERVAL_MS)
+            sensor = self.sensor
+            if sensor.acquiring and not sensor.connections and not self.file and self.outlasts_backlog():
+                self.start(auto=True)
+            elif self.file and self.auto and sensor.connections:
+                self.stop()  # клиент вернулся - дальше отсчеты идут ему
+            if self.file:
+                self.write_blocks()
+
+    async def sync(self, connection, record_id, transport):
+        """Выгружает запись клиенту, приславшему CMD_SYNC: заголовок <HI (id, размер), затем содержимое файла"""
+        try:
+            size = os.stat(self.path(record_id))[6]
+        except OSError:
+            print(f"❌ Записи {record_id} нет")
+            return
+        started = time.ticks_ms()
+        try:
+            with open(self.path(record_id), 'rb') as f:
+                if transport == _SYNC_L2CAP:
+                    await self.sync_l2cap(connection, f, record_id, size)
+                else:
+                    await self.sync_gatt(connection, f)
+        except Exception as e:
+            print(f"❌ Выгрузка записи {record_id}: {e}")
+            return
+        elapsed = max(1, time.ticks_diff(time.ticks_ms(), started))
+        print(f"📤 Запись {record_id}: {size} байт за {elapsed} мс ({size * 1000 // elapsed} байт/с)")
+
+    async def sync_l2cap(self, connection, f, record_id, size):
+        try:
+            channel = await connection.l2cap_accept(_L2CAP_PSM, _L2CAP_MTU, timeout_ms=_SYNC_TIMEOUT_MS)
+        except asyncio.TimeoutError:
+            # Хост не открыл канал (нет L2CAP) - aioble сам не снимает ожидающий канал
+            connection._l2cap_channel = None
+            raise
+        try:
+            await channel.send(record_id.to_bytes(2, 'little') + size.to_bytes(4, 'little'))
+            view = memoryview(self.sync_buffer)
+            while True:
+                n = f.readinto(self.sync_buffer)
+                if not n:
+                    break
+                await channel.send(view[:n])  # send делит на куски по MTU канала
+            await channel.flush()
+        finally:
+            await channel.disconnect()
+
+    async def sync_gatt(self, connection, f):
+        """Уведомления характеристики записей: uint32 смещение + данные, в конце - пустой кусок"""
+        chunk = min(len(self.sync_buffer), (connection.mtu or _DEFAULT_MTU) - 3 - 4)
+        packet = bytearray(4 + chunk)
+        view = memoryview(packet)
+        stream = self.records.stream(connection)  # ждет свободные буферы контроллера
+        offset = 0
+        while True:
+            n = f.readinto(view[4:])
+            packet[0:4] = offset.to_bytes(4, 'little')
+            await stream.send(view[:4 + (n or 0)])
+            if not n:
+                print(f"📤 {offset} байт уведомлениями: {stream.throughput()} байт/с, "
+                      f"ожиданий контроллера {stream.busy}")
+                return
+            offset += n
+
+    def delete(self, record_id):
+        try:
+            os.remove(self.path(record_id))
+            print(f"🗑️ Запись {record_id} удалена")
+        except OSError:
+            pass
+        self.publish_catalog()
+
+
+class SensorPeripheral:
+    """Огибающая и передача кадров всем подключенным клиентам"""
+
+    def __init__(self):
+        self.raw = SampleStream(_RAW_BACKLOG, 0)
+        self.envelope = SampleStream(_ENVELOPE_BACKLOG, _FRAME_FLAG_ENVELOPE)
+        self.mode = _MODE_RAW  # старые клиенты ждут сырой сигнал
+        self.acquiring = False
+        self.frame_limit = _FRAME_MAX_SAMPLES
+        self.rate = _SAMPLE_RATE_HZ
+        self.connections = []  # до _MAX_CENTRALS, кадры - каждому подписанному
+        self.slot_free = asyncio.Event()
+
+        # Огибающая: квадраты отсчетов в окне и состояние
+        # [dc << shift, dc готов, сумма квадратов, позиция в окне, заполнено, счетчик прореживания]
+        self.squares = array('I', [0] * _ENVELOPE_WINDOW)
+        self.envelope_state = array('i', [0] * 6)
+
+        # Кадр уведомления и готовые срезы под каждое число отсчетов
+        self.frame = bytearray(_FRAME_HEADER_SIZE + _FRAME_MAX_SAMPLES * 2)
+        view = memoryview(self.frame)
+        self.frame_views = [view[:_FRAME_HEADER_SIZE + 2 * n] for n in range(_FRAME_MAX_SAMPLES + 1)]
+
+        service = aioble.Service(_SERVICE_UUID)
+        self.data = aioble.Characteristic(service, _CHARACTERISTIC_UUID, read=True, notify=True)
+        self.control = aioble.Characteristic(service, _CONTROL_UUID, write=True, capture=True)
+        records = aioble.BufferedCharacteristic(
+            service, _RECORDS_UUID, read=True, notify=True, max_len=6 * _RECORD_CATALOG_MAX
+        )
+        self.echo = aioble.Characteristic(
+            service, _ECHO_UUID, write=True, write_no_response=True, notify=True, capture=True
+        )
+        aioble.register_services(service)
+        aioble.config(mtu=_MTU)
+
+        self.source = AdcSource(self) if SOURCE == 'adc' else UartSource(self)
+        self.recorder = Recorder(self, records)
+
+    # --- Прием отсчетов ---
+
+    def lead_off(self):
+        """Электроды отключены - флаг следующего кадра обоих потоков"""
+        self.raw.flag(_FRAME_FLAG_LEAD_OFF)
+        self.envelope.flag(_FRAME_FLAG_LEAD_OFF)
+
+    @micropython.viper
+    def update_envelope(self, value: int, index: int):
+        """Скользящее RMS, каждые _ENVELOPE_DECIMATION отсчетов - значение огибающей
+
+        index - позиция отсчета в буфере сырого потока: время берется оттуда,
+        чтобы uint32 не превращался в длинное целое при вызове.
+        """
+        state = ptr32(self.envelope_state)
+        squares = ptr32(self.squares)
+        if not state[1]:
+            state[0] = value << _ENVELOPE_DC_SHIFT
+            state[1] = 1
+        dc = int(state[0])
+        dc += value - (dc >> _ENVELOPE_DC_SHIFT)
+        state[0] = dc
+        ac = value - (dc >> _ENVELOPE_DC_SHIFT)
+
+        square = ac * ac
+        position = int(state[3])
+        total = int(state[2]) + square - int(squares[position])
+        squares[position] = square
+        state[2] = total
+        state[3] = (position + 1) % _ENVELOPE_WINDOW
+        if int(state[4]) < _ENVELOPE_WINDOW:
+            state[4] += 1
+
+        state[5] += 1
+        if int(state[5]) < _ENVELOPE_DECIMATION:
+            return
+        state[5] = 0
+
+        envelope = self.envelope
+        head = int(envelope.head)
+        size = int(envelope.size)
+        ptr16(envelope.samples)[head % size] = int(_isqrt(total // int(state[4])))
+        ptr32(envelope.times)[head % size] = ptr32(self.raw.times)[index]
+        envelope.head = head + 1
+
+    # --- Передача кадров ---
+
+    def stream_enabled(self, stream):
+        if stream is self.envelope:
+            return self.mode != _MODE_RAW
+        return self.mode != _MODE_ENVELOPE
+
+    def frame_capacity(self, connection):
+        """Сколько отсчетов помещается в одно уведомление при MTU клиента"""
+        capacity = ((connection.mtu or _DEFAULT_MTU) - 3 - _FRAME_HEADER_SIZE) // 2
+        return max(1, min(capacity, self.frame_limit))
+
+    def transmit(self, stream):
+        """Кадры потока каждому подписанному клиенту с его позиции"""
+        oldest = stream.head - stream.size
+        send = stream.head
+        for connection, cursor in stream.cursors.items():
+            if cursor.send < oldest:
+                cursor.send = oldest  # самые старые отсчеты уже перезаписаны
+            if self.data.is_subscribed(connection):
+                self.transmit_to(connection, stream, cursor)
+            send = min(send, cursor.send)
+        if stream.cursors:
+            stream.send = send
+
+    def transmit_to(self, connection, stream, cursor):
+        """Полные кадры, неполный - по таймауту"""
+        capacity = self.frame_capacity(connection)
+        for _ in range(_FRAMES_PER_PASS):
+            pending = stream.head - cursor.send
+            if pending >= capacity:
+                count = capacity
+            elif (pending or cursor.pending_flags) and \
+                    time.ticks_diff(time.ticks_ms(), cursor.pending_since) >= _FRAME_TIMEOUT_MS:
+                count = pending
+            else:
+                if not pending and not cursor.pending_flags:
+                    cursor.pending_since = time.ticks_ms()  # таймаут - от появления отсчета
+                return
+
+            flags = cursor.pending_flags | stream.frame_flag
+            if pending - count >= capacity:
+                flags |= _FRAME_FLAG_BACKLOG
+            stream.fill_frame(self.frame, cursor.send, count)
+            self.frame[1] = flags
+            try:
+                self.data.notify(connection, self.frame_views[count])
+            except OSError:
+                return  # буферы контроллера заняты - повторим в следующий проход
+
+            cursor.send += count
+            cursor.pending_flags = 0
+            cursor.pending_since = time.ticks_ms()
+            if count < capacity:
+                return
+
+    async def transmit_task(self):
+        while True:
+            await asyncio.sleep_ms(_TRANSMIT_INTERVAL_MS)
+            if not self.connections:
+                continue  # отсчеты копятся в буфере до переподключения
+            for stream in (self.raw, self.envelope):
+                if self.stream_enabled(stream):
+                    self.transmit(stream)
+
+    # --- Управление ---
+
+    def handle_command(self, connection, data):
+        opcode = data[0] if data else None
+        if opcode == _CMD_RESUME and len(data) >= 5:
+            self.raw.resume(connection, int.from_bytes(data[1:5], 'little'))
+            self.envelope.resume(connection, int.from_bytes(data[5:9], 'little') if len(data) >= 9 else _RESUME_LIVE)
+        elif opcode == _CMD_MODE and len(data) == 2 and data[1] <= _MODE_BOTH:
+            self.set_mode(data[1])
+        elif opcode == _CMD_START:
+            self.acquiring = True
+            self.source.start()
+            print("▶️ Оцифровка запущена")
+        elif opcode == _CMD_STOP:
+            self.acquiring = False
+            self.source.stop()
+            self.recorder.stop()
+            print("⏹️ Оцифровка остановлена")
+        elif opcode == _CMD_RATE and len(data) == 3:
+            rate = int.from_bytes(data[1:3], 'little')
+            self.rate = rate
+            self.source.set_rate(rate)
+            print(f"🎚️ Частота оцифровки: {rate} Гц")
+        elif opcode == _CMD_FRAME_SIZE and len(data) == 2:
+            self.frame_limit = data[1] if 0 < data[1] < _FRAME_MAX_SAMPLES else _FRAME_MAX_SAMPLES
+        elif opcode == _CMD_RECORD and len(data) == 2:
+            if data[1]:
+                # Запись продолжается и после отключения клиента
+                if not self.acquiring:
+                    self.acquiring = True
+                    self.source.start()
+                self.recorder.start()
+            else:
+                self.recorder.stop()
+        elif opcode == _CMD_SYNC and len(data) == 4:
+            asyncio.create_task(self.recorder.sync(connection, int.from_bytes(data[1:3], 'little'), data[3]))
+        elif opcode == _CMD_DELETE and len(data) == 3:
+            self.recorder.delete(int.from_bytes(data[1:3], 'little'))
+
+    def set_mode(self, mode):
+        if mode == self.mode:
+            return
+        self.mode = mode
+        # Включенный поток начинаем с новых отсчетов, без накопленного буфера
+        for stream in (self.raw, self.envelope):
+            if self.stream_enabled(stream):
+                stream.send = stream.head
+                for cursor in stream.cursors.values():
+                    cursor.send = stream.head
+                    cursor.pending_since = time.ticks_ms()
+        print(f"🎚️ Режим передачи: {mode}")
+
+    async def control_task(self):
+        while True:
+            connection, data = await self.control.written()
+            self.handle_command(connection, data)
+
+    async def echo_task(self):
+        """Записанное в характеристику эха возвращается уведомлением (GUI/ble_benchmark.py)"""
+        while True:
+            connection, data = await self.echo.written()
+            while connection.is_connected():
+                try:
+                    self.echo.notify(connection, data)
+                    break
+                except OSError:
+                    await asyncio.sleep_ms(1)  # буферы контроллера заняты кадрами
+
+    async def peripheral_task(self):
+        """Реклама, пока есть место для еще одного клиента"""
+        while True:
+            while len(self.connections) >= _MAX_CENTRALS:
+                self.slot_free.clear()
+                await self.slot_free.wait()
+            connection = await aioble.advertise(_ADV_INTERVAL_US, services=[_SERVICE_UUID])
+            self.connections.append(connection)
+            for stream in (self.raw, self.envelope):
+                stream.attach(connection)
+            # NimBLE не сообщает о записи CCCD - считаем клиента подписанным, как и раньше
+            self.data.subscribe(connection)
+            print(f"🔗 Устройство подключено: {connection.device} (клиентов {len(self.connections)})")
+            asyncio.create_task(self.connection_task(connection))
+
+    async def connection_task(self, connection):
+        await connection.disconnected(timeout_ms=None)
+        self.connections.remove(connection)
+        for stream in (self.raw, self.envelope):
+            stream.detach(connection)
+        self.slot_free.set()
+        print(f"🔌 Устройство отключено (клиентов {len(self.connections)})")
+
+    async def stats_task(self):
+        while True:
+            await asyncio.sleep_ms(_STATS_INTERVAL_MS)
+            if self.acquiring:
+                print(f"📊 {self.source.report()}, отсчетов {self.raw.head}, память {gc.mem_free()} байт")
+
+
+class UartBenchmark(UartSource):
+    """Пропускная способность, потери, ошибки CRC и джиттер линии UART
+
+    'loopback' - перемычка TX->RX: ESP32 сама шлет блоки формата arduino.ino
+    на разных скоростях и размерах блока. 'arduino' - настоящая линия: скорость
+    _UART_BAUD, блоки по 32 отсчета, arduino.ino оцифровывает на разных частотах.
+    Разбор тот же, что у UartSource (feed), без BLE и потоков отсчетов.
+    """
+
+    def __init__(self, mode):
+        self.mode = mode
+        self.uart = UART(_UART_ID, baudrate=_UART_BAUD, tx=Pin(_UART_TX), rx=Pin(_UART_RX), rxbuf=_UART_RX_BUFFER)
+        self.rx_chunk = bytearray(512)
+        self.rx = bytearray(_UART_MAX_ENCODED)
+        self.rx_limit = _UART_MAX_ENCODED
+        self.rx_state = array('i', [0, 0])
+        # [блоков, ошибок, потеряно отсчетов, seq известен, ожидаемый seq, байт, следить за seq]
+        self.stats = array('I', [0] * 7)
+        self.arrivals = array('I', [0] * _BENCH_ARRIVALS)
+        self.results = []
+
+    @micropython.viper
+    def handle_block(self, encoded: int):
+        """Считает блок и запоминает время его прихода"""
+        rx = ptr8(self.rx)
+        stats = ptr32(self.stats)
+        length = int(_cobs_decode(self.rx, encoded))
+        if length < _UART_HEADER_SIZE + 2 or int(_crc16(self.rx, length - 2)) != rx[length - 2] | (rx[length - 1] << 8):
+            stats[1] += 1
+            return
+
+        received = int(stats[0])
+        if received < _BENCH_ARRIVALS:
+            ptr32(self.arrivals)[received] = int(time.ticks_us())
+        stats[0] = received + 1
+        stats[5] += encoded + 1  # с разделителем
+
+        if stats[6]:
+            seq = uint(rx[2] | (rx[3] << 8) | (rx[4] << 16)) | (uint(rx[5]) << 24)
+            count = (length - _UART_HEADER_SIZE - 2) >> 1
+            gap = int(seq - uint(stats[4]))
+            if stats[3] and gap > 0:
+                stats[2] += gap  # seq назад - перезапуск Arduino, а не потеря
+            stats[3] = 1
+            stats[4] = seq + uint(count)
+
+    def reset(self, baud, track_seq):
+        self.uart.init(baudrate=baud, tx=Pin(_UART_TX), rx=Pin(_UART_RX), rxbuf=_UART_RX_BUFFER)
+        while self.uart.readinto(self.rx_chunk):
+            pass  # остатки прошлого прогона
+        self.rx_state[0] = self.rx_state[1] = 0
+        for i in range(len(self.stats)):
+            self.stats[i] = 0
+        self.stats[6] = track_seq
+
+    def poll(self):
+        n = self.uart.readinto(self.rx_chunk)
+        if n:
+            self.feed(self.rx_chunk, n)
+
+    def make_blocks(self, samples):
+        """Блоки формата arduino.ino, закодированные заранее (передача без CRC и COBS в цикле)"""
+        blocks = []
+        for i in range(_BENCH_BLOCK_VARIANTS):
+            block = bytearray(_UART_HEADER_SIZE + 2 * samples)
+            block[0] = _FRAME_VERSION
+            block[2:6] = (i * samples).to_bytes(4, 'little')
+            block[10:12] = (1000).to_bytes(2, 'little')
+            for j in range(samples):
+                # Значения с нулевыми байтами и 0xFF - проверка COBS
+                block[_UART_HEADER_SIZE + 2 * j:_UART_HEADER_SIZE + 2 * j + 2] = ((i * 37 + j * 255) & 0x3FF).to_bytes(2, 'little')
+            block += _crc16(block, len(block)).to_bytes(2, 'little')
+            blocks.append(bytes(_cobs_encode(block) + b'\x00'))
+        return blocks
+
+    def run_loopback(self, baud, samples):
+        blocks = self.make_blocks(samples)
+        self.reset(baud, 0)  # блоки повторяются по кругу - потери считаем по числу отправленных
+        sent = 0
+        started = time.ticks_us()
+        deadline = time.ticks_add(time.ticks_ms(), _BENCH_DURATION_MS)
+        while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            self.uart.write(blocks[sent % _BENCH_BLOCK_VARIANTS])
+            sent += 1
+            self.poll()
+        time.sleep_ms(_BENCH_SETTLE_MS)
+        self.poll()
+        elapsed = time.ticks_diff(time.ticks_us(), started)
+        self.record(baud, samples, elapsed, sent - self.stats[0])
+
+    def run_arduino(self, rate):
+        self.reset(_UART_BAUD, 1)
+        self.send_command(_UART_CMD_RATE, rate)
+        self.send_command(_UART_CMD_START)
+        started = time.ticks_us()
+        deadline = time.ticks_add(time.ticks_ms(), _BENCH_DURATION_MS)
+        while time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            self.poll()
+            time.sleep_ms(1)
+        self.send_command(_UART_CMD_STOP)
+        time.sleep_ms(_BENCH_SETTLE_MS)
+        self.poll()
+        elapsed = time.ticks_diff(time.ticks_us(), started)
+        lost_blocks = (self.stats[2] + _BENCH_ARDUINO_BLOCK - 1) // _BENCH_ARDUINO_BLOCK
+        self.record(_UART_BAUD, _BENCH_ARDUINO_BLOCK, elapsed, lost_blocks, rate)
+
+    def record(self, baud, samples, elapsed_us, lost, rate=None):
+        received = self.stats[0]
+        count = min(received, _BENCH_ARRIVALS)
+        intervals = [time.ticks_diff(self.arrivals[i + 1], self.arrivals[i]) for i in range(count - 1)]
+        mean = sum(intervals) / len(intervals) if intervals else 0
+        std = (sum((x - mean) ** 2 for x in intervals) / len(intervals)) ** 0.5 if intervals else 0
+        worst = max((abs(x - mean) for x in intervals), default=0)
+        self.results.append((baud, samples, rate, self.stats[5] * 1_000_000 // max(1, elapsed_us),
+                             received, max(0, lost), self.stats[1], mean, std, worst))
+        gc.collect()
+
+    def run(self):
+        print(f"🧪 Тест UART: {'петля TX->RX' if self.mode == 'loopback' else 'линия arduino.ino'}, "
+              f"{_BENCH_DURATION_MS} мс на прогон")
+        if self.mode == 'loopback':
+            for baud in _BENCH_BAUDS:
+                for samples in _BENCH_BLOCK_SAMPLES:
+                    self.run_loopback(baud, samples)
+        else:
+            self.send_command(_UART_CMD_STOP)
+            for rate in _BENCH_RATES:
+                self.run_arduino(rate)
+        self.uart.init(baudrate=_UART_BAUD, tx=Pin(_UART_TX), rx=Pin(_UART_RX), rxbuf=_UART_RX_BUFFER)
+        self.print_summary()
+
+    def print_summary(self):
+        print("   бод    отсч  Гц    байт/с  блоков  потеряно  CRC  интервал σ, мкс  макс, мкс")
+        best = None
+        for baud, samples, rate, speed, received, lost, errors, mean, std, worst in self.results:
+            print(f"{baud:>8} {samples:>5} {rate or '-':>5} {speed:>8} {received:>7} {lost:>9} {errors:>4} "
+                  f"{mean:>9.0f} {std:>6.0f} {worst:>10.0f}")
+            if received and not lost and not errors and (best is None or speed > best[3]):
+                best = (baud, samples, rate, speed)
+        if best:
+            print(f"✅ Быстрее всего без потерь: {best[0]} бод, {best[1]} отсчетов в блоке - {best[3]} байт/с")
+        else:
+            print("❌ Ни один прогон не прошел без потерь - проверьте провода и общую землю")
+
+
+class TimeoutBenchmark:
+    """Цена таймаута операции GATT в aioble: общий таймер против задачи на операцию
+
+    Операция устроена как ClientCharacteristic.read()/write(): with
+    connection.timeout(), затем ожидание ответа, который приходит в следующем
+    проходе цикла asyncio. Соединение не нужно - замеряется только таймаут.
+    """
+
+    def __init__(self):
+        self.connection = DeviceConnection(Device(0, bytes(6)))
+        self.timeouts = []
+
+    async def shared(self):
+        with self.connection.timeout(_BENCH_TIMEOUT_MS):
+            await asyncio.sleep_ms(0)
+
+    async def _timeout_sleep(self):
+        # sleep_ms в MicroPython - не корутина, create_task нужна обертка
+        await asyncio.sleep_ms(_BENCH_TIMEOUT_MS)
+
+    async def task_per_op(self):
+        # Как DeviceTimeout до общего таймера: задача со sleep и список таймаутов соединения
+        timeout = asyncio.create_task(self._timeout_sleep())
+        self.timeouts.append(timeout)
+        try:
+            await asyncio.sleep_ms(0)
+        finally:
+            self.timeouts.remove(timeout)
+            timeout.cancel()
+
+    async def measure(self, op):
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(_BENCH_ALLOC_OPS):
+            await op()
+        allocated = (gc.mem_alloc() - before) // _BENCH_ALLOC_OPS
+        gc.enable()
+
+        gc.collect()
+        worst = 0
+        started = time.ticks_us()
+        for _ in range(_BENCH_OPS):
+            op_started = time.ticks_us()
+            await op()
+            worst = max(worst, time.ticks_diff(time.ticks_us(), op_started))
+        elapsed = time.ticks_diff(time.ticks_us(), started)
+        await asyncio.sleep_ms(10)  # отмененные задачи завершаются
+        return elapsed // _BENCH_OPS, allocated, worst
+
+    async def main(self):
+        print(f"⏱️ Таймауты aioble: {_BENCH_OPS} операций подряд")
+        for name, op in (("общий таймер", self.shared), ("задача на операцию", self.task_per_op)):
+            per_op, allocated, worst = await self.measure(op)
+            print(f"   {name}: {per_op} мкс/операцию, {allocated} байт/операцию, худшая {worst} мкс")
+
+    def run(self):
+        asyncio.run(self.main())
+
+
+async def main():
+    sensor = SensorPeripheral()
+    if SOURCE == 'adc':
+        sensor.source.self_test()
+    gc.collect()
+    print(f"📊 Память: свободно {gc.mem_free()} байт, использовано {gc.mem_alloc()} байт")
+    print("📡 Ожидание подключения...")
+    await asyncio.gather(
+        sensor.peripheral_task(),
+        sensor.control_task(),
+        sensor.echo_task(),
+        sensor.source.task(),
+        sensor.transmit_task(),
+        sensor.recorder.task(),
+        sensor.stats_task(),
+    )
+
+
+print("=" * 50)
+print("🔧 ДАТЧИК ЭМГ (MicroPython, aioble)")
+print("=" * 50)
 
-counter = 0
 try:
-    while True:
-        # Чтение из UART
-        if uart.any():
-            data = uart.readline()
-            if data:
-                clean_data = data.decode('utf-8', errors='ignore').strip()
-                print(f"📨 ВХОД: {clean_data} (сырые байты: {data})")
-        
-        # Запись в UART
-        test_message = f"TEST:{counter}"
-        uart.write(test_message + '\n')
-        print(f"📤 ВЫХОД: {test_message}")
-        
-        counter += 1
-        time.sleep(3)
-        
+    if BENCHMARK == 'timeouts':
+        TimeoutBenchmark().run()
+    elif BENCHMARK:
+        UartBenchmark(BENCHMARK).run()
+    else:
+        asyncio.run(main())
 except KeyboardInterrupt:
     print("\n🛑 Остановлено пользователем")
 except Exception as e:
     print(f"💥 Критическая ошибка: {e}")
     print("🔄 Перезагрузка через 5 секунд...")
     time.sleep(5)
-    reset()
\ No newline at end of file
+    reset()
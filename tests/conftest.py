@@ -0,0 +1,89 @@
+"""Запуск тестов под CPython: заглушки MicroPython для esp32/lib/aioble и путь к GUI
+
+aioble написан для MicroPython - ему нужны модули micropython и bluetooth,
+asyncio.ThreadSafeFlag/sleep_ms и time.ticks_*. Здесь их минимальные подмены:
+радио нет, FakeBLE только записывает вызовы, а тесты сами подают события IRQ.
+"""
+import asyncio
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'esp32', 'lib'))
+sys.path.insert(0, os.path.join(ROOT, 'GUI'))
+
+
+class FakeBLE:
+    """bluetooth.BLE без контроллера: вызовы складываются в calls"""
+
+    def __init__(self):
+        self.calls = []
+        self.values = {}  # Значения атрибутов GATT по хендлу
+        self.busy = False  # gatts_notify/gatts_indicate: буферы контроллера заняты
+
+    def active(self, *args):
+        return True
+
+    def irq(self, handler):
+        self.handler = handler
+
+    def config(self, *args, **kwargs):
+        return 0
+
+    def gatts_read(self, value_handle):
+        return self.values.get(value_handle, b'')
+
+    def gatts_write(self, value_handle, data, send_update=False):
+        self.values[value_handle] = bytes(data)
+
+    def gatts_notify(self, conn_handle, value_handle, data=None):
+        if self.busy:
+            raise OSError(12)
+        self.calls.append(('notify', conn_handle, value_handle, bytes(data) if data is not None else None))
+
+    def gatts_indicate(self, conn_handle, value_handle, data=None):
+        if self.busy:
+            raise OSError(12)
+        self.calls.append(('indicate', conn_handle, value_handle, bytes(data) if data is not None else None))
+
+    def __getattr__(self, name):
+        # Остальные методы BLE (gap_scan, gattc_* ...) просто записываются
+        return lambda *args: self.calls.append((name,) + args)
+
+
+class ThreadSafeFlag:
+    """asyncio.ThreadSafeFlag MicroPython: один ожидающий, set() запоминается"""
+
+    def __init__(self):
+        self.state = False
+        self._event = None
+
+    def set(self):
+        self.state = True
+        if self._event:
+            self._event.set()
+
+    def clear(self):
+        self.state = False
+
+    async def wait(self):
+        if not self.state:
+            self._event = asyncio.Event()
+            try:
+                await self._event.wait()
+            finally:
+                self._event = None
+        self.state = False
+
+
+ble = FakeBLE()
+sys.modules.setdefault('micropython', types.SimpleNamespace(const=lambda value: value))
+sys.modules.setdefault('bluetooth', types.SimpleNamespace(BLE=lambda: ble, UUID=lambda value: value))
+asyncio.ThreadSafeFlag = ThreadSafeFlag
+asyncio.sleep_ms = lambda ms: asyncio.sleep(ms / 1000)
+time.ticks_ms = lambda: int(time.monotonic() * 1000)
+time.ticks_us = lambda: int(time.monotonic() * 1_000_000)
+time.ticks_add = lambda ticks, delta: ticks + delta
+time.ticks_diff = lambda a, b: a - b
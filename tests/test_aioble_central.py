@@ -0,0 +1,35 @@
+"""scan(): фильтры отчетов рекламы в IRQ"""
+from aioble.central import scan
+
+NAME = b'EMG'
+ADDR = bytes.fromhex('aabbccddeeff')
+OTHER = bytes.fromhex('112233445566')
+
+
+def report(scanner, addr, payload):
+    scanner._irq_result(0, memoryview(addr), 0, -50, memoryview(payload))
+
+
+def advertising(name):
+    return bytes([len(name) + 1, 0x09]) + name
+
+
+def test_name_filter_keeps_matched_device():
+    scanner = scan(1000, name=NAME)
+    report(scanner, OTHER, advertising(b'other'))
+    assert not scanner._queue
+
+    report(scanner, ADDR, advertising(NAME))
+    # Ответ на сканирование без имени - от устройства, прошедшего фильтр
+    report(scanner, ADDR, b'\x02\x01\x06')
+    report(scanner, OTHER, b'\x02\x01\x06')
+    assert [(addr, data) for _, addr, _, _, data in scanner._queue] == [
+        (ADDR, advertising(NAME)), (ADDR, b'\x02\x01\x06'),
+    ]
+
+
+def test_addr_filter():
+    scanner = scan(1000, addr=['aa:bb:cc:dd:ee:ff'])
+    report(scanner, OTHER, b'')
+    report(scanner, ADDR, b'')
+    assert [addr for _, addr, _, _, _ in scanner._queue] == [ADDR]
@@ -0,0 +1,107 @@
+"""ClientCharacteristic.capture(): очередь уведомлений в пуле буферов"""
+import asyncio
+
+import pytest
+
+from aioble.client import ClientCharacteristic, _CapturePool, _FLAG_NOTIFY
+from aioble.device import Device, DeviceConnection
+
+CONN_HANDLE = 1
+VALUE_HANDLE = 42
+
+
+def make_characteristic(depth):
+    connection = DeviceConnection(Device(0, bytes(6)))
+    connection._conn_handle = CONN_HANDLE
+    connection.mtu = 23
+    DeviceConnection._connected[CONN_HANDLE] = connection
+    service = type('Service', (), {'connection': connection})()
+    characteristic = ClientCharacteristic(service, 0, VALUE_HANDLE, _FLAG_NOTIFY, 'uuid')
+    characteristic.capture(depth=depth, size=8)
+    characteristic._register_with_connection()
+    return characteristic
+
+
+def notify(data):
+    ClientCharacteristic._on_notify(CONN_HANDLE, VALUE_HANDLE, memoryview(data))
+
+
+async def notified(characteristic):
+    return bytes(await characteristic.notified(timeout_ms=50))
+
+
+@pytest.mark.parametrize('depth', [1, 2])
+def test_capture_overflow(depth):
+    async def run():
+        characteristic = make_characteristic(depth)
+        notify(b'first')
+        assert await notified(characteristic) == b'first'
+
+        # Выданный буфер занят до следующего notified(), но в очередь
+        # все равно помещается depth уведомлений
+        for i in range(depth):
+            notify(bytes([i]))
+        notify(b'lost')
+        assert characteristic.dropped == 1
+
+        for i in range(depth):
+            assert await notified(characteristic) == bytes([i])
+        # Потерянное уведомление не будит notified() - пул пуст, ждем таймаут
+        with pytest.raises(asyncio.TimeoutError):
+            await notified(characteristic)
+
+        notify(b'after')
+        assert await notified(characteristic) == b'after'
+        assert characteristic.dropped == 1
+
+    asyncio.run(run())
+    DeviceConnection._connected.clear()
+
+
+def test_capture_truncates():
+    async def run():
+        characteristic = make_characteristic(2)
+        notify(b'0123456789')
+        assert await notified(characteristic) == b'01234567'
+        assert characteristic.truncated == 1
+
+    asyncio.run(run())
+    DeviceConnection._connected.clear()
+
+
+def test_pool_keeps_handed_out_buffer():
+    pool = _CapturePool(1, 4)
+    assert pool.append(b'ab') == 2
+    view = pool.popleft()
+    assert pool.append(b'cd') == 2
+    assert pool.append(b'ef') == -1
+    assert bytes(view) == b'ab'
+    assert len(pool) == 1
+    assert bytes(pool.popleft()) == b'cd'
+    with pytest.raises(IndexError):
+        pool.popleft()
+
+
+
+def test_capture_reuses_buffers():
+    """Буферы пула идут по кругу: новые уведомления не портят выданный результат"""
+    sent = [bytes([i]) * (8 - i % 5) for i in range(12)]  # 4 круга по 3 буфера, длина разная
+
+    async def run():
+        characteristic = make_characteristic(2)
+        received = []
+        notify(sent[0])
+        notify(sent[1])
+        for i in range(len(sent)):
+            view = await characteristic.notified(timeout_ms=50)
+            held = bytes(view)
+            # Результат еще у вызывающего, а очередь снова заполняется до depth
+            if i + 2 < len(sent):
+                notify(sent[i + 2])
+            assert bytes(view) == held
+            received.append(held)
+        assert characteristic.dropped == 0
+        return received
+
+    assert asyncio.run(run()) == sent
+    DeviceConnection._connected.clear()
@@ -0,0 +1,99 @@
+"""_Deadlines: общий таймер таймаутов DeviceTimeout"""
+import asyncio
+import time
+
+from aioble.device import _Deadlines
+
+
+class Operation:
+    """Операция с таймаутом, как DeviceTimeout: задача ждет, таймер ее отменяет"""
+
+    def __init__(self, deadlines, deadline):
+        self.deadlines = deadlines
+        self._deadline = deadline
+        self._prev = None
+        self._next = None
+        self._expired = False
+        self._task = asyncio.create_task(self.run())
+        self.expired_ms = None
+
+    async def run(self):
+        self._task = asyncio.current_task()
+        self.deadlines.arm(self)
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            self.expired_ms = time.ticks_ms()
+        finally:
+            self.deadlines.disarm(self)
+
+
+def armed(deadlines):
+    operations = []
+    operation = deadlines._head
+    while operation:
+        operations.append(operation)
+        operation = operation._next
+    return operations
+
+
+def test_cancel_earliest():
+    async def run():
+        deadlines = _Deadlines()
+        now = time.ticks_ms()
+        late = Operation(deadlines, now + 80)
+        early = Operation(deadlines, now + 30)
+        await asyncio.sleep(0)
+        assert armed(deadlines) == [early, late]
+
+        # Первая операция завершилась раньше срока: таймер просыпается
+        # к ее сроку впустую и ждет следующий
+        deadlines.disarm(early)
+        assert armed(deadlines) == [late]
+        assert deadlines._tail is late
+        await asyncio.sleep(0.15)
+
+        assert not early._expired and early.expired_ms is None
+        assert late._expired and late.expired_ms - now >= 80
+        assert armed(deadlines) == [] and deadlines._tail is None
+        early._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_earlier_deadline_rearms_timer():
+    async def run():
+        deadlines = _Deadlines()
+        now = time.ticks_ms()
+        late = Operation(deadlines, now + 500)
+        await asyncio.sleep(0.01)  # таймер спит до now + 500
+        early = Operation(deadlines, now + 30)
+        await asyncio.sleep(0.1)
+
+        assert early._expired and early.expired_ms - now < 100
+        assert not late._expired
+        assert armed(deadlines) == [late]
+        late._task.cancel()
+
+    asyncio.run(run())
+
+
+def test_same_tick():
+    async def run():
+        deadlines = _Deadlines()
+        deadline = time.ticks_ms() + 30
+        first = Operation(deadlines, deadline)
+        second = Operation(deadlines, deadline)
+        await asyncio.sleep(0)
+        assert armed(deadlines) == [first, second]  # равные сроки - в порядке постановки
+
+        await asyncio.sleep(0.1)
+        assert first._expired and second._expired
+        assert armed(deadlines) == [] and deadlines._tail is None
+
+        # Таймер ждет новых операций
+        third = Operation(deadlines, time.ticks_ms() + 20)
+        await asyncio.sleep(0.08)
+        assert third._expired
+
+    asyncio.run(run())
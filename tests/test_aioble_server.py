@@ -0,0 +1,158 @@
+"""Characteristic: подписки клиентов, уведомления всем и очередь индикаций"""
+import asyncio
+
+import pytest
+
+from aioble import server
+from aioble.core import ble
+from aioble.device import Device, DeviceConnection
+
+VALUE_HANDLE = 10
+CCCD_HANDLE = VALUE_HANDLE + 1
+_IRQ_GATTS_WRITE = 3
+_IRQ_GATTS_INDICATE_DONE = 20
+
+
+def make_characteristic(notify=False):
+    service = server.Service('service')
+    characteristic = server.Characteristic(service, 'uuid', notify=notify, indicate=not notify)
+    characteristic._register(VALUE_HANDLE)
+    return characteristic
+
+
+def connect(conn_handle):
+    connection = DeviceConnection(Device(0, bytes([conn_handle]) * 6))
+    connection._conn_handle = conn_handle
+    DeviceConnection._connected[conn_handle] = connection
+    connection._run_task()
+    return connection
+
+
+def indicated(conn_handle):
+    return [call[3] for call in ble.calls if call[0] == 'indicate' and call[1] == conn_handle]
+
+
+def notified(conn_handle):
+    return [call[3] for call in ble.calls if call[0] == 'notify' and call[1] == conn_handle]
+
+
+def write_cccd(conn_handle, value):
+    if value is not None:
+        ble.values[CCCD_HANDLE] = value
+    server._server_irq(_IRQ_GATTS_WRITE, (conn_handle, CCCD_HANDLE))
+
+
+def confirm(conn_handle, status=0):
+    server._server_irq(_IRQ_GATTS_INDICATE_DONE, (conn_handle, VALUE_HANDLE, status))
+
+
+@pytest.fixture(autouse=True)
+def reset():
+    ble.calls.clear()
+    ble.values.clear()
+    ble.busy = False
+    yield
+    DeviceConnection._connected.clear()
+    server._registered_characteristics.clear()
+
+
+def test_queue_capacity():
+    """Одна индикация ждет подтверждения, еще _INDICATE_QUEUE_LEN - в очереди"""
+    async def run():
+        characteristic = make_characteristic()
+        connection = connect(1)
+        buffer = bytearray(1)
+        for i in range(1 + server._INDICATE_QUEUE_LEN):
+            buffer[0] = i
+            await asyncio.wait_for(characteristic.indicate(connection, buffer, wait=False), 0.1)
+        assert indicated(1) == [b'\x00']
+
+        # Очередь полна: следующая ждет места
+        blocked = asyncio.create_task(characteristic.indicate(connection, b'last', wait=False))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+
+        confirm(1)
+        await asyncio.wait_for(blocked, 0.1)
+        for _ in range(1 + server._INDICATE_QUEUE_LEN):
+            confirm(1)
+        await characteristic.indicated(connection)
+        assert indicated(1) == [bytes([i]) for i in range(1 + server._INDICATE_QUEUE_LEN)] + [b'last']
+
+    asyncio.run(run())
+
+
+def test_connections_in_parallel():
+    async def run():
+        characteristic = make_characteristic()
+        first, second = connect(1), connect(2)
+        tasks = [asyncio.create_task(characteristic.indicate(c, b'x')) for c in (first, second)]
+        await asyncio.sleep(0.01)
+        # Обе ушли сразу, не дожидаясь подтверждения друг друга
+        assert indicated(1) == [b'x'] and indicated(2) == [b'x']
+        confirm(2)
+        confirm(1, status=5)
+        await tasks[1]
+        with pytest.raises(server.GattError):
+            await tasks[0]
+
+    asyncio.run(run())
+
+
+def test_deferred_error():
+    async def run():
+        characteristic = make_characteristic()
+        connection = connect(1)
+        await characteristic.indicate(connection, b'a', wait=False)
+        confirm(1, status=5)
+        with pytest.raises(server.GattError):
+            await characteristic.indicated(connection)
+        await characteristic.indicated(connection)
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize('value', [None, b''])
+def test_cccd_without_value(value):
+    """Пустое или незаданное значение CCCD - клиент не подписан"""
+    async def run():
+        characteristic = make_characteristic(notify=True)
+        connection = connect(1)
+        write_cccd(1, b'\x01\x00')
+        assert characteristic.is_subscribed(connection)
+        if value is None:
+            del ble.values[CCCD_HANDLE]
+        write_cccd(1, value)
+        assert not characteristic.is_subscribed(connection)
+
+    asyncio.run(run())
+
+
+def test_notify_all():
+    async def run():
+        characteristic = make_characteristic(notify=True)
+        first, second = connect(1), connect(2)
+        connect(3)
+        characteristic.subscribe(first)
+        write_cccd(2, b'\x01\x00')
+        write_cccd(3, b'\x02\x00')  # Только индикации
+        assert characteristic.notify_all(b'a') == 2
+        assert notified(1) == [b'a'] and notified(2) == [b'a'] and notified(3) == []
+
+        # Отключенный клиент выпадает из подписчиков
+        first._event.set()  # Как _IRQ_CENTRAL_DISCONNECT
+        await asyncio.sleep(0)
+        assert not first.is_connected()
+        assert characteristic.notify_all(b'b') == 1
+        assert notified(2) == [b'a', b'b']
+        assert first not in characteristic._subscribers
+
+        # Буферы контроллера заняты - не отправлено никому
+        ble.busy = True
+        assert characteristic.notify_all(b'c') == 0
+        ble.busy = False
+        characteristic.subscribe(second, notify=False)
+        assert characteristic.notify_all(b'd') == 0
+        assert notified(2) == [b'a', b'b']
+
+    asyncio.run(run())
@@ -0,0 +1,97 @@
+"""Имитация датчика: воспроизведение записей, догон и перезагрузка платы"""
+import json
+import os
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('bleak')
+
+from conftest import ROOT
+from simulator import ReplaySignal
+
+DATABASE = os.path.join(ROOT, 'workout_database.json')
+
+
+def test_replay_repo_database():
+    """База из репозитория - старый формат sensor_data: {timestamp, tension}"""
+    signal = ReplaySignal.load(DATABASE)
+    with open(DATABASE, encoding='utf-8') as f:
+        workout = json.load(f)['workouts'][-1]
+    tension = [data['tension'] for data in workout['sensor_data']]
+    assert signal.values.tolist() == tension
+    assert signal.rate == pytest.approx(1.0)
+    # Секунда записи растягивается на секунду оцифровки
+    assert signal.samples(0, 3, 2).tolist() == [tension[0], tension[0], tension[1]]
+
+
+def test_replay_channels(tmp_path):
+    database = tmp_path / 'db.json'
+    database.write_text(json.dumps({'workouts': [
+        {'channels': [{'tension': [100, 200, 300], 'timestamps': [0.0, 0.01, 0.02]}]},
+    ]}))
+    signal = ReplaySignal.load(database)
+    assert signal.rate == pytest.approx(100.0)
+    assert signal.values.tolist() == [100, 200, 300]
+
+
+def test_replay_without_samples(tmp_path):
+    database = tmp_path / 'db.json'
+    database.write_text(json.dumps({'workouts': [{'sensor_data': []}]}))
+    with pytest.raises(ValueError):
+        ReplaySignal.load(database)
+
+
+def test_backlog_covers_dropout():
+    """Обрыв на 5-10 с при 1 кГц догоняется CMD_RESUME без потерь, как в Esp32.ino"""
+    import simulator
+    from sensor import CMD_START, CMD_RESUME, CONTROL_RESUME, RESUME_LIVE
+
+    # Копия _RAW_BACKLOG из esp32/main.py - меняются вместе
+    assert simulator.RAW_BACKLOG >= 10000
+
+    sensor = simulator.SimulatedSensor(rate=1000)
+    sensor.handle_control(bytes([CMD_START]))
+    sensor.generate(sensor.clock_started + 9.5)  # связи нет 9.5 с
+    sensor.handle_control(CONTROL_RESUME.pack(CMD_RESUME, 0, RESUME_LIVE))
+    assert sensor.raw.head == 9500
+    assert sensor.raw.send == 0
+
+
+def deliver(sensor, channel, now):
+    """Все кадры, которые имитация передала бы к моменту now, - в канал"""
+    sensor.generate(now)
+    while (frame := sensor.raw.frame(sensor.capacity, now + 1.0)) is not None:
+        channel._process_sensor_data(frame)
+        now += 1.0  # Неполный кадр уходит по FRAME_TIMEOUT
+
+
+def test_resume_after_reboot():
+    """После перезагрузки платы seq начинается с нуля - отсчеты не считаются повтором"""
+    import simulator
+    from sensor import BLESensorManager, CMD_START, CMD_RESUME, CONTROL_RESUME, RESUME_LIVE
+
+    manager = BLESensorManager(['SIM:00'])
+    manager.is_reading = True
+    channel = manager.channels[0]
+    channel.has_control = True
+
+    sensor = simulator.SimulatedSensor(rate=1000)
+    sensor.handle_control(bytes([CMD_START]))
+    deliver(sensor, channel, sensor.clock_started + 2.0)
+    assert channel.raw.expected_seq == 2000
+
+    # Перезагрузка между подключениями: пустой буфер, micros() с нуля
+    sensor.raw = simulator.SimulatedStream(simulator.RAW_BACKLOG, 0)
+    sensor.device_us = 0
+    sensor.acquiring = False
+    channel.raw.awaiting_resume = True
+    sensor.handle_control(CONTROL_RESUME.pack(CMD_RESUME, channel.raw.resume_seq, RESUME_LIVE))
+    sensor.handle_control(bytes([CMD_START]))
+    deliver(sensor, channel, sensor.clock_started + 0.5)
+
+    values, _ = channel.samples.drain()
+    assert len(values) == 2500
+    assert channel.raw.expected_seq == 500
+    assert channel.raw.restarts == 1
+    assert channel.lost_samples == 0